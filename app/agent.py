@@ -1,15 +1,38 @@
+import contextvars
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain.agents.agent import RunnableMultiActionAgent
+from langchain_core.agents import AgentAction, AgentStep
+from langchain_core.callbacks import CallbackManager
+from pydantic import PrivateAttr
 from dotenv import load_dotenv
 
-from app.skills.registry import load_skills
-from app.prompts import get_agent_prompt
+from app.skills.registry import load_skills, get_last_changes
+from app.skills.tool_index import get_retrieval_config, tool_index
+from app.skills.tool_cache import tool_result_cache
+from app.context import get_session_id
+from app.prompts import get_agent_prompt, get_sub_agent_prompt
+from app.profiling import profiler
+
+logger = logging.getLogger(__name__)
 
 # 加载环境变量
-load_dotenv()
+with profiler.phase("load_dotenv"):
+    load_dotenv()
+
+def _stream_usage_enabled() -> bool:
+    # 流式输出时请求提供方在末尾返回 usage（含缓存命中的 prompt token）；不支持 stream_options 的服务可设为 0
+    return (os.getenv("LLM_STREAM_USAGE") or "1").strip().lower() not in {"0", "false", "no", "off"}
 
-def create_llm():
+def _resolve_llm_config() -> Dict[str, Any]:
+    """
+    根据 LLM_PROVIDER 与各提供方的环境变量解析模型配置；配置相同的调用共享同一个客户端实例。
+    """
     provider = (os.getenv("LLM_PROVIDER") or "deepseek").strip().lower()
 
     if provider == "deepseek":
@@ -18,12 +41,7 @@ def create_llm():
         model_name = os.getenv("DEEPSEEK_MODEL_NAME") or "deepseek-chat"
         if not api_key:
             raise ValueError("请确保 .env 文件中配置了 DEEPSEEK_API_KEY")
-        return ChatOpenAI(
-            model=model_name,
-            openai_api_key=api_key,
-            openai_api_base=base_url,
-            temperature=0.7,
-        )
+        return {"provider": provider, "kind": "openai", "model": model_name, "api_key": api_key, "base_url": base_url, "temperature": 0.7, "stream_usage": _stream_usage_enabled()}
 
     if provider == "qwen":
         api_key = os.getenv("QWEN_API_KEY") or os.getenv("DASHSCOPE_API_KEY")
@@ -31,12 +49,7 @@ def create_llm():
         model_name = os.getenv("QWEN_MODEL_NAME") or "qwen-plus"
         if not api_key:
             raise ValueError("请确保 .env 文件中配置了 QWEN_API_KEY (或 DASHSCOPE_API_KEY)")
-        return ChatOpenAI(
-            model=model_name,
-            openai_api_key=api_key,
-            openai_api_base=base_url,
-            temperature=0.7,
-        )
+        return {"provider": provider, "kind": "openai", "model": model_name, "api_key": api_key, "base_url": base_url, "temperature": 0.7, "stream_usage": _stream_usage_enabled()}
 
     if provider == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
@@ -44,34 +57,22 @@ def create_llm():
         model_name = os.getenv("OPENAI_MODEL_NAME") or os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
         if not api_key:
             raise ValueError("请确保 .env 文件中配置了 OPENAI_API_KEY")
-        return ChatOpenAI(
-            model=model_name,
-            openai_api_key=api_key,
-            openai_api_base=base_url,
-            temperature=0.7,
-        )
+        return {"provider": provider, "kind": "openai", "model": model_name, "api_key": api_key, "base_url": base_url, "temperature": 0.7, "stream_usage": _stream_usage_enabled()}
 
     if provider == "local":
         model_path = os.getenv("LOCAL_MODEL_PATH")
         if not model_path:
             raise ValueError("请确保 .env 文件中配置了 LOCAL_MODEL_PATH")
-        try:
-            from langchain_community.chat_models import ChatLlamaCpp
-        except Exception as e:
-            raise ValueError("请安装 llama-cpp-python 以启用本地模型") from e
-        n_ctx = int(os.getenv("LOCAL_CTX_SIZE") or 4096)
-        n_gpu_layers = int(os.getenv("LOCAL_GPU_LAYERS") or 0)
-        n_threads = int(os.getenv("LOCAL_THREADS") or 8)
-        n_batch = int(os.getenv("LOCAL_BATCH_SIZE") or 512)
-        temperature = float(os.getenv("LOCAL_TEMPERATURE") or 0.7)
-        return ChatLlamaCpp(
-            model_path=model_path,
-            n_ctx=n_ctx,
-            n_gpu_layers=n_gpu_layers,
-            n_threads=n_threads,
-            n_batch=n_batch,
-            temperature=temperature,
-        )
+        return {
+            "provider": provider,
+            "kind": "llama",
+            "model_path": model_path,
+            "n_ctx": int(os.getenv("LOCAL_CTX_SIZE") or 4096),
+            "n_gpu_layers": int(os.getenv("LOCAL_GPU_LAYERS") or 0),
+            "n_threads": int(os.getenv("LOCAL_THREADS") or 8),
+            "n_batch": int(os.getenv("LOCAL_BATCH_SIZE") or 512),
+            "temperature": float(os.getenv("LOCAL_TEMPERATURE") or 0.7),
+        }
 
     if provider in {"nim_minimax_m2", "nim_glm47"}:
         api_key = os.getenv("NIM_API_KEY") or os.getenv("NVIDIA_NIM_API_KEY") or os.getenv("NVIDIA_API_KEY")
@@ -82,38 +83,382 @@ def create_llm():
             model_name = os.getenv("NIM_GLM47_MODEL_NAME") or "z-ai/glm4.7"
         if not api_key:
             raise ValueError("请确保 .env 文件中配置了 NIM_API_KEY（NVIDIA API Catalog Key；自建 NIM 可填 no-key-required）")
+        return {"provider": provider, "kind": "openai", "model": model_name, "api_key": api_key, "base_url": base_url, "temperature": 0.7, "stream_usage": _stream_usage_enabled()}
+
+    raise ValueError(f"不支持的 LLM_PROVIDER: {provider}")
+
+# LLM 客户端缓存：配置 -> 实例。OpenAI 兼容客户端共享一个 httpx 连接池，本地 GGUF 模型常驻内存
+_LLM_CACHE: Dict[tuple, Any] = {}
+_LLM_CACHE_LOCK = threading.Lock()
+_HTTP_CLIENT = None
+# llama.cpp 同一模型实例不支持并发推理，多个会话共享常驻模型时串行调用
+_LLAMA_LOCK = threading.RLock()
+
+def _get_http_client():
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        import httpx
+        max_connections = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS") or 20)
+        _HTTP_CLIENT = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+    return _HTTP_CLIENT
+
+def _build_llm(config: Dict[str, Any]):
+    if config["kind"] == "openai":
         return ChatOpenAI(
-            model=model_name,
-            openai_api_key=api_key,
-            openai_api_base=base_url,
-            temperature=0.7,
+            model=config["model"],
+            openai_api_key=config["api_key"],
+            openai_api_base=config["base_url"],
+            temperature=config["temperature"],
+            stream_usage=config["stream_usage"],
+            http_client=_get_http_client(),
         )
+    try:
+        from langchain_community.chat_models import ChatLlamaCpp
+    except Exception as e:
+        raise ValueError("请安装 llama-cpp-python 以启用本地模型") from e
 
-    raise ValueError(f"不支持的 LLM_PROVIDER: {provider}")
+    class ResidentChatLlamaCpp(ChatLlamaCpp):
+        def _generate(self, *args, **kwargs):
+            with _LLAMA_LOCK:
+                return super()._generate(*args, **kwargs)
+
+        def _stream(self, *args, **kwargs):
+            with _LLAMA_LOCK:
+                yield from super()._stream(*args, **kwargs)
+
+    params = {k: v for k, v in config.items() if k not in {"provider", "kind"}}
+    return ResidentChatLlamaCpp(**params)
+
+def create_llm(cached: bool = True):
+    """
+    按当前环境配置返回 LLM。cached=True 时相同配置复用已创建的实例（模型切换、技能重载、摘要模型共用），
+    本地模型只保留最近使用的一个常驻内存（LLM_MAX_RESIDENT_LOCAL，默认 1）。
+    """
+    config = _resolve_llm_config()
+    if not cached:
+        return _build_llm(config)
+    key = tuple(sorted(config.items()))
+    with _LLM_CACHE_LOCK:
+        llm = _LLM_CACHE.get(key)
+        if llm is not None:
+            return llm
+        if config["kind"] == "llama":
+            max_resident = int(os.getenv("LLM_MAX_RESIDENT_LOCAL") or 1)
+            resident = [k for k in _LLM_CACHE if dict(k).get("kind") == "llama"]
+            # 超出常驻上限时移出最早加载的本地模型，引用全部释放后权重随之回收
+            for old_key in resident[:max(0, len(resident) - max_resident + 1)]:
+                del _LLM_CACHE[old_key]
+        llm = _build_llm(config)
+        _LLM_CACHE[key] = llm
+        return llm
+
+def evict_llm_cache(provider: Optional[str] = None) -> int:
+    """
+    从缓存中移出 LLM 客户端（provider 为 None 时全部移出）。
+    仍被 executor 持有的实例照常可用，引用全部释放后（例如会话重建 executor）才会回收；
+    下次 create_llm 会重新创建。共享的 HTTP 连接池不随之关闭或替换，新旧实例继续复用同一个连接池。
+
+    Returns:
+        int: 移出的实例数
+    """
+    with _LLM_CACHE_LOCK:
+        keys = [k for k in _LLM_CACHE if provider is None or dict(k).get("provider") == provider]
+        for key in keys:
+            del _LLM_CACHE[key]
+    return len(keys)
+
+def llm_cache_stats() -> Dict[str, Any]:
+    with _LLM_CACHE_LOCK:
+        entries = [{
+            "provider": dict(key).get("provider"),
+            "model": dict(key).get("model") or os.path.basename(dict(key).get("model_path") or ""),
+        } for key in _LLM_CACHE]
+    return {"entries": entries, "http_pool": _HTTP_CLIENT is not None}
+
+# 独占资源锁：同一物理资源（桌面键鼠/屏幕、共享浏览器）上的工具调用在所有会话间串行执行
+_RESOURCE_LOCKS: Dict[str, threading.RLock] = {}
+_RESOURCE_LOCKS_GUARD = threading.Lock()
+
+def get_resource_lock(resource: str) -> threading.RLock:
+    with _RESOURCE_LOCKS_GUARD:
+        lock = _RESOURCE_LOCKS.get(resource)
+        if lock is None:
+            lock = _RESOURCE_LOCKS[resource] = threading.RLock()
+        return lock
+
+# 无副作用工具的资源标记：不加锁，同一步中的多个调用可并发执行
+READONLY_RESOURCE = "readonly"
+
+def _tool_metadata_resource(tool) -> Optional[str]:
+    metadata = getattr(tool, "metadata", None)
+    if isinstance(metadata, dict):
+        return metadata.get("resource") or None
+    return None
+
+def tool_resource(tool) -> Optional[str]:
+    """
+    工具声明的独占资源（来自 skill.md 的 ## Resource 或 tool.metadata["resource"]）；只读与未声明的工具返回 None。
+    """
+    resource = _tool_metadata_resource(tool)
+    return resource if resource != READONLY_RESOURCE else None
+
+def is_readonly_tool(tool) -> bool:
+    return _tool_metadata_resource(tool) == READONLY_RESOURCE
+
+def _notify_cached_call(callback_manager, tool, args, observation):
+    """
+    缓存命中时工具没有真正执行：补发一对 tool start/end 回调，流式输出与调用轨迹仍能看到这次调用。
+    """
+    if callback_manager is None:
+        return
+    run = callback_manager.on_tool_start(
+        {"name": tool.name, "description": tool.description},
+        args if isinstance(args, str) else str(args),
+        inputs=args if isinstance(args, dict) else None,
+        name=tool.name,
+    )
+    run.on_tool_end(observation, cached=True)
+
+def _call_with_cache(tool, args, call, callback_manager=None):
+    """
+    按工具声明的缓存策略执行 call()：纯工具先查结果缓存，写入工具执行后清除相关缓存；其余工具直接执行。
+    Returns: (结果, 是否命中缓存)
+    """
+    key = tool_result_cache.key_for(tool, args) if tool is not None else None
+    if key is not None:
+        hit, cached = tool_result_cache.get(key)
+        if hit:
+            _notify_cached_call(callback_manager, tool, args, cached)
+            return cached, True
+    try:
+        result = call()
+    finally:
+        if tool is not None:
+            tool_result_cache.after_call(tool, args)
+    if key is not None:
+        tool_result_cache.put(key, result)
+    return result, False
+
+def invoke_tool(tool, args: Dict[str, Any], callbacks: Optional[List[Any]] = None):
+    """
+    在 AgentExecutor 之外直接调用工具（如模板回放），同样持有工具声明的资源锁并使用结果缓存。
+    """
+    config = {"callbacks": callbacks} if callbacks else None
+
+    def call():
+        resource = tool_resource(tool)
+        if not resource:
+            return tool.invoke(args, config=config)
+        with get_resource_lock(resource):
+            return tool.invoke(args, config=config)
+
+    manager = CallbackManager.configure(inheritable_callbacks=callbacks) if callbacks else None
+    return _call_with_cache(tool, args, call, manager)[0]
+
+# 同一步内并发执行只读工具调用的线程池（所有会话共享）；TOOL_PARALLELISM<=1 时按顺序执行
+_TOOL_POOL: Optional[ThreadPoolExecutor] = None
+_TOOL_POOL_GUARD = threading.Lock()
+
+def _tool_parallelism() -> int:
+    return int(os.getenv("TOOL_PARALLELISM") or 4)
+
+def _get_tool_pool() -> ThreadPoolExecutor:
+    global _TOOL_POOL
+    with _TOOL_POOL_GUARD:
+        if _TOOL_POOL is None:
+            _TOOL_POOL = ThreadPoolExecutor(max_workers=_tool_parallelism(), thread_name_prefix="agent-tool")
+        return _TOOL_POOL
+
+# 规划阶段的占位结果：_iter_next_step 先收集本步全部工具调用，再统一调度执行
+_PENDING = object()
+_planning = threading.local()
+
+class SkillAgentExecutor(AgentExecutor):
+    """
+    持有 LLM 引用的 AgentExecutor，技能重载时可原地替换工具列表而无需重建。
+    声明了独占资源的工具在执行时持有对应的资源锁，其余工具在多个会话间并行执行。
+
+    模型在一步中返回多个工具调用时，只读工具（## Resource 为 readonly）在线程池上并发执行，
+    其余工具在当前线程按原顺序依次执行，结果按调用顺序返回给模型。
+
+    工具较多时每轮只向模型绑定核心工具与检索出的 top-k 相关工具（见 bind_tools_for）；
+    执行仍使用完整的 self.tools。
+    """
+    llm: Any = None
+    # 由工具列表生成提示词的函数，默认 get_agent_prompt；计划调度器的子 Agent 使用 get_sub_agent_prompt
+    prompt_factory: Any = None
+
+    _query: Optional[str] = PrivateAttr(default=None)
+    _picked: List[str] = PrivateAttr(default_factory=list)
+    _bound_key: Optional[tuple] = PrivateAttr(default=None)
+    _agent_cache: Dict[tuple, Any] = PrivateAttr(default_factory=dict)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        if self._query is not None:
+            # search_tools 在上一步固定的工具从这一步起可直接调用
+            self._rebind()
+        if _tool_parallelism() <= 1:
+            yield from super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager)
+            return
+        # 父类在规划后逐个调用 _perform_agent_action；规划期间让它只返回占位结果，收齐本步的调用后统一执行
+        _planning.active = True
+        try:
+            items = list(super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager))
+        finally:
+            _planning.active = False
+        actions = [item.action for item in items if isinstance(item, AgentStep) and item.observation is _PENDING]
+        for item in items:
+            if not (isinstance(item, AgentStep) and item.observation is _PENDING):
+                yield item
+        if actions:
+            yield from self._run_actions(name_to_tool_map, color_mapping, actions, run_manager)
+
+    def _run_actions(self, name_to_tool_map, color_mapping, actions: List[AgentAction], run_manager=None) -> List[AgentStep]:
+        def perform(action):
+            return self._perform_agent_action(name_to_tool_map, color_mapping, action, run_manager)
+
+        if sum(1 for action in actions if is_readonly_tool(name_to_tool_map.get(action.tool))) < 2:
+            return [perform(action) for action in actions]
+        pool = _get_tool_pool()
+        steps: List[AgentStep] = []
+        batch: List[Any] = []
+
+        def drain():
+            # 等本批只读调用全部结束，保证其后的写入不会与之交错
+            try:
+                wait(batch)
+                steps.extend(future.result() for future in batch)
+            finally:
+                batch.clear()
+
+        try:
+            for action in actions:
+                if is_readonly_tool(name_to_tool_map.get(action.tool)):
+                    # 复制上下文，工具线程中仍能取到当前会话 ID
+                    batch.append(pool.submit(contextvars.copy_context().run, perform, action))
+                    continue
+                # 非只读调用是屏障：先收齐之前的只读调用，再按模型给出的顺序执行
+                drain()
+                steps.append(perform(action))
+            drain()
+        finally:
+            wait(batch)
+        return steps
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        if getattr(_planning, "active", False):
+            return AgentStep(action=agent_action, observation=_PENDING)
+        tool = name_to_tool_map.get(agent_action.tool)
+
+        def call():
+            resource = tool_resource(tool)
+            if not resource:
+                return super(SkillAgentExecutor, self)._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+            with get_resource_lock(resource):
+                return super(SkillAgentExecutor, self)._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+        # 声明了 ## Cache 的纯工具命中缓存时不再执行
+        observation, _ = _call_with_cache(
+            tool, agent_action.tool_input, lambda: call().observation, run_manager.get_child() if run_manager else None
+        )
+        return AgentStep(action=agent_action, observation=observation)
+
+    def _build_agent(self, tools):
+        prompt = (self.prompt_factory or get_agent_prompt)(tools)
+        agent = create_tool_calling_agent(self.llm, tools, prompt)
+        return RunnableMultiActionAgent(runnable=agent, stream_runnable=True)
+
+    def patch_tools(self, tools):
+        self.tools = tools
+        self._agent_cache.clear()
+        self._bound_key = None
+        if self._query is not None:
+            self._select(self._query)
+            self._rebind()
+        else:
+            self.agent = self._build_agent(tools)
+
+    # --- 工具检索 ---
+
+    def _select(self, query: str):
+        top_k, core = get_retrieval_config()
+        names = [t.name for t in self.tools]
+        core_names = [name for name in names if name in core]
+        if top_k <= 0 or len(names) <= len(core_names) + top_k:
+            self._picked = []
+            return
+        available = set(names)
+        self._picked = [name for name in tool_index.search(query, top_k, exclude=core_names) if name in available]
+
+    def _rebind(self):
+        top_k, core = get_retrieval_config()
+        if not self._picked:
+            # 检索关闭、工具数量不多或检索无结果时绑定全部工具
+            selected = list(self.tools)
+        else:
+            wanted = set(self._picked) | tool_index.pinned(get_session_id())
+            # 核心工具在前、检索结果在后，各自按名称排序，相邻两轮的工具 Schema 与提示词前缀尽量一致
+            selected = [t for t in self.tools if t.name in core] + sorted(
+                (t for t in self.tools if t.name in wanted and t.name not in core), key=lambda t: t.name
+            )
+        key = tuple(t.name for t in selected)
+        if key == self._bound_key:
+            return
+        agent = self._agent_cache.get(key)
+        if agent is None:
+            agent = self._build_agent(selected)
+            if len(self._agent_cache) >= 8:
+                self._agent_cache.pop(next(iter(self._agent_cache)))
+            self._agent_cache[key] = agent
+        self.agent = agent
+        self._bound_key = key
+
+    def bind_tools_for(self, query: str, clear_pins: bool = True):
+        """
+        按本轮输入检索 TOOL_RETRIEVAL_TOP_K 个相关工具，与核心工具一起绑定到模型；
+        相同的工具组合复用已构建的 runnable。子 Agent 与主 Agent 共用会话，传 clear_pins=False 保留主 Agent 固定的工具。
+        """
+        if clear_pins:
+            tool_index.clear_pins(get_session_id())
+        self._query = query
+        self._select(query)
+        self._rebind()
+
+    @property
+    def bound_tool_names(self) -> List[str]:
+        return list(self._bound_key) if self._bound_key else [t.name for t in self.tools]
 
 def create_agent_executor():
     """
     创建并配置 Agent Executor
     """
-    llm = create_llm()
+    with profiler.phase("create_llm"):
+        llm = create_llm()
 
     # 2. 动态加载工具列表 (Skills)
     # 自动扫描 app.skills 包下的多 Skill 子包
-    tools = load_skills(package_name="app.skills")
-    print(f"已加载 {len(tools)} 个 Skills")
+    with profiler.phase("load_skills"):
+        tools = load_skills(package_name="app.skills")
+    logger.info(f"已加载 {len(tools)} 个 Skills")
 
     # 3. 获取提示词模板 (动态注入 Tools 信息)
-    prompt = get_agent_prompt(tools)
+    with profiler.phase("get_agent_prompt"):
+        prompt = get_agent_prompt(tools)
 
     # 4. 创建 Agent
     # create_tool_calling_agent 适用于支持 Function Calling 的模型 (如 GPT-3.5/4, 豆包等)
-    agent = create_tool_calling_agent(llm, tools, prompt)
+    with profiler.phase("create_tool_calling_agent"):
+        agent = create_tool_calling_agent(llm, tools, prompt)
 
     # 5. 创建 Executor
     # AgentExecutor 负责运行 Agent，处理循环、错误捕获等
-    executor = AgentExecutor(
+    executor = SkillAgentExecutor(
         agent=agent, 
         tools=tools, 
+        llm=llm,
         verbose=True,
         handle_parsing_errors=True,
         max_iterations=1000,
@@ -121,3 +466,52 @@ def create_agent_executor():
     )
 
     return executor
+
+# 子 Agent 不可用的工具：计划由调度器维护，技能生成与热加载只由主 Agent 发起
+SUB_AGENT_EXCLUDED_TOOLS = {
+    "create_task_plan",
+    "read_task_plan",
+    "mark_task_completed",
+    "append_task_step",
+    "run_plan_steps",
+    "scaffold_skill",
+    "write_tool_code",
+    "reload_skills",
+}
+
+def create_sub_agent_executor(tools=None):
+    """
+    创建执行单个计划步骤的子 Agent：复用缓存的 LLM 与当前工具列表（默认取工具索引中的最新列表），
+    使用精简的子任务提示词，不输出到控制台。
+    """
+    tools = [t for t in (tools if tools is not None else tool_index.tools) if t.name not in SUB_AGENT_EXCLUDED_TOOLS]
+    tools.sort(key=lambda t: t.name)
+    llm = create_llm()
+    return SkillAgentExecutor(
+        agent=RunnableMultiActionAgent(
+            runnable=create_tool_calling_agent(llm, tools, get_sub_agent_prompt(tools)), stream_runnable=True
+        ),
+        tools=tools,
+        llm=llm,
+        prompt_factory=get_sub_agent_prompt,
+        verbose=False,
+        handle_parsing_errors=True,
+        max_iterations=int(os.getenv("SUB_AGENT_MAX_ITERATIONS") or 30),
+        max_execution_time=float(os.getenv("SUB_AGENT_MAX_SECONDS") or 300),
+    )
+
+def refresh_agent_executor(executor: SkillAgentExecutor):
+    """
+    增量重载技能：仅重新导入变化的模块，并原地更新 executor 的工具列表。
+
+    Returns:
+        Dict: 本次新增/变化/移除的模块
+    """
+    tools = load_skills(package_name="app.skills")
+    changes = get_last_changes()
+    if any(changes.values()):
+        executor.patch_tools(tools)
+        # 工具实现变化后旧结果不再可信
+        tool_result_cache.clear()
+    logger.info(f"已加载 {len(tools)} 个 Skills（新增 {len(changes['added'])}，变化 {len(changes['changed'])}，移除 {len(changes['removed'])}）")
+    return changes
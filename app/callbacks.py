@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.events import EventBus, event_bus
+from app.traces import TraceLog, trace_log
+
+MAX_PREVIEW_CHARS = 2000
+
+def _preview(value: Any) -> str:
+    text = value if isinstance(value, str) else str(getattr(value, "content", value))
+    if len(text) > MAX_PREVIEW_CHARS:
+        return text[:MAX_PREVIEW_CHARS] + f"...（共 {len(text)} 字符）"
+    return text
+
+class EventBusCallbackHandler(BaseCallbackHandler):
+    """
+    把 Agent 执行过程发布为事件：TOKEN（start / delta / end / error）与 TOOL（start / end / error）。
+    token 增量的合并与批量推送由 EventBus 负责，这里每个回调只做一次入队。
+    """
+    raise_error = False
+
+    def __init__(self, bus: Optional[EventBus] = None):
+        self.bus = bus or event_bus
+        self._lock = threading.Lock()
+        self._tool_names: Dict[UUID, str] = {}
+
+    # --- LLM ---
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> Any:
+        self.bus.token(str(run_id), "start")
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> Any:
+        self.bus.token(str(run_id), "start")
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        if token:
+            self.bus.token(str(run_id), "delta", token)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> Any:
+        self.bus.token(str(run_id), "end")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self.bus.token(str(run_id), "error", error=str(error))
+
+    # --- 工具 ---
+
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID, inputs: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            self._tool_names[run_id] = name
+        tool_input = inputs if inputs is not None else input_str
+        if not isinstance(tool_input, str):
+            tool_input = json.dumps(tool_input, ensure_ascii=False, default=str)
+        self.bus.tool(str(run_id), "start", name, input=_preview(tool_input))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            name = self._tool_names.pop(run_id, "tool")
+        self.bus.tool(str(run_id), "end", name, output=_preview(output))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            name = self._tool_names.pop(run_id, "tool")
+        self.bus.tool(str(run_id), "error", name, error=str(error))
+
+def _extract_prompt_usage(response) -> Optional[Dict[str, int]]:
+    """
+    从一次 LLM 调用的结果中取出 prompt token 数与其中命中提供方缓存的部分。
+
+    优先读取 usage_metadata.input_token_details.cache_read（OpenAI 的 prompt_tokens_details.cached_tokens），
+    其次读取 DeepSeek 的 prompt_cache_hit_tokens；提供方未返回 usage 时返回 None。
+    """
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if not usage:
+                continue
+            cached = (usage.get("input_token_details") or {}).get("cache_read")
+            if cached is None:
+                raw = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+                cached = raw.get("prompt_cache_hit_tokens")
+            return {"prompt": int(usage.get("input_tokens") or 0), "cached": int(cached or 0), "completion": int(usage.get("output_tokens") or 0)}
+    token_usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if token_usage:
+        cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is None:
+            cached = token_usage.get("prompt_cache_hit_tokens")
+        return {"prompt": int(token_usage.get("prompt_tokens") or 0), "cached": int(cached or 0), "completion": int(token_usage.get("completion_tokens") or 0)}
+    return None
+
+class TokenUsage:
+    """
+    线程安全的 token 用量累计：prompt（其中 cached 命中提供方前缀缓存）与 completion。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage: Dict[str, int]):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage["prompt"]
+            self.cached_tokens += usage["cached"]
+            self.completion_tokens += usage["completion"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "uncached_tokens": self.prompt_tokens - self.cached_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cache_hit_rate": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            }
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """
+    统计一轮对话中各次 LLM 调用的 token 用量，同时累加到进程级的 token_usage_totals。
+    """
+    raise_error = False
+
+    def __init__(self):
+        self.usage = TokenUsage()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> Any:
+        usage = _extract_prompt_usage(response)
+        if usage is None:
+            return
+        self.usage.add(usage)
+        token_usage_totals.add(usage)
+
+class ToolTraceCallbackHandler(BaseCallbackHandler):
+    """
+    把一轮任务中的每次工具调用（参数、结果摘要、耗时与成败）写入追加式轨迹日志，
+    finish() 写入任务结束记录；子 Agent 等嵌套执行中的工具调用同样会被记录。
+    """
+    raise_error = False
+
+    def __init__(self, task_id: str, session_id: str, log: Optional[TraceLog] = None):
+        self.task_id = task_id
+        self.session_id = session_id
+        self.log = log or trace_log
+        self.started = time.time()
+        self.llm_calls = 0
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._calls: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID, inputs: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            self._seq += 1
+            self._calls[run_id] = (self._seq, name, inputs if inputs is not None else input_str, time.perf_counter())
+
+    def _finish_call(self, run_id: UUID, output: Any = None, error: Optional[str] = None):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        seq, name, args, started = call
+        try:
+            self.log.record_call(self.task_id, self.session_id, seq, name, args, output,
+                                 (time.perf_counter() - started) * 1000, error)
+        except Exception:
+            # 轨迹写入失败不影响任务执行
+            pass
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._finish_call(run_id, output=output)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._finish_call(run_id, error=f"{type(error).__name__}: {error}")
+
+    def finish(self, user_input: str, state: Optional[str]):
+        try:
+            self.log.record_task(self.task_id, self.session_id, user_input, state,
+                                 time.time() - self.started, self.llm_calls)
+        except Exception:
+            pass
+
+# Global instance
+token_usage_totals = TokenUsage()
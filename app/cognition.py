@@ -0,0 +1,248 @@
+import contextvars
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.events import say
+from app.history import format_transcript
+
+COGNITION_SYSTEM_PROMPT = "你是个人认知总结器。基于对话内容抽取稳定偏好与可复用经验，输出严格 JSON。字段: summary_type, project, user_id, items{behavior_preferences, code_style_preferences, task_experiences}, task_templates, sources, proposed_tags。若对话包含明确完成的可复用流程，必须在 task_experiences 提供 1-3 条，描述流程与关键决策，不包含一次性数据。若可抽象为模板，task_templates 输出 1-2 个对象，字段: name, trigger_keywords, steps, inputs, outputs, constraints, tags。没有内容的数组输出空数组。只输出 JSON，不要额外文本。"
+SUMMARY_WINDOW_MESSAGES = 40
+
+def _get_pending_path():
+    # Path: app/data/cognition_pending.json
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cognition_pending.json")
+
+def normalize_tags(tags):
+    if not tags:
+        return []
+    cleaned = []
+    for tag in tags:
+        if not tag:
+            continue
+        item = str(tag).strip()
+        if item:
+            cleaned.append(item)
+    return list(dict.fromkeys(cleaned))
+
+def build_cognition_summary(messages, llm, project_id, user_id, clean: Optional[Callable[[str], str]] = None):
+    transcript = format_transcript(messages[-SUMMARY_WINDOW_MESSAGES:], clean)
+    user_text = f"项目: {project_id}\n用户: {user_id}\n对话:\n{transcript}\n\n请输出 JSON："
+    from langchain_core.messages import SystemMessage, HumanMessage
+    resp = llm.invoke([SystemMessage(content=COGNITION_SYSTEM_PROMPT), HumanMessage(content=user_text)])
+    content = getattr(resp, "content", "") or str(resp)
+    return content.strip()
+
+def should_prompt_save(summary_text):
+    try:
+        data = json.loads(summary_text)
+    except Exception:
+        return False, None
+    if not isinstance(data, dict):
+        return False, None
+    items = data.get("items") or {}
+    behavior = items.get("behavior_preferences") or []
+    code_style = items.get("code_style_preferences") or []
+    tasks = items.get("task_experiences") or []
+    templates = data.get("task_templates") or []
+    proposed_tags = data.get("proposed_tags") or []
+    has_items = any([behavior, code_style, tasks, templates])
+    has_tags = len(normalize_tags(proposed_tags)) > 0
+    return has_items or has_tags, data
+
+def _collect_task_templates(task_templates, project_id, user_id, base_tags, records):
+    if not task_templates:
+        return
+    for template in task_templates:
+        if not isinstance(template, dict):
+            continue
+        name = str(template.get("name") or "").strip()
+        if not name:
+            continue
+        tags = normalize_tags(base_tags + ["scope:project", "topic:task_template"])
+        if isinstance(template.get("tags"), list):
+            tags = normalize_tags(tags + template.get("tags"))
+        content = json.dumps(template, ensure_ascii=False)
+        records.append({
+            "system_name": "task_template",
+            "content": content,
+            "tags": tags,
+            "scope": "project",
+            "project_id": project_id,
+            "user_id": user_id,
+            "memory_type": "task_template"
+        })
+
+def save_cognition_summary(summary, project_id, user_id):
+    from app.skills.system_skill.scripts.experience_tools import bulk_add_operation_experiences
+
+    items = summary.get("items") or {}
+    task_templates = summary.get("task_templates") or []
+    proposed_tags = normalize_tags(summary.get("proposed_tags") or [])
+    base_tags = proposed_tags + [f"project:{project_id}"]
+    records = []
+
+    def collect_items(values, scope, memory_type, topic_tag):
+        if not values:
+            return
+        for value in values:
+            content = str(value).strip()
+            if not content:
+                continue
+            tags = normalize_tags(base_tags + [f"scope:{scope}", topic_tag])
+            records.append({
+                "system_name": "personal_cognition",
+                "content": content,
+                "tags": tags,
+                "scope": scope,
+                "project_id": project_id,
+                "user_id": user_id,
+                "memory_type": memory_type
+            })
+
+    collect_items(items.get("behavior_preferences"), "user", "behavior", "topic:behavior")
+    collect_items(items.get("code_style_preferences"), "user", "code_style", "topic:code_style")
+    collect_items(items.get("task_experiences"), "project", "task", "topic:task")
+    _collect_task_templates(task_templates, project_id, user_id, base_tags, records)
+
+    # 一次批量嵌入 + 一次写入；id 由内容哈希生成，重复保存同一总结不会产生重复条目
+    return bulk_add_operation_experiences(records)
+
+def _save_raw_summary(summary_text, project_id, user_id):
+    from app.skills.system_skill.scripts.experience_tools import bulk_add_operation_experiences
+
+    return bulk_add_operation_experiences([{
+        "system_name": "personal_cognition",
+        "content": summary_text,
+        "tags": ["scope:project", f"project:{project_id}", "topic:summary"],
+        "scope": "project",
+        "project_id": project_id,
+        "user_id": user_id,
+        "memory_type": "task"
+    }])
+
+class CognitionPipeline:
+    """
+    任务完成后的认知总结流水线：在后台线程生成总结，值得保存的放入待确认队列，
+    由控制台命令或 Web 控制台批量确认/放弃。待确认队列持久化到 app/data/cognition_pending.json。
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or _get_pending_path()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cognition-summary")
+        self._pending: Optional[List[Dict[str, Any]]] = None
+        self._in_flight = 0
+
+    # --- 持久化 ---
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if self._pending is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._pending = data if isinstance(data, list) else []
+            except Exception:
+                self._pending = []
+        return self._pending
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._pending or [], f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    # --- 生成 ---
+
+    def submit(self, messages: Sequence, llm, project_id: str, user_id: str, clean: Optional[Callable[[str], str]] = None):
+        """
+        复制最近的对话快照后立即返回；总结在后台线程中生成。
+        """
+        snapshot = list(messages)[-SUMMARY_WINDOW_MESSAGES:]
+        with self._lock:
+            self._in_flight += 1
+        # 沿用调用方的上下文（会话 ID），生成结果只推送给发起的会话
+        return self._executor.submit(contextvars.copy_context().run, self._generate, snapshot, llm, project_id, user_id, clean)
+
+    def _generate(self, messages, llm, project_id, user_id, clean):
+        try:
+            summary_text = build_cognition_summary(messages, llm, project_id, user_id, clean)
+            worth_saving, summary_json = should_prompt_save(summary_text)
+            if not worth_saving:
+                return None
+            entry = {
+                "id": uuid.uuid4().hex[:8],
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "project_id": project_id,
+                "user_id": user_id,
+                "summary": summary_json,
+                "raw": summary_text,
+            }
+            with self._lock:
+                self._load().append(entry)
+                self._flush()
+            say(f"Agent: 已生成个人认知总结（待确认 #{entry['id']}）。输入 /accept {entry['id']} 保存、/reject {entry['id']} 放弃，或在 Web 控制台批量处理。\n")
+            return entry
+        except Exception as e:
+            say(f"Agent: 生成总结失败: {e}\n")
+            return None
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    # --- 确认 ---
+
+    def list_pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(item) for item in self._load()]
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _take(self, ids: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        """
+        从队列中取出指定条目（ids 为 None 表示全部）。
+        """
+        with self._lock:
+            pending = self._load()
+            wanted = None if ids is None else set(ids)
+            taken = [item for item in pending if wanted is None or item["id"] in wanted]
+            if taken:
+                taken_ids = {item["id"] for item in taken}
+                self._pending = [item for item in pending if item["id"] not in taken_ids]
+                self._flush()
+            return taken
+
+    def accept(self, ids: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        保存指定（或全部）待确认总结到经验库，返回每条的处理结果。
+        """
+        results = []
+        for item in self._take(ids):
+            try:
+                if item.get("summary") is None:
+                    item["summary"] = json.loads(item.get("raw") or "")
+                saved = save_cognition_summary(item["summary"], item["project_id"], item["user_id"])
+                results.append({"id": item["id"], "saved": len(saved or [])})
+            except Exception:
+                try:
+                    _save_raw_summary(item.get("raw") or "", item["project_id"], item["user_id"])
+                    results.append({"id": item["id"], "saved": 1, "raw": True})
+                except Exception as e:
+                    # 保存失败时放回队列，避免丢失
+                    with self._lock:
+                        self._load().append(item)
+                        self._flush()
+                    results.append({"id": item["id"], "error": str(e)})
+        return {"accepted": results}
+
+    def reject(self, ids: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        return {"rejected": [item["id"] for item in self._take(ids)]}
+
+# Global instance
+cognition_pipeline = CognitionPipeline()
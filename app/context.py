@@ -0,0 +1,21 @@
+import re
+from contextvars import ContextVar
+from typing import Optional
+
+# 控制台与未指定会话的请求共用的默认会话
+DEFAULT_SESSION_ID = "default"
+
+_SESSION_ID_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+# 当前线程/协程正在处理的会话；Agent 工作线程在执行一轮对话前设置
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+def normalize_session_id(session_id: Optional[str]) -> str:
+    """
+    会话 ID 只保留字母、数字与 _ . -，最长 64 字符；为空时返回默认会话。
+    """
+    cleaned = _SESSION_ID_RE.sub("", str(session_id or "").strip())[:64].strip(".")
+    return cleaned or DEFAULT_SESSION_ID
+
+def get_session_id() -> str:
+    return current_session_id.get() or DEFAULT_SESSION_ID
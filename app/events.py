@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.context import DEFAULT_SESSION_ID, current_session_id
+
+class EventType:
+    LOG = "log"            # 运行日志行
+    MESSAGE = "message"    # 面向用户的 Agent / 系统消息
+    TOKEN = "token"        # LLM 流式输出（phase: start / delta / end / error）
+    TOOL = "tool"          # 工具调用（phase: start / end / error）
+    STATE = "state"        # Agent 状态变化（CONTINUE / DONE / ...）
+    METRIC = "metric"      # 运行指标
+
+Event = Dict[str, Any]
+Sink = Callable[[List[Event]], Awaitable[None]]
+
+class EventBus:
+    """
+    进程内事件总线。任意线程调用 publish() 只做一次加锁入队（不跨线程调度协程）；
+    Web 事件循环中的 flusher 每 flush_ms 毫秒取出一批事件，交给订阅者一次性推送。
+
+    待推送队列是有界环形缓冲：积压超过 buffer_size 时丢弃最旧的事件；
+    相邻的同一次 LLM 调用的 token 增量会合并为一条，同名指标只保留最新值。
+
+    每个事件带递增的 seq；已推送的事件保留在最近 replay_size 条的回放缓冲中，
+    断线重连的客户端可通过 replay(since) 补齐错过的事件。
+    在会话上下文中发布的事件带 session 字段，供 Web 端按会话分发。
+    """
+    def __init__(self, buffer_size: Optional[int] = None, flush_ms: Optional[int] = None, replay_size: Optional[int] = None):
+        self.buffer_size = int(buffer_size or os.getenv("EVENT_BUFFER_SIZE") or 2000)
+        self.flush_ms = int(flush_ms or os.getenv("EVENT_FLUSH_MS") or 50)
+        self.replay_size = int(replay_size or os.getenv("EVENT_REPLAY_SIZE") or 500)
+        self._lock = threading.Lock()
+        self._pending: Deque[Event] = deque(maxlen=self.buffer_size)
+        self._history: Deque[Event] = deque(maxlen=self.replay_size)
+        self._seq = 0
+        self._sinks: List[Sink] = []
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    # --- 发布 ---
+
+    def publish(self, event_type: str, **data) -> Event:
+        event = {"type": event_type, "ts": round(time.time(), 3)}
+        event.update(data)
+        session_id = current_session_id.get()
+        if session_id is not None and "session" not in event:
+            event["session"] = session_id
+        with self._lock:
+            self.published += 1
+            if self._pending and self._coalesce(self._pending[-1], event):
+                self.coalesced += 1
+                return event
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._seq += 1
+            event["seq"] = self._seq
+            self._pending.append(event)
+        return event
+
+    @staticmethod
+    def _coalesce(last: Event, event: Event) -> bool:
+        if last["type"] != event["type"] or last.get("session") != event.get("session"):
+            return False
+        if event["type"] == EventType.TOKEN:
+            if last.get("phase") == event.get("phase") == "delta" and last.get("run_id") == event.get("run_id"):
+                last["text"] = last.get("text", "") + event.get("text", "")
+                return True
+        elif event["type"] == EventType.METRIC:
+            if last.get("name") == event.get("name"):
+                seq = last.get("seq")
+                last.update(event)
+                last["seq"] = seq
+                return True
+        return False
+
+    def log(self, text: str, level: str = "info", source: Optional[str] = None) -> Event:
+        return self.publish(EventType.LOG, text=text, level=level, source=source)
+
+    def message(self, text: str, role: str = "agent") -> Event:
+        return self.publish(EventType.MESSAGE, text=text, role=role)
+
+    def token(self, run_id: str, phase: str, text: str = "", **data) -> Event:
+        return self.publish(EventType.TOKEN, run_id=run_id, phase=phase, text=text, **data)
+
+    def tool(self, run_id: str, phase: str, name: str, **data) -> Event:
+        return self.publish(EventType.TOOL, run_id=run_id, phase=phase, name=name, **data)
+
+    def state(self, state: Optional[str], **data) -> Event:
+        return self.publish(EventType.STATE, state=state, **data)
+
+    def metric(self, name: str, value: Any, **data) -> Event:
+        return self.publish(EventType.METRIC, name=name, value=value, **data)
+
+    def drain(self) -> List[Event]:
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            self._history.extend(batch)
+        return batch
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def replay(self, since: Optional[int] = None) -> Tuple[List[Event], bool]:
+        """
+        返回回放缓冲中 seq > since 的事件（since 为 None 时返回全部）。
+        第二个返回值为 True 表示 since 之后的部分事件已被挤出缓冲，客户端存在缺口。
+        """
+        with self._lock:
+            history = list(self._history)
+        if since is None:
+            return history, False
+        events = [e for e in history if e["seq"] > since]
+        gap = bool(history) and history[0]["seq"] > since + 1 and since < self._seq
+        return events, gap
+
+    # --- 订阅与推送 ---
+
+    def subscribe(self, sink: Sink):
+        if sink not in self._sinks:
+            self._sinks.append(sink)
+
+    def unsubscribe(self, sink: Sink):
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
+    async def _flush_loop(self):
+        interval = self.flush_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            batch = self.drain()
+            if not batch:
+                continue
+            for sink in list(self._sinks):
+                try:
+                    await sink(batch)
+                except Exception as e:
+                    print(f"Event sink error: {e}")
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        在 Web 事件循环中启动批量推送任务（需在该循环内调用，或传入 loop）。
+        """
+        if self._task is not None and not self._task.done():
+            return
+        loop = loop or asyncio.get_running_loop()
+        self._task = loop.create_task(self._flush_loop())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "pending": pending,
+            "last_seq": self._seq,
+            "buffer_size": self.buffer_size,
+            "replay_size": self.replay_size,
+            "flush_ms": self.flush_ms,
+            "sinks": len(self._sinks),
+        }
+
+class EventLogHandler(logging.Handler):
+    """
+    把 logging 记录转成 LOG 事件，替代对 stdout 的截获。
+    """
+    def __init__(self, bus: "EventBus", level=logging.INFO):
+        super().__init__(level)
+        self.bus = bus
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.bus.log(self.format(record), level=record.levelname.lower(), source=record.name)
+        except Exception:
+            pass
+
+def say(text: str, role: str = "agent"):
+    """
+    面向用户的输出：打印到控制台，同时作为 MESSAGE 事件推送到 Web 控制台。
+    非默认会话的输出在控制台上带会话前缀。
+    """
+    session_id = current_session_id.get()
+    print(text if session_id in (None, DEFAULT_SESSION_ID) else f"[{session_id}] {text}")
+    event_bus.message(text.rstrip("\n"), role=role)
+
+# Global instance
+event_bus = EventBus()
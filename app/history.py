@@ -0,0 +1,228 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "对话摘要（用于延续上下文）："
+SUMMARY_SYSTEM_PROMPT = "你是对话摘要器。把对话压缩为可用于继续对话的摘要，保留关键信息、约束、已完成事项、未完成事项、关键决定、关键参数/路径/变量名,并给出最后一轮对话执行到哪一步了。只输出摘要正文。"
+DEFAULT_TOKEN_BUDGET = 24000
+# 每条消息的角色与分隔开销（近似 OpenAI chat 格式）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_RE = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+Message = Tuple[str, str]
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    进程内只加载一次 tokenizer；tiktoken 缺失或编码文件无法下载时返回 None，改用估算。
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(os.getenv("HISTORY_TOKENIZER") or "cl100k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, using heuristic token counts: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """
+    统计文本 token 数：优先 tiktoken，否则按中日韩字符 1 token、其余字符约 4 个 1 token 估算。
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def format_transcript(messages: Sequence[Message], clean: Optional[Callable[[str], str]] = None) -> str:
+    lines = []
+    for role, content in messages:
+        if role == "assistant" and clean is not None:
+            content = clean(content)
+        lines.append(f"{role}: {content}")
+    return "\n\n".join(lines).strip()
+
+def is_summary_message(msg) -> bool:
+    if not msg:
+        return False
+    role, content = msg
+    return role == "system" and isinstance(content, str) and content.startswith(SUMMARY_PREFIX)
+
+class HistoryManager:
+    """
+    按 token 预算管理对话历史。
+
+    - 每条消息入列时计数一次并维护累计总数，不再每轮重新统计
+    - 总数超过预算时，只把最旧的一段（压到 target_ratio * budget 以下所需的最少消息）交给摘要 LLM
+    - 摘要在后台线程执行，当前这一步继续使用未压缩的历史；完成后再替换掉已摘要的消息
+    - 超过 hard_limit 时（例如单次工具结果过大）才会等待摘要完成，避免上下文溢出
+    """
+    def __init__(
+        self,
+        llm,
+        budget: Optional[int] = None,
+        target_ratio: float = 0.6,
+        hard_limit: Optional[int] = None,
+        min_recent_messages: int = 4,
+        clean_assistant: Optional[Callable[[str], str]] = None,
+    ):
+        self.llm = llm
+        self.budget = int(budget or os.getenv("HISTORY_TOKEN_BUDGET") or DEFAULT_TOKEN_BUDGET)
+        self.target = int(self.budget * target_ratio)
+        self.hard_limit = int(hard_limit or self.budget * 2)
+        self.min_recent_messages = min_recent_messages
+        self.clean_assistant = clean_assistant
+        self._lock = threading.Lock()
+        self._messages: List[Message] = []
+        self._token_counts: List[int] = []
+        self._summary: Optional[str] = None
+        self._summary_tokens = 0
+        self._total = 0
+        self._epoch = 0
+        self._pending: Optional[Future] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+    # --- 读写 ---
+
+    @staticmethod
+    def _message_tokens(role: str, content: str) -> int:
+        return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, role: str, content: str):
+        self.extend([(role, content)])
+
+    def extend(self, messages: Sequence[Message]):
+        counts = [self._message_tokens(role, content) for role, content in messages]
+        with self._lock:
+            self._messages.extend(messages)
+            self._token_counts.extend(counts)
+            self._total += sum(counts)
+
+    def clear(self):
+        with self._lock:
+            self._messages = []
+            self._token_counts = []
+            self._summary = None
+            self._summary_tokens = 0
+            self._total = 0
+            # 进行中的摘要结果作废
+            self._epoch += 1
+
+    def close(self):
+        """
+        会话移除时调用：作废进行中的摘要并释放后台摘要线程。
+        """
+        with self._lock:
+            self._epoch += 1
+            self._pending = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def messages(self) -> List[Message]:
+        """
+        返回传给 Agent 的历史：摘要（如有）在前，其后为未摘要的消息。
+        """
+        with self._lock:
+            result = list(self._messages)
+            if self._summary:
+                result.insert(0, ("system", f"{SUMMARY_PREFIX}\n{self._summary}"))
+            return result
+
+    @property
+    def total_tokens(self) -> int:
+        with self._lock:
+            return self._total + self._summary_tokens
+
+    @property
+    def summarizing(self) -> bool:
+        pending = self._pending
+        return pending is not None and not pending.done()
+
+    # --- 压缩 ---
+
+    def _select_slice(self) -> int:
+        """
+        计算需要摘要的最旧消息条数；0 表示无需压缩。
+        """
+        total = self._total + self._summary_tokens
+        if total <= self.budget:
+            return 0
+        limit = max(0, len(self._messages) - self.min_recent_messages)
+        excess = total - self.target
+        removed = 0
+        count = 0
+        while count < limit and removed < excess:
+            removed += self._token_counts[count]
+            count += 1
+        # 按 user/assistant 成对摘要，避免把一轮对话拆开
+        if count % 2 and count < limit:
+            count += 1
+        return count
+
+    def maybe_compact(self, wait: Optional[bool] = None, timeout: Optional[float] = 120):
+        """
+        需要时提交后台摘要并立即返回；wait=None 时仅在超过 hard_limit 时等待摘要完成。
+        """
+        # 等待过一次进行中的摘要后，若仍超出预算再提交一次（覆盖摘要期间新增的消息）
+        for _ in range(2):
+            with self._lock:
+                pending = self._pending
+                submitted = False
+                if pending is None or pending.done():
+                    count = self._select_slice()
+                    if count:
+                        chunk = list(self._messages[:count])
+                        pending = self._executor.submit(self._summarize, self._summary, chunk, count, self._epoch)
+                        self._pending = pending
+                        submitted = True
+                over_hard_limit = self._total + self._summary_tokens > self.hard_limit
+            if pending is None or pending.done() or not (wait or (wait is None and over_hard_limit)):
+                return
+            try:
+                pending.result(timeout=timeout)
+            except Exception:
+                return
+            if submitted:
+                return
+
+    def _summarize(self, rolling_summary: Optional[str], chunk: List[Message], count: int, epoch: int):
+        from langchain_core.messages import SystemMessage, HumanMessage
+
+        transcript = format_transcript(chunk, self.clean_assistant)
+        user_text = ""
+        if rolling_summary:
+            user_text += f"已有摘要：\n{rolling_summary}\n\n"
+        user_text += f"需要压缩的新增对话（按顺序）：\n{transcript}\n\n请输出更新后的摘要："
+        try:
+            resp = self.llm.invoke([SystemMessage(content=SUMMARY_SYSTEM_PROMPT), HumanMessage(content=user_text)])
+        except Exception as e:
+            logger.warning(f"History summarization failed: {e}")
+            return
+        new_summary = (getattr(resp, "content", "") or str(resp)).strip()
+        summary_tokens = self._message_tokens("system", f"{SUMMARY_PREFIX}\n{new_summary}")
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            # 摘要期间只会在尾部追加消息，前 count 条仍是被摘要的那一段
+            self._total -= sum(self._token_counts[:count])
+            del self._messages[:count]
+            del self._token_counts[:count]
+            self._summary = new_summary
+            self._summary_tokens = summary_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "messages": len(self._messages),
+                "total_tokens": self._total + self._summary_tokens,
+                "summary_tokens": self._summary_tokens,
+                "budget": self.budget,
+                "summarizing": self.summarizing,
+            }
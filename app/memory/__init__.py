@@ -0,0 +1 @@
+from .service import MemoryService, memory_service, get_db_path
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+class AccessLog:
+    """
+    记录每条经验被检索命中的次数与最近访问时间，供压缩任务判断低价值条目。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS access (
+                    doc_id TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    last_accessed TEXT
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def record(self, ids: Iterable[str]):
+        now = datetime.now(timezone.utc).isoformat()
+        params = [(doc_id, now) for doc_id in dict.fromkeys(i for i in ids if i)]
+        if not params:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO access(doc_id, hits, last_accessed) VALUES (?, 1, ?) "
+                    "ON CONFLICT(doc_id) DO UPDATE SET hits = hits + 1, last_accessed = excluded.last_accessed",
+                    params,
+                )
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Tuple[int, Optional[str]]]:
+        ids = list(ids)
+        result: Dict[str, Tuple[int, Optional[str]]] = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                for doc_id, hits, last in conn.execute(
+                    f"SELECT doc_id, hits, last_accessed FROM access WHERE doc_id IN ({placeholders})", chunk
+                ):
+                    result[doc_id] = (hits, last)
+        return result
+
+    def merge(self, target_id: str, source_ids: Iterable[str]):
+        """
+        把被合并条目的访问次数累加到保留条目上，并删除来源记录。
+        """
+        sources = [i for i in source_ids if i and i != target_id]
+        if not sources:
+            return
+        stats = self.get_many(sources)
+        extra_hits = sum(h for h, _ in stats.values())
+        last_values = [last for _, last in stats.values() if last]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if extra_hits or last_values:
+                    conn.execute(
+                        "INSERT INTO access(doc_id, hits, last_accessed) VALUES (?, ?, ?) "
+                        "ON CONFLICT(doc_id) DO UPDATE SET hits = hits + excluded.hits, "
+                        "last_accessed = MAX(COALESCE(last_accessed, ''), COALESCE(excluded.last_accessed, ''))",
+                        (target_id, extra_hits, max(last_values) if last_values else None),
+                    )
+                conn.executemany("DELETE FROM access WHERE doc_id = ?", [(i,) for i in sources])
+
+    def delete_many(self, ids: Iterable[str]):
+        params = [(i,) for i in ids]
+        if not params:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM access WHERE doc_id = ?", params)
@@ -0,0 +1,141 @@
+"""
+嵌入后端基准：在已存储的经验上比较各后端的加载耗时、编码吞吐、单条查询延迟与内存占用，
+并以参考后端（默认 hf）的 top-k 近邻为基准计算 recall@k。
+
+用法:
+    python -m app.memory.benchmark --backends hf,onnx,hash --k 5
+    python -m app.memory.benchmark --backends onnx,hash --reference onnx --limit 300
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from app.memory.embedders import available_backends, create_embedder
+from app.memory.service import DEFAULT_COLLECTION_NAME, get_db_path
+from app.profiling import current_rss
+
+def load_stored_texts(persist_directory: Optional[str] = None, limit: int = 0) -> List[str]:
+    """
+    直接读取 Chroma 集合中的文档原文（不加载嵌入模型）。
+    """
+    import chromadb
+    client = chromadb.PersistentClient(path=persist_directory or get_db_path())
+    collection = client.get_collection(DEFAULT_COLLECTION_NAME)
+    total = collection.count()
+    if limit:
+        total = min(total, limit)
+    texts: List[str] = []
+    page = 500
+    for offset in range(0, total, page):
+        batch = collection.get(include=["documents"], limit=min(page, total - offset), offset=offset)
+        texts.extend(d or "" for d in batch.get("documents") or [])
+    return texts
+
+def _top_k(vectors, k: int):
+    """
+    每条文档作为查询，在其余文档中取余弦相似度最高的 k 个（排除自身）。
+    """
+    import numpy as np
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+    sims = matrix @ matrix.T
+    np.fill_diagonal(sims, -np.inf)
+    k = min(k, max(1, len(matrix) - 1))
+    return [set(row) for row in np.argpartition(-sims, k - 1, axis=1)[:, :k].tolist()]
+
+def benchmark_backend(backend: str, texts: List[str], batch_size: Optional[int], threads: Optional[int], queries: int) -> Dict[str, Any]:
+    rss_before = current_rss()
+    start = time.perf_counter()
+    embedder = create_embedder(backend, batch_size=batch_size, threads=threads)
+    embedder.embed_documents(["warm up"])
+    load_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    vectors = embedder.embed_documents(texts)
+    encode_s = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:queries]:
+        t0 = time.perf_counter()
+        embedder.embed_query(text)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    rss_after = current_rss()
+    return {
+        "backend": backend,
+        "batch_size": embedder.batch_size,
+        "threads": embedder.threads,
+        "load_ms": round(load_ms, 1),
+        "docs_per_s": round(len(texts) / encode_s, 1) if encode_s > 0 else None,
+        "query_p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "query_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else None,
+        "rss_delta_mb": round((rss_after - rss_before) / 1048576, 1) if rss_before is not None and rss_after is not None else None,
+        "_vectors": vectors,
+    }
+
+def run_benchmark(backends: List[str], reference: str, k: int = 5, limit: int = 0, batch_size: Optional[int] = None,
+                  threads: Optional[int] = None, queries: int = 50, persist_directory: Optional[str] = None) -> Dict[str, Any]:
+    texts = load_stored_texts(persist_directory, limit)
+    if len(texts) < 2:
+        raise RuntimeError(f"Need at least 2 stored experiences to benchmark, found {len(texts)}.")
+    order = [reference] + [b for b in backends if b != reference]
+    results: List[Dict[str, Any]] = []
+    for backend in order:
+        try:
+            results.append(benchmark_backend(backend, texts, batch_size, threads, queries))
+        except Exception as e:
+            results.append({"backend": backend, "error": f"{type(e).__name__}: {e}"})
+            print(f"[{backend}] skipped: {e}", file=sys.stderr)
+
+    ref = next((r for r in results if r["backend"] == reference and "_vectors" in r), None)
+    ref_top = _top_k(ref["_vectors"], k) if ref else None
+    for r in results:
+        vectors = r.pop("_vectors", None)
+        if vectors is None or ref_top is None:
+            r["recall_at_k"] = None
+            continue
+        top = _top_k(vectors, k)
+        r["recall_at_k"] = round(sum(len(a & b) for a, b in zip(top, ref_top)) / sum(len(b) for b in ref_top), 4)
+    return {"documents": len(texts), "k": k, "reference": reference, "results": results}
+
+def _print_table(report: Dict[str, Any]):
+    print(f"documents={report['documents']}  k={report['k']}  reference={report['reference']}")
+    columns = ["backend", "load_ms", "docs_per_s", "query_p50_ms", "query_p95_ms", "rss_delta_mb", "recall_at_k"]
+    print("  ".join(f"{c:>13}" for c in columns))
+    for r in report["results"]:
+        if "error" in r:
+            print(f"{r['backend']:>13}  error: {r['error']}")
+            continue
+        print("  ".join(f"{str(r.get(c)):>13}" for c in columns))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends on the stored experiences.")
+    parser.add_argument("--backends", default=",".join(available_backends()), help="comma separated: hf,onnx,hash")
+    parser.add_argument("--reference", default="hf", help="backend whose neighbours define recall (default: hf)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=0, help="max stored experiences to use (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=50, help="single-query latency samples")
+    parser.add_argument("--db", default=None, help="Chroma persist directory (default: app/data/experience_db)")
+    parser.add_argument("--output", default=None, help="write the JSON report to this path")
+    args = parser.parse_args(argv)
+
+    backends = [b.strip().lower() for b in args.backends.split(",") if b.strip()]
+    report = run_benchmark(backends, args.reference.strip().lower(), k=args.k, limit=args.limit,
+                           batch_size=args.batch_size, threads=args.threads, queries=args.queries,
+                           persist_directory=args.db)
+    _print_table(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
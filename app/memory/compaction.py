@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.memory.service import memory_service
+
+logger = logging.getLogger(__name__)
+
+# 可按年龄与访问次数淘汰的低价值记忆类型；"" 表示未标注类型的普通操作经验
+DEFAULT_TTL_TYPES = ["", "task"]
+# 长期偏好与模板类记忆永不按 TTL 淘汰（即使出现在 MEMORY_TTL_TYPES 中）
+PROTECTED_TYPES = {"persona", "behavior", "code_style", "task_template"}
+# 按 system 保护：人格记忆由 add_operation_experience(system_name="persona") 写入，不带 memory_type
+PROTECTED_SYSTEMS = {"persona"}
+
+def _get_report_path():
+    # Path: app/data/compaction_report.json
+    return os.path.join(os.path.dirname(memory_service.persist_directory), "compaction_report.json")
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+def _group_key(meta: Dict[str, Any]):
+    return (
+        meta.get("memory_type") or "",
+        meta.get("scope") or "",
+        meta.get("project_id") or "",
+        meta.get("user_id") or "",
+        meta.get("system") or "",
+    )
+
+def _split_tags(value: str) -> List[str]:
+    return [t.strip() for t in str(value or "").split(",") if t.strip()]
+
+def _load_all(page: int = 500):
+    collection = memory_service.collection
+    if collection is None:
+        raise RuntimeError("RAG dependencies missing.")
+    total = collection.count()
+    ids, embeddings, metadatas, documents = [], [], [], []
+    for offset in range(0, total, page):
+        batch = collection.get(include=["embeddings", "metadatas", "documents"], limit=page, offset=offset)
+        ids.extend(batch.get("ids") or [])
+        embeddings.extend(list(batch.get("embeddings") if batch.get("embeddings") is not None else []))
+        metadatas.extend(batch.get("metadatas") or [])
+        documents.extend(batch.get("documents") or [])
+    return ids, embeddings, metadatas, documents
+
+def _cluster_duplicates(ids, embeddings, metadatas, access, threshold: float):
+    """
+    在同一 (类型, 范围, 项目, 用户, 系统) 分组内做贪心聚类：余弦相似度不低于阈值的条目归为一簇。
+    """
+    import numpy as np
+
+    groups: Dict[Any, List[int]] = {}
+    for idx, meta in enumerate(metadatas):
+        groups.setdefault(_group_key(meta or {}), []).append(idx)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        vectors = np.asarray([embeddings[i] for i in members], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        # 访问次数多、时间新的条目优先作为簇代表
+        order = sorted(
+            range(len(members)),
+            key=lambda j: (
+                access.get(ids[members[j]], (0, None))[0],
+                (metadatas[members[j]] or {}).get("created_at") or "",
+            ),
+            reverse=True,
+        )
+        assigned = set()
+        for pos, j in enumerate(order):
+            if j in assigned:
+                continue
+            rest = [r for r in order[pos + 1:] if r not in assigned]
+            if not rest:
+                continue
+            sims = vectors[rest] @ vectors[j]
+            dup = [(r, float(s)) for r, s in zip(rest, sims) if s >= threshold]
+            if not dup:
+                continue
+            assigned.add(j)
+            assigned.update(r for r, _ in dup)
+            clusters.append({
+                "keep": members[j],
+                "remove": [members[r] for r, _ in dup],
+                "min_similarity": round(min(s for _, s in dup), 4),
+            })
+    return clusters
+
+def _merged_metadata(keep_meta: Dict[str, Any], removed: List[Dict[str, Any]], removed_ids: List[str], now: str) -> Dict[str, Any]:
+    meta = dict(keep_meta)
+    tags = _split_tags(meta.get("tags"))
+    for other in removed:
+        tags.extend(_split_tags(other.get("tags")))
+        for key, value in other.items():
+            if key.startswith("tag:") and value is True:
+                meta[key] = True
+    tags = list(dict.fromkeys(tags))
+    meta["tags"] = ", ".join(tags)
+    meta["tags_list"] = ", ".join(tags)
+
+    provenance = []
+    try:
+        provenance = json.loads(meta.get("provenance") or "[]")
+    except Exception:
+        provenance = []
+    for doc_id, other in zip(removed_ids, removed):
+        provenance.append({
+            "id": doc_id,
+            "created_at": other.get("created_at") or "",
+            "content": (other.get("original_content") or "")[:200],
+        })
+        try:
+            provenance.extend(json.loads(other.get("provenance") or "[]"))
+        except Exception:
+            pass
+    merged_from = [p["id"] for p in provenance if p.get("id")]
+    meta["provenance"] = json.dumps(provenance, ensure_ascii=False)
+    meta["merged_from"] = ", ".join(merged_from)
+    meta["merged_count"] = len(merged_from)
+    meta["merged_at"] = now
+    return meta
+
+def run_compaction(
+    dry_run: bool = True,
+    similarity_threshold: Optional[float] = None,
+    ttl_days: Optional[float] = None,
+    min_access: Optional[int] = None,
+    ttl_types: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    压缩经验库：合并近似重复条目（保留来源记录），按年龄与访问次数淘汰低价值条目，并重建关键词索引。
+
+    Args:
+        dry_run: True 时只生成报告，不修改数据
+        similarity_threshold: 近似重复判定的余弦相似度阈值
+        ttl_days: 低价值条目的最长保留天数
+        min_access: 访问次数低于该值且超过 ttl_days 的条目会被淘汰
+        ttl_types: 允许淘汰的 memory_type 列表
+    """
+    started = time.perf_counter()
+    threshold = float(similarity_threshold if similarity_threshold is not None else os.getenv("MEMORY_DEDUP_THRESHOLD") or 0.92)
+    ttl_days = float(ttl_days if ttl_days is not None else os.getenv("MEMORY_TTL_DAYS") or 90)
+    min_access = int(min_access if min_access is not None else os.getenv("MEMORY_TTL_MIN_ACCESS") or 2)
+    if ttl_types is None:
+        env_types = os.getenv("MEMORY_TTL_TYPES")
+        ttl_types = [t.strip() for t in env_types.split(",")] if env_types is not None else DEFAULT_TTL_TYPES
+    ttl_types = [t for t in dict.fromkeys(ttl_types) if t not in PROTECTED_TYPES]
+    now_dt = datetime.now(timezone.utc)
+    now = now_dt.isoformat()
+
+    ids, embeddings, metadatas, documents = _load_all()
+    access = memory_service.access_log.get_many(ids)
+    clusters = _cluster_duplicates(ids, embeddings, metadatas, access, threshold)
+
+    merged_away = set()
+    cluster_reports = []
+    merge_updates = []
+    for cluster in clusters:
+        keep = cluster["keep"]
+        removed = cluster["remove"]
+        removed_ids = [ids[i] for i in removed]
+        merged_away.update(removed_ids)
+        cluster_reports.append({
+            "keep": ids[keep],
+            "keep_content": ((metadatas[keep] or {}).get("original_content") or documents[keep] or "")[:200],
+            "remove": removed_ids,
+            "min_similarity": cluster["min_similarity"],
+        })
+        merge_updates.append((ids[keep], removed_ids, _merged_metadata(metadatas[keep] or {}, [metadatas[i] or {} for i in removed], removed_ids, now)))
+
+    expired = []
+    if ttl_days > 0:
+        for idx, doc_id in enumerate(ids):
+            if doc_id in merged_away:
+                continue
+            meta = metadatas[idx] or {}
+            if (meta.get("memory_type") or "") not in ttl_types or (meta.get("system") or "") in PROTECTED_SYSTEMS:
+                continue
+            created = _parse_time(meta.get("created_at"))
+            hits, last = access.get(doc_id, (0, None))
+            reference = _parse_time(last) or created
+            if reference is None:
+                continue
+            age_days = (now_dt - reference).total_seconds() / 86400
+            if age_days >= ttl_days and hits < min_access:
+                expired.append({
+                    "id": doc_id,
+                    "memory_type": meta.get("memory_type") or "",
+                    "age_days": round(age_days, 1),
+                    "hits": hits,
+                    "content": (meta.get("original_content") or "")[:200],
+                })
+
+    if not dry_run:
+        if merge_updates:
+            memory_service.update_many([u[0] for u in merge_updates], [u[2] for u in merge_updates])
+            for keep_id, removed_ids, _ in merge_updates:
+                memory_service.access_log.merge(keep_id, removed_ids)
+        to_delete = list(merged_away) + [e["id"] for e in expired]
+        if to_delete:
+            memory_service.delete_many(to_delete)
+        # 删除后重建关键词索引，保证 BM25 统计量与集合一致
+        memory_service.ensure_lexical_index(force=True)
+
+    report = {
+        "dry_run": dry_run,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "scanned": len(ids),
+        "similarity_threshold": threshold,
+        "ttl_days": ttl_days,
+        "min_access": min_access,
+        "ttl_types": ttl_types,
+        "duplicate_clusters": cluster_reports,
+        "merged_count": len(merged_away),
+        "expired": expired,
+        "expired_count": len(expired),
+        "remaining": len(ids) - (0 if dry_run else len(merged_away) + len(expired)),
+    }
+    try:
+        with open(_get_report_path(), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.warning(f"Failed to write compaction report: {e}")
+    return report
+
+class CompactionJob:
+    """
+    在后台线程中运行压缩任务；同一时间只允许一个任务执行。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status = "idle"
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self._timer: Optional[threading.Timer] = None
+
+    def start(self, **kwargs) -> bool:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = "running"
+            self.last_error = None
+            self._thread = threading.Thread(target=self._run, kwargs=kwargs, name="memory-compaction", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, **kwargs):
+        try:
+            self.last_report = run_compaction(**kwargs)
+            self.status = "done"
+        except Exception as e:
+            self.last_error = str(e)
+            self.status = "failed"
+            logger.error(f"Memory compaction failed: {e}")
+
+    def wait(self, timeout: Optional[float] = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def schedule(self, interval_hours: float, dry_run: bool = False):
+        """
+        周期性执行压缩（interval_hours <= 0 时不调度）。
+        """
+        if interval_hours <= 0:
+            return
+
+        def _tick():
+            self.start(dry_run=dry_run)
+            self.schedule(interval_hours, dry_run)
+
+        self._timer = threading.Timer(interval_hours * 3600, _tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def snapshot(self) -> Dict[str, Any]:
+        report = self.last_report
+        if report is None:
+            try:
+                with open(_get_report_path(), "r", encoding="utf-8") as f:
+                    report = json.load(f)
+            except Exception:
+                report = None
+        return {"status": self.status, "error": self.last_error, "report": report}
+
+# Global instance
+compaction_job = CompactionJob()
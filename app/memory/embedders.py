@@ -0,0 +1,192 @@
+import hashlib
+import math
+import os
+import threading
+from typing import List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from app.memory.lexical import tokenize
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_EMBEDDING_BACKEND = "hf"
+# 社区转换的 all-MiniLM-L6-v2 ONNX 权重（含 int8 动态量化版本）
+DEFAULT_ONNX_REPO = "Xenova/all-MiniLM-L6-v2"
+DEFAULT_ONNX_FILE = "onnx/model_quantized.onnx"
+EMBEDDING_DIMENSION = 384
+
+def get_embedding_config():
+    """
+    读取嵌入相关环境变量：EMBEDDING_BACKEND / EMBEDDING_BATCH_SIZE / EMBEDDING_THREADS。
+    """
+    backend = (os.getenv("EMBEDDING_BACKEND") or DEFAULT_EMBEDDING_BACKEND).strip().lower()
+    batch_size = max(1, int(os.getenv("EMBEDDING_BATCH_SIZE") or 32))
+    threads = max(0, int(os.getenv("EMBEDDING_THREADS") or 0))
+    return backend, batch_size, threads
+
+def collection_suffix(backend: str) -> str:
+    """
+    不同向量空间的后端使用独立集合，避免新旧向量混在一起。
+    hf 与 onnx 是同一模型（onnx 为量化版本），共享默认集合；hash 使用单独集合。
+    """
+    return "" if backend in ("hf", "onnx") else f"__{backend}"
+
+def _normalize(vectors):
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class BaseEmbedder(Embeddings):
+    """
+    嵌入后端基类：按 batch_size 分批调用 _embed_batch，query 与 document 使用同一编码。
+    """
+    backend = "base"
+
+    def __init__(self, batch_size: int = 32, threads: int = 0):
+        self.batch_size = max(1, int(batch_size))
+        self.threads = max(0, int(threads))
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [t if isinstance(t, str) else str(t) for t in texts]
+        result: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            result.extend(self._embed_batch(texts[start:start + self.batch_size]))
+        return result
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class HuggingFaceEmbedder(BaseEmbedder):
+    """
+    sentence-transformers (torch) 后端，与历史版本的向量完全一致。
+    """
+    backend = "hf"
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = 32, threads: int = 0):
+        super().__init__(batch_size, threads)
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self.model_name = model_name
+        self._inner = HuggingFaceEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"batch_size": self.batch_size},
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # sentence-transformers 内部已按 batch_size 分批
+        return self._inner.embed_documents(list(texts))
+
+class OnnxEmbedder(BaseEmbedder):
+    """
+    ONNX Runtime CPU 后端：加载 int8 量化的 all-MiniLM-L6-v2，mean pooling + L2 归一化，
+    与 sentence-transformers 的输出处于同一向量空间，但无需 torch。
+
+    模型目录需包含 model_quantized.onnx（或 EMBEDDING_ONNX_MODEL_PATH 指向的 .onnx 文件）与 tokenizer.json；
+    本地不存在时从 HuggingFace Hub（遵循 HF_ENDPOINT 镜像）下载。
+    """
+    backend = "onnx"
+    max_length = 256
+
+    def __init__(self, model_path: Optional[str] = None, batch_size: int = 32, threads: int = 0):
+        super().__init__(batch_size, threads)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file, tokenizer_file = self._resolve_files(model_path or os.getenv("EMBEDDING_ONNX_MODEL_PATH"))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(tokenizer_file)
+        self._tokenizer.enable_truncation(max_length=self.max_length)
+        self._tokenizer.enable_padding()
+        self._lock = threading.Lock()
+        self.model_path = model_file
+
+    @staticmethod
+    def _resolve_files(model_path: Optional[str]):
+        if model_path and os.path.isfile(model_path):
+            model_dir = os.path.dirname(model_path)
+            tokenizer_file = os.path.join(model_dir, "tokenizer.json")
+            if not os.path.exists(tokenizer_file):
+                tokenizer_file = os.path.join(os.path.dirname(model_dir), "tokenizer.json")
+            return model_path, tokenizer_file
+        if model_path and os.path.isdir(model_path):
+            for name in ("model_quantized.onnx", os.path.join("onnx", "model_quantized.onnx"), "model.onnx"):
+                candidate = os.path.join(model_path, name)
+                if os.path.exists(candidate):
+                    return candidate, os.path.join(model_path, "tokenizer.json")
+            raise FileNotFoundError(f"No ONNX model found in {model_path}")
+        from huggingface_hub import hf_hub_download
+        model_file = hf_hub_download(DEFAULT_ONNX_REPO, DEFAULT_ONNX_FILE)
+        tokenizer_file = hf_hub_download(DEFAULT_ONNX_REPO, "tokenizer.json")
+        return model_file, tokenizer_file
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        with self._lock:
+            hidden = self._session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return _normalize(pooled).astype(np.float32).tolist()
+
+class HashingEmbedder(BaseEmbedder):
+    """
+    确定性特征哈希嵌入：对 tokenize() 的词元做带符号哈希并 L2 归一化。
+    不依赖任何模型文件，结果跨进程稳定，适合测试与离线环境；语义能力有限。
+    """
+    backend = "hash"
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, batch_size: int = 32, threads: int = 0):
+        super().__init__(batch_size, threads)
+        self.dimension = int(dimension)
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimension] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(t) for t in texts]
+
+_BACKENDS = {
+    "hf": HuggingFaceEmbedder,
+    "onnx": OnnxEmbedder,
+    "hash": HashingEmbedder,
+}
+
+def create_embedder(backend: Optional[str] = None, batch_size: Optional[int] = None, threads: Optional[int] = None) -> BaseEmbedder:
+    """
+    按名称创建嵌入后端（hf / onnx / hash），未指定的参数取自环境变量。
+    """
+    env_backend, env_batch, env_threads = get_embedding_config()
+    backend = (backend or env_backend).strip().lower()
+    cls = _BACKENDS.get(backend)
+    if cls is None:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(_BACKENDS)})")
+    return cls(
+        batch_size=batch_size if batch_size is not None else env_batch,
+        threads=threads if threads is not None else env_threads,
+    )
+
+def available_backends() -> Sequence[str]:
+    return list(_BACKENDS)
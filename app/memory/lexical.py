@@ -0,0 +1,153 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_ASCII_TOKEN_RE = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.:/\\\-#@]*")
+_ASCII_PART_RE = re.compile(r"[A-Za-z0-9]+")
+_CJK_RUN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+
+try:
+    import jieba  # optional
+    jieba.setLogLevel(60)
+except Exception:
+    jieba = None
+
+def tokenize(text: str) -> List[str]:
+    """
+    混合分词：英文/路径/选择器按完整 token 与子片段切分；中文优先使用 jieba，
+    未安装时退回字符二元组 (bigram)。
+    """
+    if not text:
+        return []
+    tokens: List[str] = []
+    for match in _ASCII_TOKEN_RE.finditer(text):
+        token = match.group(0).lower().rstrip(".:-/\\")
+        if not token:
+            continue
+        tokens.append(token)
+        parts = _ASCII_PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for match in _CJK_RUN_RE.finditer(text):
+        run = match.group(0)
+        if jieba is not None:
+            tokens.extend(t for t in jieba.lcut_for_search(run) if t.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class LexicalIndex:
+    """
+    基于 SQLite 的 BM25 倒排索引，与 Chroma 集合使用相同的文档 id。
+    """
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    doc_id TEXT PRIMARY KEY,
+                    length INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, doc_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+            """)
+            self._conn = conn
+        return self._conn
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add_many(self, ids: Sequence[str], texts: Sequence[str]):
+        """
+        写入或覆盖文档（按 id upsert）。
+        """
+        rows_docs = []
+        rows_postings = []
+        for doc_id, text in zip(ids, texts):
+            counts = Counter(tokenize(text))
+            rows_docs.append((doc_id, sum(counts.values())))
+            rows_postings.extend((term, doc_id, tf) for term, tf in counts.items())
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM postings WHERE doc_id = ?", [(i,) for i in ids])
+                conn.executemany("INSERT OR REPLACE INTO docs(doc_id, length) VALUES (?, ?)", rows_docs)
+                conn.executemany("INSERT OR REPLACE INTO postings(term, doc_id, tf) VALUES (?, ?, ?)", rows_postings)
+
+    def delete_many(self, ids: Iterable[str]):
+        params = [(i,) for i in ids]
+        if not params:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM postings WHERE doc_id = ?", params)
+                conn.executemany("DELETE FROM docs WHERE doc_id = ?", params)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM postings")
+                conn.execute("DELETE FROM docs")
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """
+        BM25 检索，返回 [(doc_id, score)]，按得分降序。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" for _ in terms)
+        with self._lock:
+            conn = self._connect()
+            n_docs, avg_len = conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            df: Dict[str, int] = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            rows = conn.execute(
+                f"SELECT p.doc_id, p.term, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id "
+                f"WHERE p.term IN ({placeholders})", terms
+            ).fetchall()
+        avg_len = avg_len or 1.0
+        scores: Dict[str, float] = {}
+        for doc_id, term, tf, length in rows:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            denom = tf + self.k1 * (1 - self.b + self.b * length / avg_len)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / denom
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:max(1, int(limit))]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    RRF 融合多个排序列表：score(d) = Σ 1 / (k + rank)。
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,392 @@
+import logging
+import os
+import json
+import re
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.memory.cache import LRUCache
+from app.memory.lexical import LexicalIndex, reciprocal_rank_fusion
+from app.memory.access import AccessLog
+from app.memory.embedders import collection_suffix, create_embedder, get_embedding_config
+
+logger = logging.getLogger(__name__)
+
+# Ensure HF mirror is used before any HF imports
+if "HF_ENDPOINT" not in os.environ:
+    os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
+
+DEFAULT_COLLECTION_NAME = "agent_experiences"
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def get_db_path():
+    # Path: app/data/experience_db
+    # This file: app/memory/service.py
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(app_dir, "data", "experience_db")
+
+class MemoryService:
+    """
+    进程内共享的经验库服务：持有唯一的嵌入模型与 Chroma 集合，供 main.py 与经验工具共用。
+
+    - warm_up(): 启动时在后台线程加载嵌入模型，避免首次检索卡在用户回合内
+    - embed_many / add_many / search_many: 线程安全的批量接口，一次前向计算处理多条文本
+    - 查询嵌入与检索结果带 LRU 缓存；每次写入递增 generation，旧结果随之失效
+    - 与集合同步维护 BM25 倒排索引，search_hybrid() 以 RRF 融合关键词与向量排序
+    """
+    def __init__(self, collection_name: Optional[str] = None, persist_directory: Optional[str] = None, backend: Optional[str] = None):
+        self.backend = (backend or get_embedding_config()[0]).strip().lower()
+        self.collection_name = collection_name or DEFAULT_COLLECTION_NAME + collection_suffix(self.backend)
+        self.persist_directory = persist_directory or get_db_path()
+        self._init_lock = threading.Lock()
+        self._embed_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._embeddings = None
+        self._store = None
+        self._warm_thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._init_error: Optional[str] = None
+        cache_size = int(os.getenv("MEMORY_QUERY_CACHE_SIZE") or 256)
+        self._query_embedding_cache = LRUCache(cache_size)
+        self._result_cache = LRUCache(cache_size)
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+        self._lexical: Optional[LexicalIndex] = None
+        self._lexical_checked = False
+        self._access_log: Optional[AccessLog] = None
+
+    # --- 初始化 ---
+
+    def _create_embeddings(self):
+        # 后端由 EMBEDDING_BACKEND 选择（hf / onnx / hash），见 app/memory/embedders.py
+        return create_embedder(self.backend)
+
+    def _side_path(self, filename: str) -> str:
+        """
+        与集合配套的 SQLite 辅助文件路径；非默认集合追加集合名后缀，避免不同向量空间共用索引。
+        """
+        stem, ext = os.path.splitext(filename)
+        if self.collection_name != DEFAULT_COLLECTION_NAME:
+            stem = f"{stem}_{self.collection_name}"
+        return os.path.join(os.path.dirname(self.persist_directory), stem + ext)
+
+    def get_store(self):
+        """
+        返回 Chroma 向量库实例；依赖缺失时返回 None。
+        """
+        if self._store is not None:
+            return self._store
+        with self._init_lock:
+            if self._store is not None:
+                return self._store
+            try:
+                from langchain_chroma import Chroma
+                embeddings = self._create_embeddings()
+            except ImportError as e:
+                self._init_error = f"RAG Dependency Import Error: {e}"
+                logger.warning(self._init_error)
+                return None
+            except Exception as e:
+                # 例如 ONNX 模型文件缺失且无法下载
+                self._init_error = f"Embedding backend '{self.backend}' init failed: {e}"
+                logger.warning(self._init_error)
+                return None
+            self._embeddings = embeddings
+            self._store = Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=embeddings,
+                collection_name=self.collection_name
+            )
+            self._ready.set()
+        return self._store
+
+    def warm_up(self, background: bool = True):
+        """
+        预加载嵌入模型与向量库。background=True 时在守护线程中执行并立即返回。
+        """
+        if self._ready.is_set() or (self._warm_thread is not None and self._warm_thread.is_alive()):
+            return self._warm_thread
+
+        def _run():
+            try:
+                if self.get_store() is not None:
+                    # 触发一次前向计算，完成模型权重加载与算子初始化
+                    self.embed_many(["warm up"])
+                    self.ensure_lexical_index()
+            except Exception as e:
+                self._init_error = str(e)
+                logger.warning(f"Memory warm-up failed: {e}")
+
+        if not background:
+            _run()
+            return None
+        self._warm_thread = threading.Thread(target=_run, name="memory-warmup", daemon=True)
+        self._warm_thread.start()
+        return self._warm_thread
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    @property
+    def collection(self):
+        store = self.get_store()
+        return store._collection if store is not None else None
+
+    def count(self) -> int:
+        """
+        集合内文档数量（使用 count 查询，不拉取全部 id）。
+        """
+        collection = self.collection
+        return collection.count() if collection is not None else 0
+
+    # --- 关键词索引 ---
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        if self._lexical is None:
+            path = self._side_path("experience_lexical.sqlite3")
+            self._lexical = LexicalIndex(path)
+        return self._lexical
+
+    def ensure_lexical_index(self, force: bool = False):
+        """
+        倒排索引与集合文档数不一致时（首次启用或外部改动）从集合全量重建。
+        """
+        if self._lexical_checked and not force:
+            return
+        collection = self.collection
+        if collection is None:
+            return
+        with self._write_lock:
+            total = collection.count()
+            if force or self.lexical.count() != total:
+                self.lexical.clear()
+                page = 500
+                for offset in range(0, total, page):
+                    batch = collection.get(include=["documents"], limit=page, offset=offset)
+                    self.lexical.add_many(batch.get("ids") or [], [d or "" for d in batch.get("documents") or []])
+                logger.info(f"Rebuilt lexical index for {total} experiences.")
+            self._lexical_checked = True
+
+    # --- 访问统计 ---
+
+    @property
+    def access_log(self) -> AccessLog:
+        if self._access_log is None:
+            path = self._side_path("experience_access.sqlite3")
+            self._access_log = AccessLog(path)
+        return self._access_log
+
+    def record_access(self, ids: Sequence[str]):
+        try:
+            self.access_log.record(ids)
+        except Exception as e:
+            logger.warning(f"Access log update failed: {e}")
+
+    def delete_many(self, ids: Sequence[str]):
+        """
+        从集合、关键词索引与访问统计中删除文档。
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        collection = self.collection
+        if collection is None:
+            raise RuntimeError(self._init_error or "RAG dependencies missing.")
+        with self._write_lock:
+            collection.delete(ids=ids)
+            try:
+                self.lexical.delete_many(ids)
+            except Exception as e:
+                self._lexical_checked = False
+                logger.warning(f"Lexical index update failed: {e}")
+        self.access_log.delete_many(ids)
+        self.bump_generation()
+
+    def update_many(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        """
+        仅更新元数据（不重新嵌入）。
+        """
+        if not ids:
+            return
+        collection = self.collection
+        if collection is None:
+            raise RuntimeError(self._init_error or "RAG dependencies missing.")
+        with self._write_lock:
+            collection.update(ids=list(ids), metadatas=[dict(m) for m in metadatas])
+        self.bump_generation()
+
+    # --- 缓存 ---
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def bump_generation(self) -> int:
+        """
+        标记集合内容已变化，使所有已缓存的检索结果失效。
+        """
+        with self._generation_lock:
+            self._generation += 1
+            return self._generation
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self._generation,
+            "query_embeddings": self._query_embedding_cache.stats(),
+            "results": self._result_cache.stats(),
+        }
+
+    def embedding_info(self) -> Dict[str, Any]:
+        embeddings = self._embeddings
+        return {
+            "backend": self.backend,
+            "collection": self.collection_name,
+            "loaded": embeddings is not None,
+            "batch_size": getattr(embeddings, "batch_size", None),
+            "threads": getattr(embeddings, "threads", None),
+            "error": self._init_error,
+        }
+
+    @staticmethod
+    def _normalize_query(text: str) -> str:
+        return _WHITESPACE_RE.sub(" ", str(text or "")).strip()
+
+    def _embed_queries(self, queries: Sequence[str]) -> List[List[float]]:
+        vectors: List[Optional[List[float]]] = [self._query_embedding_cache.get(q) for q in queries]
+        missing = [q for q, v in zip(queries, vectors) if v is None]
+        if missing:
+            unique_missing = list(dict.fromkeys(missing))
+            computed = dict(zip(unique_missing, self.embed_many(unique_missing)))
+            for q, v in computed.items():
+                self._query_embedding_cache.put(q, v)
+            vectors = [v if v is not None else computed[q] for q, v in zip(queries, vectors)]
+        return vectors
+
+    # --- 批量接口 ---
+
+    def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.get_store() is None:
+            raise RuntimeError(self._init_error or "RAG dependencies missing.")
+        with self._embed_lock:
+            return self._embeddings.embed_documents(list(texts))
+
+    def add_many(self, documents: Sequence[Any], ids: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        批量写入 langchain Document：一次批量嵌入 + 一次 upsert。相同 id 会被覆盖。
+        """
+        if not documents:
+            return []
+        collection = self.collection
+        if collection is None:
+            raise RuntimeError(self._init_error or "RAG dependencies missing.")
+        doc_ids = list(ids) if ids else [str(uuid.uuid4()) for _ in documents]
+        texts = [doc.page_content for doc in documents]
+        metadatas = [dict(doc.metadata or {}) for doc in documents]
+        embeddings = self.embed_many(texts)
+        with self._write_lock:
+            collection.upsert(ids=doc_ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+            try:
+                self.lexical.add_many(doc_ids, texts)
+            except Exception as e:
+                # 关键词索引失配时在下次混合检索前重建
+                self._lexical_checked = False
+                logger.warning(f"Lexical index update failed: {e}")
+        self.bump_generation()
+        return doc_ids
+
+    def search_many(self, queries: Sequence[str], k: int = 3, where: Optional[Dict[str, Any]] = None) -> List[List[Tuple[Any, float]]]:
+        """
+        批量语义检索。未命中缓存的查询共用一次嵌入前向计算与一次集合查询。
+
+        Returns:
+            每个查询对应的 [(Document, distance)] 列表
+        """
+        if not queries:
+            return []
+        collection = self.collection
+        if collection is None:
+            raise RuntimeError(self._init_error or "RAG dependencies missing.")
+        k = max(1, int(k))
+        normalized = [self._normalize_query(q) for q in queries]
+        where_key = json.dumps(where or {}, sort_keys=True, ensure_ascii=False)
+        generation = self._generation
+        keys = [(q, where_key, k, generation) for q in normalized]
+
+        output: List[Optional[List[Tuple[Any, float]]]] = [self._result_cache.get(key) for key in keys]
+        pending = list(dict.fromkeys(q for q, hit in zip(normalized, output) if hit is None))
+        if pending:
+            fetched = dict(zip(pending, self._query_collection(collection, pending, k, where)))
+            for idx, (q, hit) in enumerate(zip(normalized, output)):
+                if hit is None:
+                    output[idx] = fetched[q]
+                    self._result_cache.put(keys[idx], fetched[q])
+        return [list(hits) for hits in output]
+
+    def search_hybrid(self, query: str, k: int = 3, where: Optional[Dict[str, Any]] = None, rrf_k: int = 60) -> List[Tuple[Any, float]]:
+        """
+        混合检索：BM25 关键词排序与向量排序按 Reciprocal Rank Fusion 融合。
+        适合窗口标题、选择器、文件路径、报错原文等需要精确匹配的经验。
+
+        Returns:
+            [(Document, fused_score)]，按得分降序
+        """
+        collection = self.collection
+        if collection is None:
+            raise RuntimeError(self._init_error or "RAG dependencies missing.")
+        self.ensure_lexical_index()
+        k = max(1, int(k))
+        where_key = json.dumps(where or {}, sort_keys=True, ensure_ascii=False)
+        key = ("hybrid", self._normalize_query(query), where_key, k, self._generation)
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
+        from langchain_core.documents import Document
+        candidates = max(k * 3, 10)
+        vector_hits = self.search_many([query], k=candidates, where=where)[0]
+        docs_by_id = {doc.id: doc for doc, _ in vector_hits}
+        vector_ranking = [doc.id for doc, _ in vector_hits]
+
+        lexical_ranking: List[str] = []
+        lexical_ids = [doc_id for doc_id, _ in self.lexical.search(query, limit=max(k * 5, 20))]
+        if lexical_ids:
+            # 关键词候选同样需要满足元数据过滤条件
+            fetched = collection.get(ids=lexical_ids, where=where or None, include=["documents", "metadatas"])
+            for doc_id, text, meta in zip(fetched.get("ids") or [], fetched.get("documents") or [], fetched.get("metadatas") or []):
+                docs_by_id.setdefault(doc_id, Document(page_content=text or "", metadata=meta or {}, id=doc_id))
+            allowed = set(fetched.get("ids") or [])
+            lexical_ranking = [doc_id for doc_id in lexical_ids if doc_id in allowed]
+
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=rrf_k)[:k]
+        results = [(docs_by_id[doc_id], score) for doc_id, score in fused if doc_id in docs_by_id]
+        self._result_cache.put(key, results)
+        return list(results)
+
+    def _query_collection(self, collection, queries: Sequence[str], k: int, where: Optional[Dict[str, Any]]) -> List[List[Tuple[Any, float]]]:
+        from langchain_core.documents import Document
+        embeddings = self._embed_queries(queries)
+        results = collection.query(
+            query_embeddings=embeddings,
+            n_results=k,
+            where=where or None,
+            include=["documents", "metadatas", "distances"],
+        )
+        output = []
+        for i in range(len(queries)):
+            ids = (results.get("ids") or [[]])[i] or []
+            docs = (results.get("documents") or [[]])[i] or []
+            metas = (results.get("metadatas") or [[]])[i] or []
+            dists = (results.get("distances") or [[]])[i] or []
+            hits = []
+            for j, doc_id in enumerate(ids):
+                doc = Document(page_content=docs[j] or "", metadata=metas[j] or {}, id=doc_id)
+                hits.append((doc, float(dists[j]) if j < len(dists) else 0.0))
+            output.append(hits)
+        return output
+
+# Global instance
+memory_service = MemoryService()
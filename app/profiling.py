@@ -0,0 +1,164 @@
+import json
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+def _get_report_path():
+    # Path: app/data/startup_profile.json
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "startup_profile.json")
+
+def current_rss() -> Optional[int]:
+    """
+    返回当前进程常驻内存 (字节)。优先使用 psutil，缺失时退回到平台原生接口。
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    if platform.system() == "Windows":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return int(counters.WorkingSetSize)
+        except Exception:
+            return None
+        return None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+class StartupProfiler:
+    """
+    启动阶段耗时与内存增量记录器。未启用时 phase() 为空操作。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.started_at: Optional[str] = None
+        self._t0 = 0.0
+        self._rss0: Optional[int] = None
+        self._records: List[Dict[str, Any]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._finished_ms: Optional[float] = None
+
+    def enable(self):
+        self.enabled = True
+        self.started_at = datetime.now().isoformat()
+        self._t0 = time.perf_counter()
+        self._rss0 = current_rss()
+        self._records = []
+        self._finished_ms = None
+
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    @contextmanager
+    def phase(self, name: str, **attrs):
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        rss_before = current_rss()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end = time.perf_counter()
+            rss_after = current_rss()
+            stack.pop()
+            record = {
+                "name": name,
+                "parent": parent,
+                "depth": len(stack),
+                "thread": threading.current_thread().name,
+                "start_ms": round((start - self._t0) * 1000, 2),
+                "wall_ms": round((end - start) * 1000, 2),
+                "rss_delta_kb": (rss_after - rss_before) // 1024 if rss_before is not None and rss_after is not None else None,
+                "rss_after_kb": rss_after // 1024 if rss_after is not None else None,
+            }
+            if attrs:
+                record.update(attrs)
+            if error:
+                record["error"] = error
+            with self._lock:
+                self._records.append(record)
+
+    def finish(self):
+        if self.enabled and self._finished_ms is None:
+            self._finished_ms = round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            records = sorted(self._records, key=lambda r: r["start_ms"])
+        modules = [r for r in records if r.get("kind") == "module"]
+        packages = [r for r in records if r.get("kind") == "package"]
+        rss_now = current_rss()
+        return {
+            "started_at": self.started_at,
+            "total_ms": self._finished_ms if self._finished_ms is not None else round((time.perf_counter() - self._t0) * 1000, 2),
+            "rss_start_kb": self._rss0 // 1024 if self._rss0 is not None else None,
+            "rss_now_kb": rss_now // 1024 if rss_now is not None else None,
+            "phases": records,
+            "slowest_packages": sorted(packages, key=lambda r: r["wall_ms"], reverse=True)[:10],
+            "slowest_modules": sorted(modules, key=lambda r: r["wall_ms"], reverse=True)[:10],
+        }
+
+    def write_report(self, path: Optional[str] = None) -> str:
+        path = path or _get_report_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return path
+
+def load_startup_report() -> Optional[Dict[str, Any]]:
+    """
+    读取最近一次写入磁盘的启动报告。
+    """
+    path = _get_report_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+# Global instance
+profiler = StartupProfiler()
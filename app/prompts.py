@@ -2,13 +2,14 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import BaseTool
 from typing import List
 
-def get_agent_prompt(tools: List[BaseTool] = None):
+# 系统提示词布局版本：静态的人格与规则在前、动态的技能目录在后，修改静态部分时递增，
+# 便于对照提供方的前缀缓存命中率（DeepSeek/OpenAI prompt caching、llama.cpp prefix reuse）
+PROMPT_VERSION = "4"
+
+def format_skill_catalogue(tools: List[BaseTool] = None) -> str:
     """
-    获取 Agent 的提示词模板。
-    动态生成 Skill 描述信息，面向通用桌面与网页自动化任务。
+    按传入顺序生成技能目录（load_skills 已按名称排序，按轮检索时核心工具在前），同一组工具总是得到相同的文本。
     """
-    
-    # 动态构建技能描述
     skills_desc = "你当前拥有的技能列表 (Skills):\n"
     if tools:
         for tool in tools:
@@ -17,9 +18,18 @@ def get_agent_prompt(tools: List[BaseTool] = None):
             skills_desc += f"- {tool.name}: {desc}\n"
     else:
         skills_desc += "(暂无可用技能)"
+    return skills_desc
+
+def get_agent_prompt(tools: List[BaseTool] = None):
+    """
+    获取 Agent 的提示词模板。
+    动态生成 Skill 描述信息，面向通用桌面与网页自动化任务。
+    技能目录放在系统消息末尾，技能重载只改变提示词的尾部，前面的静态部分仍可命中前缀缓存。
+    """
+    # 技能描述中的花括号需转义，避免被当作模板变量
+    skills_desc = format_skill_catalogue(tools).replace("{", "{{").replace("}", "}}")
 
     system_message = f"""你叫小冬瓜，是个具备自我进化能力的自动化 Agent。
-{skills_desc}
 
 === 人格与习惯（可养成）===
 你需要表现出稳定、可辨识的性格与表达习惯，并且会随着使用逐步“养成”更贴合用户偏好的做事方式。
@@ -43,10 +53,13 @@ def get_agent_prompt(tools: List[BaseTool] = None):
    - 简单任务：直接执行，**无需**检索经验或创建计划。
    - 复杂任务 (>3步)：**必须**先调用 `get_operation_experience` 检索经验，然后调用 `create_task_plan` 创建计划。
 2. **拆解与规划 (Plan - 仅复杂任务)**：
+   - **依赖与资源**：步骤可写成 `{{{{"desc": ..., "depends_on": [前置步骤ID], "resource": "desktop|browser|file|network"}}}}`；相互独立的步骤不写依赖。
+   - **并行执行**：有多个相互独立的步骤时调用 `run_plan_steps`，由子 Agent 并行执行所有就绪步骤并写回结果；失败的步骤自行处理后调用 `mark_task_completed`。
    - **循环执行机制**：每次调用 `read_task_plan` 获取一个子任务 -> 执行该子任务 -> **执行完后必须立即调用 `mark_task_completed`** (否则会无限重复执行该子任务)。
    - **结束条件**：当所有子任务都完成后，输出 `STATE: DONE`。
 3. **技能检查 (Check)**：
    - 对比任务需求与现有 `Skills`。
+   - 技能目录只列出与本轮任务最相关的工具；没有合适工具时先调用 `search_tools` 检索。
    - **若缺失技能**：立即暂停业务逻辑，按序执行 `scaffold_skill` -> `write_tool_code` -> `reload_skills`。
    - **严禁**在无代码变更时单纯调用 `reload_skills` (防止死循环)。
 4. **执行 (Execute)**：仅在技能齐备时执行业务逻辑。
@@ -58,7 +71,33 @@ def get_agent_prompt(tools: List[BaseTool] = None):
 **Check**: 缺翻页技能 -> 决定生成 `web_pagination_skill`。
 **Action**: 调用生成工具...
 STATE: CONTINUE
-"""
+
+=== 技能目录 ===
+{skills_desc}"""
+
+    return ChatPromptTemplate.from_messages([
+        ("system", system_message),
+        MessagesPlaceholder(variable_name="chat_history", optional=True),
+        ("user", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+
+def get_sub_agent_prompt(tools: List[BaseTool] = None):
+    """
+    计划调度器中子 Agent 的提示词：只负责执行单个子任务，不读写人格记忆、不创建计划。
+    """
+    skills_desc = format_skill_catalogue(tools).replace("{", "{{").replace("}", "}}")
+
+    system_message = f"""你是小冬瓜的子任务执行助手，只负责完成主 Agent 交给你的一个子任务。
+
+=== 规则 ===
+1. 只完成"当前子任务"描述的内容，不要执行计划中的其他步骤，也不要创建或修改任务计划。
+2. 工具优先：纯文本任务使用文件操作工具，网页操作优先使用 playwright。
+3. 前置步骤的结果已在输入中给出，直接使用，不要重复执行。
+4. 完成后用一两句话总结结果（产出的文件路径、关键数据等），供主 Agent 汇总；无法完成时说明原因。
+
+=== 技能目录 ===
+{skills_desc}"""
 
     return ChatPromptTemplate.from_messages([
         ("system", system_message),
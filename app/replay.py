@@ -0,0 +1,287 @@
+import json
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# 参数表达式中的变量引用：{name} 或 {name.field.0}；{{ 与 }} 表示字面花括号
+_PLACEHOLDER_RE = re.compile(r"\{\{|\}\}|\{([A-Za-z_][\w]*(?:\.[\w]+)*)\}")
+
+_INPUT_TYPES = {"str", "int", "float", "bool", "list", "dict"}
+_PREDICATE_KEYS = {"contains", "not_contains", "regex", "not_regex", "json"}
+
+# 步骤未记录 expect 时的默认判定：结果以错误/失败提示开头视为失败（工具以字符串或 success=False 的字典返回错误）
+_ERROR_RESULT_RE = re.compile(r"^\s*(错误|Error|ERROR|失败|\S{0,20}失败[:：])")
+
+_PREVIEW_CHARS = 300
+
+class ReplayError(Exception):
+    """
+    模板脚本格式错误、输入缺失或参数表达式引用了未知变量。
+    """
+
+def is_error_result(result: Any) -> bool:
+    """
+    工具结果是否为错误：以错误/失败提示开头的字符串，或 success 为 False / error 非空的字典（含其 JSON 文本）。
+    """
+    if isinstance(result, str):
+        if _ERROR_RESULT_RE.search(result):
+            return True
+        if not result.lstrip().startswith("{"):
+            return False
+        try:
+            result = json.loads(result)
+        except ValueError:
+            return False
+    if isinstance(result, dict):
+        return result.get("success") is False or bool(result.get("error"))
+    return False
+
+def _preview(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= _PREVIEW_CHARS else text[:_PREVIEW_CHARS] + "..."
+
+# --- 编译 ---
+
+def _compile_inputs(inputs: Sequence[Any]) -> List[Dict[str, Any]]:
+    compiled = []
+    for item in inputs or []:
+        # 旧模板的 inputs 是描述字符串，按 str 类型的必填参数处理
+        if isinstance(item, str):
+            item = {"name": item}
+        if not isinstance(item, dict) or not item.get("name"):
+            raise ReplayError(f"无效的输入定义: {item}")
+        input_type = item.get("type") or "str"
+        if input_type not in _INPUT_TYPES:
+            raise ReplayError(f"输入 {item['name']} 的类型 {input_type} 不受支持")
+        spec = {"name": str(item["name"]), "type": input_type, "description": item.get("description") or ""}
+        if "default" in item:
+            spec["default"] = item["default"]
+        compiled.append(spec)
+    return compiled
+
+def compile_script(template: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    校验模板中的 script（工具调用序列）。没有 script 时返回 None，格式错误时抛出 ReplayError。
+
+    script 的每一步: {"tool": 工具名, "args": {参数: 表达式}, "save_as": 变量名, "expect": 成功判定}。
+    表达式中的 {name} 引用 inputs 或之前步骤 save_as 保存的结果（JSON 结果可用 {name.field} 取字段）；
+    整个字符串只有一个引用时保留原始类型。expect 支持 contains / not_contains / regex / not_regex / json。
+    """
+    steps = template.get("script")
+    if not steps:
+        return None
+    if not isinstance(steps, list):
+        raise ReplayError("script 必须是步骤列表")
+    compiled = []
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict) or not step.get("tool"):
+            raise ReplayError(f"script 第 {i + 1} 步缺少 tool")
+        args = step.get("args") or {}
+        if not isinstance(args, dict):
+            raise ReplayError(f"script 第 {i + 1} 步的 args 必须是对象")
+        expect = step.get("expect")
+        if expect is not None and (not isinstance(expect, dict) or set(expect) - _PREDICATE_KEYS):
+            raise ReplayError(f"script 第 {i + 1} 步的 expect 只支持 {'/'.join(sorted(_PREDICATE_KEYS))}")
+        compiled.append({
+            "tool": str(step["tool"]),
+            "args": args,
+            "save_as": step.get("save_as") or None,
+            "expect": expect,
+        })
+    return {"inputs": _compile_inputs(template.get("inputs")), "steps": compiled}
+
+# --- 输入 ---
+
+def _coerce(value: Any, input_type: str) -> Any:
+    if input_type == "str":
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    if input_type == "int":
+        return int(value)
+    if input_type == "float":
+        return float(value)
+    if input_type == "bool":
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "y", "是")
+        return bool(value)
+    if isinstance(value, str):
+        value = json.loads(value)
+    expected = list if input_type == "list" else dict
+    if not isinstance(value, expected):
+        raise ValueError(f"需要 {input_type}")
+    return value
+
+def resolve_inputs(specs: Sequence[Dict[str, Any]], values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按输入定义补默认值并转换类型；缺少必填输入或类型转换失败时抛出 ReplayError。
+    """
+    resolved = {}
+    for spec in specs:
+        name = spec["name"]
+        value = values.get(name)
+        if value is None or value == "":
+            if "default" not in spec:
+                raise ReplayError(f"缺少输入 {name}")
+            value = spec["default"]
+        try:
+            resolved[name] = _coerce(value, spec["type"])
+        except (TypeError, ValueError) as e:
+            raise ReplayError(f"输入 {name} 无法转换为 {spec['type']}: {e}")
+    return resolved
+
+def extract_inputs(llm, specs: Sequence[Dict[str, Any]], user_input: str) -> Dict[str, Any]:
+    """
+    一次 LLM 调用从用户需求中抽取模板输入，返回 {name: value}；解析失败时返回空字典。
+    """
+    if not specs:
+        return {}
+    fields = "\n".join(
+        f"- {s['name']} ({s['type']}){': ' + s['description'] if s['description'] else ''}"
+        + (f"，默认 {json.dumps(s['default'], ensure_ascii=False)}" if "default" in s else "")
+        for s in specs
+    )
+    prompt = (
+        "从用户需求中提取以下参数，只输出一个 JSON 对象，键为参数名；需求中没有提到的参数省略。\n"
+        f"参数:\n{fields}\n\n用户需求：{user_input}"
+    )
+    try:
+        text = llm.invoke(prompt).content
+        match = re.search(r"\{.*\}", text if isinstance(text, str) else str(text), re.S)
+        data = json.loads(match.group(0)) if match else {}
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+# --- 执行 ---
+
+def _lookup(path: str, variables: Dict[str, Any]) -> Any:
+    name, *fields = path.split(".")
+    if name not in variables:
+        raise ReplayError(f"未知变量 {name}")
+    value = variables[name]
+    for field in fields:
+        # 工具结果按原文保存，取字段时再按 JSON 解析
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise ReplayError(f"变量 {name} 不是 JSON，无法取字段 {path}")
+        try:
+            value = value[int(field)] if isinstance(value, list) else value[field]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise ReplayError(f"变量 {path} 不存在")
+    return value
+
+def render(value: Any, variables: Dict[str, Any]) -> Any:
+    """
+    把参数表达式中的变量引用替换为实际值（递归处理列表与对象）。
+    """
+    if isinstance(value, dict):
+        return {k: render(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, variables) for v in value]
+    if not isinstance(value, str):
+        return value
+    whole = _PLACEHOLDER_RE.fullmatch(value)
+    if whole and whole.group(1):
+        return _lookup(whole.group(1), variables)
+
+    def substitute(match):
+        if match.group(1) is None:
+            return match.group(0)[0]
+        found = _lookup(match.group(1), variables)
+        return found if isinstance(found, str) else json.dumps(found, ensure_ascii=False)
+
+    return _PLACEHOLDER_RE.sub(substitute, value)
+
+def check_expect(result: Any, expect: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    按成功判定检查工具结果，通过返回 None，否则返回原因。
+    """
+    if expect is None:
+        return "结果为错误提示" if is_error_result(result) else None
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+
+    def as_list(value):
+        return value if isinstance(value, list) else [value]
+
+    for needle in as_list(expect.get("contains") or []):
+        if str(needle) not in text:
+            return f"结果不包含 {needle!r}"
+    for needle in as_list(expect.get("not_contains") or []):
+        if str(needle) in text:
+            return f"结果包含 {needle!r}"
+    if expect.get("regex") and not re.search(expect["regex"], text):
+        return f"结果不匹配 {expect['regex']!r}"
+    if expect.get("not_regex") and re.search(expect["not_regex"], text):
+        return f"结果匹配 {expect['not_regex']!r}"
+    if expect.get("json"):
+        try:
+            json.loads(text)
+        except Exception:
+            return "结果不是 JSON"
+    return None
+
+def run_script(script: Dict[str, Any], tools: Dict[str, Any], inputs: Dict[str, Any],
+               invoke: Optional[Callable[[Any, Dict[str, Any]], Any]] = None) -> Dict[str, Any]:
+    """
+    按顺序直接调用脚本中的工具，不经过 LLM。某一步抛出异常、工具不存在或结果未通过判定时停止。
+
+    invoke(tool, args) 执行单个工具，默认 tool.invoke(args)；调用方可借此加资源锁、挂回调。
+    Returns: {"ok", "steps": [{tool, args, result, ok, duration_s}], "failed_at", "reason", "elapsed_s"}
+    """
+    invoke = invoke or (lambda tool, args: tool.invoke(args))
+    variables = dict(inputs)
+    report: Dict[str, Any] = {"ok": True, "steps": [], "failed_at": None, "reason": None}
+    started = time.time()
+    for i, step in enumerate(script["steps"]):
+        record = {"tool": step["tool"], "args": None, "result": None, "ok": False}
+        report["steps"].append(record)
+        step_started = time.time()
+        try:
+            tool = tools.get(step["tool"])
+            if tool is None:
+                raise ReplayError(f"工具 {step['tool']} 不存在")
+            record["args"] = render(step["args"], variables)
+            result = invoke(tool, record["args"])
+            record["result"] = result
+            reason = check_expect(result, step["expect"])
+        except Exception as e:
+            reason = f"{type(e).__name__}: {e}"
+        record["duration_s"] = round(time.time() - step_started, 3)
+        if reason:
+            report.update(ok=False, failed_at=i, reason=reason)
+            break
+        record["ok"] = True
+        if step["save_as"]:
+            variables[step["save_as"]] = record["result"]
+    report["elapsed_s"] = round(time.time() - started, 3)
+    return report
+
+def format_fallback_input(preview: str, user_input: str, report: Dict[str, Any]) -> str:
+    """
+    回放中途失败时交给 LLM 的输入：模板、已完成步骤的结果与失败原因，从失败的步骤继续。
+    """
+    done = [s for s in report["steps"] if s["ok"]]
+    failed = report["steps"][report["failed_at"]]
+    parts = [f"请按以下模板执行任务：\n{preview}"]
+    if done:
+        parts.append("模板脚本已自动完成以下步骤（不要重复执行）：\n" + "\n".join(
+            f"{i + 1}. {s['tool']}({_preview(s['args'])}) -> {_preview(s['result'])}" for i, s in enumerate(done)
+        ))
+    parts.append(
+        f"第 {report['failed_at'] + 1} 步 {failed['tool']}({_preview(failed['args'])}) 未通过校验：{report['reason']}"
+        + (f"\n结果：{_preview(failed['result'])}" if failed["result"] is not None else "")
+        + "\n请从这一步起继续完成任务。"
+    )
+    parts.append(f"用户需求：{user_input}")
+    return "\n\n".join(parts)
+
+def format_replay_output(template: Dict[str, Any], report: Dict[str, Any]) -> str:
+    last = report["steps"][-1]["result"] if report["steps"] else ""
+    # 由 /macro 蒸馏的模板带有录制时的耗时，便于对比回放的加速效果
+    recorded = template.get("recorded_duration_s")
+    baseline = f"，录制时 {recorded}s / {template.get('recorded_llm_calls') or 0} 次模型调用" if recorded else ""
+    return (
+        f"已按模板「{template.get('name') or '未命名模板'}」直接执行 {len(report['steps'])} 个步骤"
+        f"（{report['elapsed_s']}s，未调用模型规划{baseline}）。\n最后一步结果：{_preview(last)}"
+    )
@@ -0,0 +1,207 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.context import DEFAULT_SESSION_ID, current_session_id, normalize_session_id
+
+class Session:
+    """
+    单个会话的运行状态：独立的输入队列、AgentExecutor 与对话历史（任务计划按会话 ID 存放，见 app/task_store.py）。
+    """
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.inbox: "queue.Queue[str]" = queue.Queue()
+        self.executor = None
+        self.history = None
+        self.model_generation = -1
+        self.executor_generation = 0
+        self.skills_generation = 0
+        self.active = False
+        self.turns = 0
+        self.created_at = time.time()
+        self.last_active = self.created_at
+
+    def get_input(self, block: bool = True, timeout: Optional[float] = None) -> str:
+        """
+        在本会话的一轮处理中等待用户的下一条输入（例如模板确认）。
+        """
+        return self.inbox.get(block=block, timeout=timeout)
+
+class SessionManager:
+    """
+    多会话 Agent 运行时。
+
+    每个会话有自己的输入队列、AgentExecutor 与历史；有输入的会话被调度到容量为
+    AGENT_MAX_CONCURRENCY（默认 2）的工作线程池上，同一会话内的输入按顺序处理。
+    会话之间的互斥只发生在工具层：声明了独占资源（桌面、浏览器）的工具由 SkillAgentExecutor 串行化。
+    """
+    def __init__(self, max_workers: Optional[int] = None, idle_ttl_minutes: Optional[float] = None):
+        self.max_workers = int(max_workers or os.getenv("AGENT_MAX_CONCURRENCY") or 2)
+        self.idle_ttl = float(idle_ttl_minutes or os.getenv("AGENT_SESSION_TTL_MINUTES") or 120) * 60
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Session] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._handler: Optional[Callable[[Session, str], Any]] = None
+        self._history_factory: Optional[Callable[[], Any]] = None
+        self._executor_factory: Optional[Callable[[], Any]] = None
+        self._model_generation = 0
+        self._executor_generation = 0
+        self._skills_generation = 0
+        self._tools: Optional[List[Any]] = None
+
+    def start(self, handler: Callable[[Session, str], Any], history_factory: Callable[[], Any], executor_factory: Optional[Callable[[], Any]] = None):
+        """
+        handler(session, text) 处理一条输入（运行 Agent 的一轮）；history_factory 为新会话创建历史。
+        """
+        if executor_factory is None:
+            from app.agent import create_agent_executor
+            executor_factory = create_agent_executor
+        self._handler = handler
+        self._history_factory = history_factory
+        self._executor_factory = executor_factory
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-session")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for session in self._sessions.values():
+                if session.history is not None:
+                    session.history.close()
+
+    # --- 会话 ---
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        session_id = normalize_session_id(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                self._evict_idle()
+                session = self._sessions[session_id] = Session(session_id)
+            return session
+
+    def _evict_idle(self):
+        now = time.time()
+        for session_id, session in list(self._sessions.items()):
+            if session_id == DEFAULT_SESSION_ID or session.active or not session.inbox.empty():
+                continue
+            if now - session.last_active > self.idle_ttl:
+                del self._sessions[session_id]
+                if session.history is not None:
+                    session.history.close()
+
+    def prepare(self, session: Session):
+        """
+        确保会话的 executor 与历史可用：首次使用时创建；模型切换后重建并清空历史；
+        释放 LLM 缓存后重建但保留历史；技能重载后同步工具列表。
+        """
+        if session.history is None:
+            session.history = self._history_factory()
+        model_changed = session.model_generation != self._model_generation
+        if session.executor is None or model_changed or session.executor_generation != self._executor_generation:
+            if session.executor is not None and model_changed:
+                session.history.clear()
+            session.executor = self._executor_factory()
+            session.model_generation = self._model_generation
+            session.executor_generation = self._executor_generation
+            session.skills_generation = self._skills_generation
+        elif session.skills_generation != self._skills_generation and self._tools is not None:
+            session.executor.patch_tools(self._tools)
+            session.skills_generation = self._skills_generation
+        return session
+
+    # --- 调度 ---
+
+    def submit(self, session_id: Optional[str], text: str) -> Session:
+        """
+        把输入放入会话队列；会话空闲时调度到工作线程池，正在运行时由当前工作线程接着处理。
+        """
+        session = self.get(session_id)
+        with self._lock:
+            session.inbox.put(text)
+            session.last_active = time.time()
+            if session.active:
+                return session
+            session.active = True
+        self._pool.submit(self._drain, session)
+        return session
+
+    def _drain(self, session: Session):
+        token = current_session_id.set(session.id)
+        try:
+            while True:
+                with self._lock:
+                    try:
+                        text = session.inbox.get_nowait()
+                    except queue.Empty:
+                        session.active = False
+                        return
+                try:
+                    self.prepare(session)
+                    self._handler(session, text)
+                except Exception as e:
+                    from app.events import say
+                    say(f"❌ 发生错误: {e}", role="system")
+                finally:
+                    session.turns += 1
+                    session.last_active = time.time()
+        finally:
+            current_session_id.reset(token)
+
+    # --- 全局变更 ---
+
+    def set_model(self, provider: str):
+        """
+        切换 LLM_PROVIDER：先创建一个 executor 校验配置，成功后各会话在下一轮开始时重建并清空历史。
+        失败时恢复原配置并抛出异常。
+        """
+        previous_provider = os.getenv("LLM_PROVIDER", "deepseek")
+        os.environ["LLM_PROVIDER"] = provider
+        try:
+            self._executor_factory()
+        except Exception:
+            os.environ["LLM_PROVIDER"] = previous_provider
+            raise
+        with self._lock:
+            self._model_generation += 1
+
+    def evict_llms(self, provider: Optional[str] = None) -> int:
+        """
+        释放缓存的 LLM 客户端（本地模型常驻内存）；各会话在下一轮开始时重建 executor，旧实例随之回收。
+        """
+        from app.agent import evict_llm_cache
+        evicted = evict_llm_cache(provider)
+        with self._lock:
+            self._executor_generation += 1
+        return evicted
+
+    def skills_reloaded(self, session: Session):
+        """
+        某个会话完成技能热加载后调用：其他会话在下一轮开始时同步新的工具列表。
+        """
+        with self._lock:
+            self._skills_generation += 1
+            self._tools = list(session.executor.tools)
+            session.skills_generation = self._skills_generation
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = [{
+                "id": session.id,
+                "active": session.active,
+                "queued": session.inbox.qsize(),
+                "turns": session.turns,
+                "history_tokens": session.history.total_tokens if session.history is not None else 0,
+                "last_active": round(session.last_active, 3),
+            } for session in self._sessions.values()]
+        return {
+            "max_workers": self.max_workers,
+            "running": sum(1 for s in sessions if s["active"]),
+            "sessions": sessions,
+        }
+
+# Global instance
+session_manager = SessionManager()
@@ -0,0 +1,130 @@
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from app.task_store import EXCLUSIVE_STEP_RESOURCE, TaskStore, task_store
+
+def _plan_parallelism() -> int:
+    return int(os.getenv("PLAN_PARALLELISM") or 3)
+
+def _strip_state(output: str) -> str:
+    lines = [line for line in (output or "").strip().splitlines() if line.strip()]
+    if lines and lines[-1].strip().upper().startswith("STATE:"):
+        lines = lines[:-1]
+    return "\n".join(lines).strip()
+
+def format_step_input(step: Dict[str, Any], outline: str) -> str:
+    """
+    子 Agent 的输入：计划概要、前置步骤结果与当前子任务。
+    """
+    parts = [f"总体计划:\n{outline}"]
+    results = step.get("dependency_results") or {}
+    if results:
+        parts.append("前置步骤结果:\n" + "\n".join(f"- 步骤 {dep}: {result}" for dep, result in sorted(results.items())))
+    parts.append(f"当前子任务 (步骤 {step['id']}): {step['desc']}")
+    return "\n\n".join(parts)
+
+def run_sub_agent(step: Dict[str, Any], outline: str) -> str:
+    """
+    默认的步骤执行器：新建子 Agent（空历史），按子任务检索绑定工具后执行，返回去掉 STATE 行的结果。
+    """
+    from app.agent import create_sub_agent_executor
+
+    text = format_step_input(step, outline)
+    executor = create_sub_agent_executor()
+    executor.bind_tools_for(text, clear_pins=False)
+    output = _strip_state(executor.invoke({"input": text, "chat_history": []}).get("output", ""))
+    if not output:
+        raise RuntimeError("子 Agent 没有返回结果")
+    return output
+
+class PlanScheduler:
+    """
+    把会话当前计划中依赖已满足的步骤并行交给子 Agent 执行。
+
+    每次从 TaskStore 认领就绪步骤（至多 PLAN_PARALLELISM 个同时运行，desktop 步骤同一时刻只有一个，
+    且整步持有桌面资源锁，与其他会话的桌面工具互斥），任一步骤结束后立即写回结果并认领新就绪的步骤，
+    直到没有可运行的步骤。失败的步骤记为 failed，依赖它的步骤留给主 Agent 处理。
+    """
+    def __init__(self, store: Optional[TaskStore] = None, runner: Optional[Callable[[Dict[str, Any], str], str]] = None):
+        self.store = store or task_store
+        self.runner = runner or run_sub_agent
+
+    def _execute(self, step: Dict[str, Any], outline: str) -> str:
+        from app.events import say
+
+        say(f"▶ 子任务 {step['id']}: {step['desc']}", role="system")
+        if step.get("resource") != EXCLUSIVE_STEP_RESOURCE:
+            return self.runner(step, outline)
+        from app.agent import get_resource_lock
+        with get_resource_lock(EXCLUSIVE_STEP_RESOURCE):
+            return self.runner(step, outline)
+
+    def _outline(self, plan_id: int) -> str:
+        plan = self.store.get_plan(plan_id) or {"steps": []}
+        lines = []
+        for s in plan["steps"]:
+            deps = f" (依赖 {', '.join(map(str, s['depends_on']))})" if s.get("depends_on") else ""
+            lines.append(f"{s['id']}. {s['desc']}{deps}")
+        return "\n".join(lines)
+
+    def _record(self, session: str, step: Dict[str, Any], future) -> Dict[str, Any]:
+        """
+        把已结束步骤的结果写回 TaskStore，返回 {"id", "result" 或 "error", "duration_s"}。
+        """
+        duration = round(time.time() - step["_started"], 3)
+        try:
+            result = future.result()
+        except BaseException as e:
+            self.store.fail_step(session, step["plan_id"], step["id"], f"{type(e).__name__}: {e}")
+            return {"id": step["id"], "error": str(e), "duration_s": duration}
+        self.store.complete_step(session, step["id"], result, plan_id=step["plan_id"])
+        return {"id": step["id"], "result": result, "duration_s": duration}
+
+    def run(self, session: str, max_parallel: Optional[int] = None) -> Dict[str, Any]:
+        """
+        运行到没有就绪步骤为止。Returns: {"completed": [...], "failed": [...], "elapsed_s"}。
+        """
+        from app.events import event_bus
+
+        max_parallel = max(1, int(max_parallel or _plan_parallelism()))
+        started = time.time()
+        completed: List[Dict[str, Any]] = []
+        failed: List[Dict[str, Any]] = []
+        running: Dict[Any, Dict[str, Any]] = {}
+        outlines: Dict[int, str] = {}
+        pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="plan-step")
+        try:
+            while True:
+                free = max_parallel - len(running)
+                if free > 0:
+                    busy = {s.get("resource") for s in running.values()} & {EXCLUSIVE_STEP_RESOURCE}
+                    for step in self.store.claim_ready(session, free, busy):
+                        outline = outlines.get(step["plan_id"])
+                        if outline is None:
+                            outline = outlines[step["plan_id"]] = self._outline(step["plan_id"])
+                        step["_started"] = time.time()
+                        # 复制上下文，子 Agent 的事件与工具仍归属当前会话
+                        future = pool.submit(contextvars.copy_context().run, self._execute, step, outline)
+                        running[future] = step
+                if not running:
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    outcome = self._record(session, step, future)
+                    (completed if "result" in outcome else failed).append(outcome)
+                    if "result" in outcome:
+                        event_bus.metric("plan_step", outcome["duration_s"], step=step["id"], resource=step.get("resource"))
+        finally:
+            # 被中断（如 KeyboardInterrupt）时子 Agent 线程仍在运行：步骤保持 running，不会被再次认领，
+            # 结束后由回调写回结果；进程退出导致的残留 running 步骤在下次打开 TaskStore 时放回 pending
+            for future, step in running.items():
+                future.add_done_callback(lambda f, step=step: self._record(session, step, f))
+            pool.shutdown(wait=False, cancel_futures=True)
+        return {"completed": completed, "failed": failed, "elapsed_s": round(time.time() - started, 3)}
+
+# Global instance
+plan_scheduler = PlanScheduler()
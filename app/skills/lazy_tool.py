@@ -0,0 +1,81 @@
+import importlib
+import inspect
+import threading
+from typing import Any, Dict, Optional
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, ToolException
+from langchain_core.tools.base import _get_runnable_config_param
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+def extract_tool_schema(attr_name: str, tool: BaseTool) -> Dict[str, Any]:
+    """
+    提取工具的名称、描述与参数 JSON Schema，写入 Skill manifest。
+    """
+    parameters = convert_to_openai_tool(tool)["function"].get("parameters") or {"type": "object", "properties": {}}
+    metadata = tool.metadata if isinstance(tool.metadata, dict) else {}
+    return {
+        "attr": attr_name,
+        "name": tool.name,
+        "description": tool.description,
+        "args_schema": parameters,
+        "return_direct": bool(tool.return_direct),
+        "metadata": metadata,
+    }
+
+class LazySkillTool(BaseTool):
+    """
+    工具代理：只携带 manifest 中的名称、描述与参数 Schema，首次调用时才导入真实模块。
+    """
+    module_name: str
+    attr_name: str
+    handle_tool_error: bool = True
+
+    _target: Optional[BaseTool] = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def from_manifest(cls, module_name: str, spec: Dict[str, Any]) -> "LazySkillTool":
+        return cls(
+            name=spec["name"],
+            description=spec.get("description") or "",
+            args_schema=spec.get("args_schema") or {"type": "object", "properties": {}},
+            return_direct=bool(spec.get("return_direct")),
+            metadata=dict(spec.get("metadata") or {}),
+            module_name=module_name,
+            attr_name=spec.get("attr") or spec["name"],
+        )
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._target is not None
+
+    def resolve(self) -> BaseTool:
+        if self._target is not None:
+            return self._target
+        with self._lock:
+            if self._target is None:
+                try:
+                    module = importlib.import_module(self.module_name)
+                except Exception as e:
+                    raise ToolException(f"工具 {self.name} 加载失败: 无法导入 {self.module_name}: {e}") from e
+                obj = getattr(module, self.attr_name, None)
+                if inspect.isclass(obj) and issubclass(obj, BaseTool):
+                    obj = obj()
+                if not isinstance(obj, BaseTool):
+                    raise ToolException(f"工具 {self.name} 加载失败: {self.module_name} 中不存在 {self.attr_name}")
+                self._target = obj
+        return self._target
+
+    def _run(self, *args, config: RunnableConfig, run_manager: Optional[CallbackManagerForToolRun] = None, **kwargs):
+        target = self.resolve()
+        tool_input = kwargs if kwargs else (args[0] if args else {})
+        # 直接执行真实工具的 _run 并沿用本次调用的 run_manager/config：工具内部的嵌套调用（如子 Agent）
+        # 仍挂在父回调下，同时不会为同一次调用再触发一组工具事件
+        tool_args, tool_kwargs = target._to_args_and_kwargs(tool_input, None)
+        if inspect.signature(target._run).parameters.get("run_manager"):
+            tool_kwargs["run_manager"] = run_manager
+        if config_param := _get_runnable_config_param(target._run):
+            tool_kwargs[config_param] = config
+        return target._run(*tool_args, **tool_kwargs)
@@ -1,136 +1,480 @@
 import importlib
+import importlib.util
+import logging
 import pkgutil
 import inspect
+import hashlib
+import json
 import os
 import sys
-from typing import List, Dict, Any
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.tools import BaseTool
+from app.skills.lazy_tool import LazySkillTool, extract_tool_schema
+from app.skills.tool_index import tool_index
+from app.profiling import profiler
 
-def _read_skill_entry(skill_md_path: str):
+logger = logging.getLogger(__name__)
+
+REGISTRY_INDEX_VERSION = 1
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = "skill_manifest.json"
+
+# 进程内注册表状态：模块名 -> {"fingerprint": {...}, "tools": [...]}
+_REGISTRY_LOCK = threading.RLock()
+_MODULE_CACHE: Dict[str, Dict[str, Any]] = {}
+_LAST_CHANGES: Dict[str, List[str]] = {"added": [], "changed": [], "removed": []}
+
+def _get_index_path():
+    # Path: app/data/skill_index.json
+    # This file: app/skills/registry.py
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(app_dir, "data", "skill_index.json")
+
+def _load_index() -> Dict[str, Any]:
+    path = _get_index_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if isinstance(index, dict) and index.get("version") == REGISTRY_INDEX_VERSION:
+            return index
+    except Exception:
+        pass
+    return {"version": REGISTRY_INDEX_VERSION, "packages": {}}
+
+def _save_index(index: Dict[str, Any]):
+    path = _get_index_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Registry Warning: Failed to save index {path}: {e}")
+
+def _file_fingerprint(path: str, previous: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    计算文件指纹。mtime 与 size 均未变化时直接复用上次的 sha1，避免重复读取文件。
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if previous and previous.get("mtime_ns") == st.st_mtime_ns and previous.get("size") == st.st_size:
+        return dict(previous)
+    try:
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha1": digest}
+
+def _lazy_import_enabled() -> bool:
+    return (os.getenv("SKILL_LAZY_IMPORT") or "1").strip().lower() not in {"0", "false", "no", "off"}
+
+def _load_manifest(manifest_path: Optional[str], entry: str) -> Dict[str, Any]:
+    empty = {"version": MANIFEST_VERSION, "entry": entry, "modules": {}}
+    if not manifest_path or not os.path.exists(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:
+        return empty
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION or manifest.get("entry") != entry:
+        return empty
+    return manifest
+
+def _save_manifest(manifest_path: str, manifest: Dict[str, Any]):
+    try:
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+    except Exception as e:
+        logger.warning(f"Registry Warning: Failed to save manifest {manifest_path}: {e}")
+
+def _read_skill_section(skill_md_path: str, section: str) -> Optional[List[str]]:
+    """
+    读取 skill.md 中 "## <section>" 下的非空行（到下一个标题为止）；文件或小节不存在时返回 None。
+    """
     try:
         with open(skill_md_path, "r", encoding="utf-8") as f:
             lines = [line.strip() for line in f.readlines()]
     except Exception:
         return None
+    header = f"## {section}".lower()
     for idx, line in enumerate(lines):
-        if line.lower() == "## entry":
-            j = idx + 1
-            while j < len(lines) and not lines[j]:
-                j += 1
-            if j < len(lines):
-                entry = lines[j].strip()
-                return entry or None
-            return None
+        if line.lower() == header:
+            body = []
+            for item in lines[idx + 1:]:
+                if item.startswith("#"):
+                    break
+                if item:
+                    body.append(item)
+            return body
     return None
 
+def _read_skill_entry(skill_md_path: str):
+    body = _read_skill_section(skill_md_path, "Entry")
+    if body:
+        return body[0] or None
+    return None
+
+def _read_skill_resources(skill_md_path: Optional[str]) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    解析 skill.md 的 "## Resource" 小节，声明工具独占的物理资源（如 desktop、browser），
+    或用 readonly 标记无副作用、可并发执行的工具：单独一行作用于整个 Skill，
+    "- tool_name: desktop" 只作用于该工具，"none" 表示清除声明。
+
+    Returns: (Skill 默认资源, {工具名: 资源})
+    """
+    if not skill_md_path:
+        return None, {}
+    body = _read_skill_section(skill_md_path, "Resource") or []
+    default = None
+    per_tool: Dict[str, str] = {}
+    for line in body:
+        item = line.lstrip("-* ").strip()
+        if ":" in item:
+            name, resource = item.split(":", 1)
+            per_tool[name.strip()] = resource.strip().lower()
+        elif item:
+            default = item.lower()
+    return default, per_tool
+
+def _apply_resources(tools: List[BaseTool], skill_md_path: Optional[str]):
+    """
+    把 skill.md 声明的资源写入 tool.metadata["resource"]；未声明时保留工具自身 metadata 中的值。
+    """
+    default, per_tool = _read_skill_resources(skill_md_path)
+    if default is None and not per_tool:
+        return
+    for t in tools:
+        resource = per_tool.get(t.name, default)
+        if resource is None:
+            continue
+        metadata = dict(t.metadata or {})
+        if resource == "none":
+            metadata.pop("resource", None)
+        else:
+            metadata["resource"] = resource
+        t.metadata = metadata
+
+def _read_skill_cache(skill_md_path: Optional[str]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    解析 skill.md 的 "## Cache" 小节，让工具选择加入结果缓存（见 app/skills/tool_cache.py）：
+    "- tool_name: path_arg, ..." 声明纯函数及其依赖的路径参数（目录参数写作 "path_arg/*" 表示依赖直接子项，
+    "path_arg/**" 表示依赖整棵目录树），"- tool_name: pure" 表示不依赖文件，
+    "- tool_name: invalidates path_arg, ..." 声明写入这些路径、执行后清除相关缓存。
+
+    Returns: {工具名: {"paths": [...]} 或 {"invalidates": [...]}}
+    """
+    if not skill_md_path:
+        return {}
+    specs: Dict[str, Dict[str, List[str]]] = {}
+    for line in _read_skill_section(skill_md_path, "Cache") or []:
+        item = line.lstrip("-* ").strip()
+        if ":" not in item:
+            continue
+        name, value = (part.strip() for part in item.split(":", 1))
+        if value.lower().startswith("invalidates"):
+            args = [a.strip() for a in value[len("invalidates"):].split(",") if a.strip()]
+            specs[name] = {"invalidates": args}
+        elif value.lower() == "pure":
+            specs[name] = {"paths": []}
+        else:
+            specs[name] = {"paths": [a.strip() for a in value.split(",") if a.strip()]}
+    return specs
+
+def _apply_cache_specs(tools: List[BaseTool], skill_md_path: Optional[str]):
+    """
+    把 skill.md 声明的缓存策略写入 tool.metadata["cache"]。
+    """
+    specs = _read_skill_cache(skill_md_path)
+    for t in tools:
+        if t.name in specs:
+            t.metadata = dict(t.metadata or {}, cache=specs[t.name])
+
+def _collect_tools(module) -> List[Tuple[str, BaseTool]]:
+    """
+    Returns: [(模块内属性名, Tool 实例)]
+    """
+    tools = []
+    for name, obj in inspect.getmembers(module):
+        if isinstance(obj, LazySkillTool):
+            continue
+        if isinstance(obj, BaseTool):
+            tools.append((name, obj))
+        elif inspect.isclass(obj) and issubclass(obj, BaseTool) and obj is not BaseTool and obj is not LazySkillTool:
+            try:
+                tools.append((name, obj()))
+            except Exception:
+                pass
+    return tools
+
+def _purge_modules(prefix: str):
+    for name in list(sys.modules.keys()):
+        if name == prefix or name.startswith(prefix + "."):
+            del sys.modules[name]
+
+def _discover_packages(pkg_name: str, auto_package_name: str) -> List[Dict[str, Any]]:
+    """
+    扫描包下的 Skill 子包，返回 [{"name", "skill_md", "entry"}]。
+    """
+    if auto_package_name and pkg_name == auto_package_name:
+        # 确保 import 系统能看到新生成的技能目录
+        importlib.invalidate_caches()
+    try:
+        package = importlib.import_module(pkg_name)
+    except ImportError as e:
+        logger.warning(f"Warning: Could not import package {pkg_name}: {e}")
+        return []
+
+    if pkg_name.endswith(".scripts"):
+        return [{"name": pkg_name, "skill_md": None, "entry": pkg_name}]
+    if not hasattr(package, "__path__"):
+        return []
+
+    skills = []
+    base_paths = list(package.__path__)
+    for _, module_name, is_pkg in pkgutil.iter_modules(package.__path__):
+        if not is_pkg:
+            continue
+        entry = None
+        skill_md = None
+        for base_path in base_paths:
+            skill_md_path = os.path.join(base_path, module_name, "skill.md")
+            if os.path.exists(skill_md_path):
+                skill_md = skill_md_path
+                entry = _read_skill_entry(skill_md_path)
+                if entry:
+                    break
+        skills.append({
+            "name": f"{pkg_name}.{module_name}",
+            "skill_md": skill_md,
+            "entry": entry or f"{pkg_name}.{module_name}.scripts",
+        })
+    return skills
+
+def _locate_scripts_package(entry: str) -> Tuple[List[str], Optional[str]]:
+    """
+    不导入模块的前提下定位 Entry 对应的目录或文件。
+    Returns: (package_dirs, module_file)
+    """
+    try:
+        spec = importlib.util.find_spec(entry)
+    except (ImportError, ValueError):
+        return [], None
+    if spec is None:
+        return [], None
+    if spec.submodule_search_locations is not None:
+        return list(spec.submodule_search_locations), spec.origin
+    return [], spec.origin
+
+def _scan_entry_modules(entry: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    Returns: (init_file, {full_module_name: file_path})
+    """
+    package_dirs, origin = _locate_scripts_package(entry)
+    if not package_dirs:
+        return None, ({entry: origin} if origin else {})
+    modules = {}
+    for _, module_name, is_pkg in pkgutil.iter_modules(package_dirs):
+        if is_pkg:
+            continue
+        for base in package_dirs:
+            path = os.path.join(base, f"{module_name}.py")
+            if os.path.exists(path):
+                modules[f"{entry}.{module_name}"] = path
+                break
+    return origin, modules
+
+def _import_module_tools(module_name: str, fresh: bool) -> Optional[List[Tuple[str, BaseTool]]]:
+    if fresh and module_name in sys.modules:
+        del sys.modules[module_name]
+    try:
+        with profiler.phase(module_name, kind="module"):
+            module = importlib.import_module(module_name)
+    except Exception as e:
+        logger.warning(f"Registry Warning: Failed to load module {module_name}: {e}")
+        return None
+    found = _collect_tools(module)
+    if found:
+        logger.info(f"Registry: Loaded {len(found)} tools from {module_name}")
+    else:
+        logger.info(f"Registry: No tools found in {module_name}")
+    return found
+
+def _load_entry(entry: str, skill_md: Optional[str], previous_index: Dict[str, Any], changes: Dict[str, List[str]]) -> Tuple[List[BaseTool], Dict[str, Any]]:
+    """
+    加载单个 Skill 的 Entry，仅重新导入内容有变化的模块。
+
+    skill.md 旁的 skill_manifest.json 缓存了每个模块的工具 Schema；模块内容哈希与
+    manifest 一致时直接生成 LazySkillTool 代理，不导入模块本身。
+    """
+    previous_modules = previous_index.get("modules") or {}
+    init_file, module_files = _scan_entry_modules(entry)
+    index_modules: Dict[str, Any] = {}
+    tools: List[BaseTool] = []
+
+    lazy = _lazy_import_enabled()
+    manifest_path = os.path.join(os.path.dirname(skill_md), MANIFEST_FILE_NAME) if skill_md else None
+    manifest = _load_manifest(manifest_path, entry)
+    manifest_modules = manifest.setdefault("modules", {})
+    manifest_dirty = False
+
+    init_changed = False
+    index_init = None
+    has_package = bool(init_file and module_files)
+    if has_package:
+        prev_init = previous_index.get("init")
+        index_init = _file_fingerprint(init_file, prev_init)
+        init_changed = not prev_init or not index_init or index_init.get("sha1") != prev_init.get("sha1")
+    package_state = {"imported": False, "failed": False}
+
+    def _ensure_package() -> bool:
+        # scripts 包只在确有模块需要真实导入时才导入
+        if not has_package or package_state["imported"]:
+            return True
+        if package_state["failed"]:
+            return False
+        if init_changed:
+            # scripts 包本身变化（或首次加载）时清理整个包，保证子模块使用新的包对象
+            _purge_modules(entry)
+        try:
+            importlib.import_module(entry)
+        except Exception as e:
+            logger.warning(f"Registry Warning: Failed to import scripts package {entry}: {e}")
+            package_state["failed"] = True
+            return False
+        package_state["imported"] = True
+        return True
+
+    logger.info(f"Registry: Processing scripts package {entry}")
+    for module_name in sorted(module_files):
+        path = module_files[module_name]
+        prev_fp = previous_modules.get(module_name)
+        cached = _MODULE_CACHE.get(module_name)
+        fingerprint = _file_fingerprint(path, (cached or {}).get("fingerprint") or prev_fp)
+        if fingerprint is None:
+            continue
+        unchanged = (
+            cached is not None
+            and (not init_changed or cached.get("lazy"))
+            and cached["fingerprint"].get("sha1") == fingerprint["sha1"]
+        )
+        spec = manifest_modules.get(module_name)
+        if unchanged:
+            module_tools = cached["tools"]
+        elif lazy and spec and spec.get("sha1") == fingerprint["sha1"]:
+            module_tools = [LazySkillTool.from_manifest(module_name, t) for t in spec.get("tools") or []]
+            if cached is None:
+                changes["added"].append(module_name)
+            else:
+                changes["changed"].append(module_name)
+            _MODULE_CACHE[module_name] = {"fingerprint": fingerprint, "tools": module_tools, "lazy": True}
+        else:
+            found = _import_module_tools(module_name, fresh=True) if _ensure_package() else None
+            if found is None:
+                # 导入失败时保留旧版本工具，避免一次写坏导致技能整体消失
+                if cached is not None:
+                    module_tools = cached["tools"]
+                    fingerprint = cached["fingerprint"]
+                else:
+                    continue
+            else:
+                module_tools = [t for _, t in found]
+                if cached is None and (not prev_fp or prev_fp.get("sha1") == fingerprint["sha1"]):
+                    changes["added"].append(module_name)
+                else:
+                    changes["changed"].append(module_name)
+                _MODULE_CACHE[module_name] = {"fingerprint": fingerprint, "tools": module_tools, "lazy": False}
+                try:
+                    manifest_modules[module_name] = {
+                        "sha1": fingerprint["sha1"],
+                        "tools": [extract_tool_schema(attr, t) for attr, t in found],
+                    }
+                    manifest_dirty = True
+                except Exception as e:
+                    logger.warning(f"Registry Warning: Failed to extract tool schema from {module_name}: {e}")
+        tools.extend(module_tools)
+        index_modules[module_name] = dict(fingerprint, tools=[t.name for t in module_tools])
+
+    stale = [name for name in manifest_modules if name not in module_files]
+    for name in stale:
+        del manifest_modules[name]
+    if manifest_path and (manifest_dirty or stale):
+        _save_manifest(manifest_path, manifest)
+    return tools, {"init": index_init, "modules": index_modules}
+
 def load_skills(package_name: str = "app.skills", auto_package_name: str = "app.auto_skills") -> List[BaseTool]:
     """
     动态加载指定包下的所有 Skills (BaseTool 的实例或子类)。
-    
+
+    加载结果按模块缓存，并以 app/data/skill_index.json 持久化每个 Skill 的 Entry
+    与模块内容哈希；重复调用时只重新导入新增或内容变化的模块。
+    设置 SKILL_LAZY_IMPORT=0 可关闭基于 skill_manifest.json 的延迟导入。
+
     Args:
         package_name: 存放 skills 的包名，例如 "app.skills"
         auto_package_name: 存放自动生成 skills 的包名，例如 "app.auto_skills"
-        
+
     Returns:
         List[BaseTool]: 加载到的所有 Tool 实例列表
     """
-    def _load_from_package(pkg_name: str) -> List[BaseTool]:
-        tools = []
-        if auto_package_name and pkg_name == auto_package_name:
-            # 强制清理父包缓存，确保 pkgutil 能扫描到新目录
-            if pkg_name in sys.modules:
-                del sys.modules[pkg_name]
-            importlib.invalidate_caches()
-        try:
-            package = importlib.import_module(pkg_name)
-            if auto_package_name and pkg_name == auto_package_name:
-                 print(f"Registry: Loaded package {pkg_name} from {package.__file__ if hasattr(package, '__file__') else 'unknown'}")
-        except ImportError as e:
-            print(f"Warning: Could not import package {pkg_name}: {e}")
-            return []
-
-        packages_to_scan = []
-        if pkg_name.endswith(".scripts"):
-            packages_to_scan = [pkg_name]
-        elif hasattr(package, "__path__"):
-            base_paths = list(package.__path__)
-            for _, module_name, is_pkg in pkgutil.iter_modules(package.__path__):
-                if not is_pkg:
-                    continue
-                # print(f"Registry: Scanning potential skill {module_name}")
-                entry = None
-                for base_path in base_paths:
-                    skill_md_path = os.path.join(base_path, module_name, "skill.md")
-                    if os.path.exists(skill_md_path):
-                        entry = _read_skill_entry(skill_md_path)
-                        if entry:
-                            break
-                if entry:
-                    packages_to_scan.append(entry)
-                else:
-                    packages_to_scan.append(f"{pkg_name}.{module_name}.scripts")
-
-        for scripts_package in packages_to_scan:
-            print(f"Registry: Processing scripts package {scripts_package}")
-            if auto_package_name and pkg_name == auto_package_name:
-                prefixes = [scripts_package]
-                if scripts_package.endswith(".scripts"):
-                    prefixes.append(scripts_package.rsplit(".scripts", 1)[0])
-                for name in list(sys.modules.keys()):
-                    for prefix in prefixes:
-                        if name == prefix or name.startswith(prefix + "."):
-                            del sys.modules[name]
-                            break
-            try:
-                scripts_module = importlib.import_module(scripts_package)
-            except Exception as e:
-                print(f"Registry Warning: Failed to import scripts package {scripts_package}: {e}")
-                continue
-            
-            if hasattr(scripts_module, "__path__"):
-                print(f"Registry: Scanning modules in {scripts_package}")
-                for _, module_name, _ in pkgutil.iter_modules(scripts_module.__path__):
-                    full_module_name = f"{scripts_package}.{module_name}"
-                    # print(f"Registry: Found script module {full_module_name}")
-                    try:
-                        module = importlib.import_module(full_module_name)
-                        found_tools = 0
-                        for name, obj in inspect.getmembers(module):
-                            if isinstance(obj, BaseTool):
-                                tools.append(obj)
-                                found_tools += 1
-                            elif inspect.isclass(obj) and issubclass(obj, BaseTool) and obj is not BaseTool:
-                                try:
-                                    tools.append(obj())
-                                    found_tools += 1
-                                except Exception:
-                                    pass
-                        if found_tools > 0:
-                            print(f"Registry: Loaded {found_tools} tools from {full_module_name}")
-                        else:
-                            print(f"Registry: No tools found in {full_module_name}")
-                    except Exception as e:
-                        print(f"Registry Warning: Failed to load module {full_module_name}: {e}")
-            else:
-                try:
-                    module = importlib.import_module(scripts_package)
-                    for name, obj in inspect.getmembers(module):
-                        if isinstance(obj, BaseTool):
-                            tools.append(obj)
-                        elif inspect.isclass(obj) and issubclass(obj, BaseTool) and obj is not BaseTool:
-                            try:
-                                tools.append(obj())
-                            except Exception:
-                                pass
-                except Exception:
-                    continue
-        return tools
+    with _REGISTRY_LOCK:
+        index = _load_index()
+        previous_packages = index.get("packages") or {}
+        packages: Dict[str, Any] = {}
+        changes: Dict[str, List[str]] = {"added": [], "changed": [], "removed": []}
+        tools: List[BaseTool] = []
 
-    tools = []
-    tools.extend(_load_from_package(package_name))
-    if auto_package_name and auto_package_name != package_name:
-        tools.extend(_load_from_package(auto_package_name))
+        pkg_names = [package_name]
+        if auto_package_name and auto_package_name != package_name:
+            pkg_names.append(auto_package_name)
+        for pkg_name in pkg_names:
+            for skill in _discover_packages(pkg_name, auto_package_name):
+                entry = skill["entry"]
+                previous = previous_packages.get(skill["name"]) or {}
+                if previous.get("entry") != entry:
+                    previous = {}
+                with profiler.phase(skill["name"], kind="package"):
+                    entry_tools, entry_index = _load_entry(entry, skill["skill_md"], previous, changes)
+                _apply_resources(entry_tools, skill["skill_md"])
+                _apply_cache_specs(entry_tools, skill["skill_md"])
+                tools.extend(entry_tools)
+                packages[skill["name"]] = dict(entry_index, entry=entry, skill_md=skill["skill_md"])
+
+        live_modules = set()
+        for package in packages.values():
+            live_modules.update((package.get("modules") or {}).keys())
+        for module_name in list(_MODULE_CACHE.keys()):
+            if module_name not in live_modules:
+                del _MODULE_CACHE[module_name]
+                sys.modules.pop(module_name, None)
+                changes["removed"].append(module_name)
+
+        _LAST_CHANGES.clear()
+        _LAST_CHANGES.update(changes)
+        _save_index({
+            "version": REGISTRY_INDEX_VERSION,
+            "updated_at": datetime.now().isoformat(),
+            "packages": packages,
+        })
 
-    # 去重 (根据 name)
+    # 去重 (根据 name)，按名称排序：工具列表与提示词前缀不随模块扫描顺序变化
     unique_tools = {t.name: t for t in tools}
-    return list(unique_tools.values())
\ No newline at end of file
+    result = [unique_tools[name] for name in sorted(unique_tools)]
+    # 更新工具检索索引（嵌入在首次检索时按需计算）
+    tool_index.update(result)
+    return result
+
+def get_last_changes() -> Dict[str, List[str]]:
+    """
+    返回最近一次 load_skills 中新增/变化/移除的模块列表。
+    """
+    with _REGISTRY_LOCK:
+        return {k: list(v) for k, v in _LAST_CHANGES.items()}
@@ -1,4 +1,5 @@
 from .open_notepad import open_notepad, read_notepad_text
 from .experience_tools import add_operation_experience, get_operation_experience, compress_operation_experience
 from .image_tools import delete_image
-from .task_tools import create_task_plan, read_task_plan, mark_task_completed, append_task_step
+from .task_tools import create_task_plan, read_task_plan, mark_task_completed, append_task_step, run_plan_steps
+from .tool_search import search_tools
@@ -2,56 +2,91 @@ from langchain_core.tools import tool
 import os
 import json
 import shutil
+import hashlib
+import threading
 from datetime import datetime, timezone
 
-# Ensure HF mirror is used before any HF imports
-if "HF_ENDPOINT" not in os.environ:
-    os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
+from app.memory import memory_service
 
-# Lazy globals
-_VECTOR_STORE = None
-_EMBEDDINGS = None
+_MIGRATION_LOCK = threading.Lock()
+_MIGRATION_CHECKED = False
 
-def _get_db_path():
-    # Path: app/data/experience_db
-    # This file: app/skills/system_skill/scripts/experience_tools.py
-    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
-    return os.path.join(base_dir, "app", "data", "experience_db")
+# 每个标签单独存为布尔元数据键，例如 {"tag:persona": True}，检索时可直接下推到 where 条件
+TAG_KEY_PREFIX = "tag:"
+TAG_SCHEMA_VERSION = 1
 
 def _get_json_path():
     return os.path.join(os.path.dirname(__file__), "experience_store.json")
 
-def _init_components():
-    global _VECTOR_STORE, _EMBEDDINGS
-    if _VECTOR_STORE is not None:
-        return _VECTOR_STORE
+def _get_schema_path():
+    return os.path.join(os.path.dirname(memory_service.persist_directory), "experience_schema.json")
 
+def _normalize_tag_list(tags):
+    if isinstance(tags, str):
+        tags = [t for t in tags.split(",")]
+    if not isinstance(tags, list):
+        return []
+    cleaned = [str(t).strip() for t in tags if t is not None and str(t).strip()]
+    return list(dict.fromkeys(cleaned))
+
+def _tag_metadata(tags_list):
+    return {f"{TAG_KEY_PREFIX}{tag}": True for tag in tags_list}
+
+def _backfill_tag_keys():
+    """
+    为旧文档补写布尔标签键（只在 schema 版本落后时执行一次）。
+    """
+    schema_path = _get_schema_path()
     try:
-        from langchain_chroma import Chroma
-        from langchain_huggingface import HuggingFaceEmbeddings
-    except ImportError as e:
-        print(f"RAG Dependency Import Error: {e}")
-        return None # Should handle gracefully or let it fail at runtime if deps missing
-
-    if _EMBEDDINGS is None:
-        # Use lightweight local model
-        _EMBEDDINGS = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-
-    db_path = _get_db_path()
-    _VECTOR_STORE = Chroma(
-        persist_directory=db_path,
-        embedding_function=_EMBEDDINGS,
-        collection_name="agent_experiences"
-    )
-    
-    # Auto-migration check
-    try:
-        if len(_VECTOR_STORE.get()['ids']) == 0 and os.path.exists(_get_json_path()):
-            _migrate_from_json()
-    except Exception as e:
-        print(f"DB Init/Migration warning: {e}")
+        with open(schema_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("tag_schema") == TAG_SCHEMA_VERSION:
+                return
+    except Exception:
+        pass
+    collection = memory_service.collection
+    if collection is None:
+        return
+    total = collection.count()
+    page = 500
+    updated = 0
+    for offset in range(0, total, page):
+        batch = collection.get(include=["metadatas"], limit=page, offset=offset)
+        ids, metas = [], []
+        for doc_id, meta in zip(batch.get("ids") or [], batch.get("metadatas") or []):
+            meta = dict(meta or {})
+            tag_keys = _tag_metadata(_normalize_tag_list(meta.get("tags") or ""))
+            if not tag_keys or all(k in meta for k in tag_keys):
+                continue
+            meta.update(tag_keys)
+            ids.append(doc_id)
+            metas.append(meta)
+        if ids:
+            memory_service.update_many(ids, metas)
+            updated += len(ids)
+    with open(schema_path, "w", encoding="utf-8") as f:
+        json.dump({"tag_schema": TAG_SCHEMA_VERSION}, f)
+    if updated:
+        print(f"Backfilled tag keys for {updated} experiences.")
 
-    return _VECTOR_STORE
+def _init_components():
+    global _MIGRATION_CHECKED
+    store = memory_service.get_store()
+    if store is None:
+        return None
+
+    # Auto-migration check (count query, once per process)
+    if not _MIGRATION_CHECKED:
+        with _MIGRATION_LOCK:
+            if not _MIGRATION_CHECKED:
+                try:
+                    if os.path.exists(_get_json_path()) and memory_service.count() == 0:
+                        _migrate_from_json()
+                    _backfill_tag_keys()
+                except Exception as e:
+                    print(f"DB Init/Migration warning: {e}")
+                _MIGRATION_CHECKED = True
+
+    return store
 
 def _migrate_from_json():
     from langchain_core.documents import Document
@@ -81,32 +116,27 @@ def _migrate_from_json():
                 "created_at": item.get("created_at") or datetime.now(timezone.utc).isoformat(),
                 "original_content": txt
             }
+            metadata.update(_tag_metadata(_normalize_tag_list(tags)))
             docs.append(Document(page_content=page_content, metadata=metadata))
             
         if docs:
-            _VECTOR_STORE.add_documents(docs)
+            memory_service.add_many(docs)
             print(f"Migrated {len(docs)} experiences to Vector DB.")
             shutil.move(json_path, json_path + ".migrated")
             
     except Exception as e:
         print(f"Migration failed: {e}")
 
-@tool
-def add_operation_experience(system_name: str, content: str, tags: list = None, url: str = None, scope: str = None, project_id: str = None, user_id: str = None, memory_type: str = None):
+def _experience_id(system_name, content, scope=None, project_id=None, user_id=None, memory_type=None):
     """
-    记录系统操作经验到向量知识库 (RAG)。
-    
-    Args:
-        system_name: 系统名称
-        content: 经验内容
-        tags: 标签列表
-        url: 相关链接
+    基于内容生成确定性 id：同一条经验重复写入时覆盖而不是新增。
     """
+    key = json.dumps([system_name or "", content or "", scope or "", project_id or "", user_id or "", memory_type or ""], ensure_ascii=False)
+    return "exp-" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def _build_experience_document(system_name, content, tags=None, url=None, scope=None, project_id=None, user_id=None, memory_type=None):
     from langchain_core.documents import Document
-    store = _init_components()
-    if not store: return "Error: RAG dependencies missing."
-    
-    tags_list = tags if isinstance(tags, list) else []
+    tags_list = _normalize_tag_list(tags)
     tags_str = ", ".join(tags_list) if tags_list else ""
     page_content = f"System: {system_name}\nContent: {content}\nTags: {tags_str}\nScope: {scope or ''}\nProject: {project_id or ''}\nUser: {user_id or ''}\nType: {memory_type or ''}"
     
@@ -122,23 +152,70 @@ def add_operation_experience(system_name: str, content: str, tags: list = None,
         "created_at": datetime.now(timezone.utc).isoformat(),
         "original_content": content
     }
-    
-    store.add_documents([Document(page_content=page_content, metadata=metadata)])
-    return "已存入向量知识库。"
+    metadata.update(_tag_metadata(tags_list))
+    doc_id = _experience_id(system_name, content, scope, project_id, user_id, memory_type)
+    return doc_id, Document(page_content=page_content, metadata=metadata)
+
+def bulk_add_operation_experiences(experiences: list):
+    """
+    批量写入经验：一次批量嵌入 + 一次 upsert，不经过 LangChain 工具校验。
+
+    Args:
+        experiences: [{"system_name", "content", "tags", "url", "scope", "project_id", "user_id", "memory_type"}]
+
+    Returns:
+        list: 写入的文档 id（按内容哈希生成，重复写入同一内容是幂等的）
+    """
+    if _init_components() is None:
+        raise RuntimeError("RAG dependencies missing.")
+    ids = []
+    docs = []
+    seen = set()
+    for item in experiences or []:
+        content = str(item.get("content") or "").strip()
+        if not content:
+            continue
+        doc_id, doc = _build_experience_document(
+            system_name=item.get("system_name") or "",
+            content=content,
+            tags=item.get("tags"),
+            url=item.get("url"),
+            scope=item.get("scope"),
+            project_id=item.get("project_id"),
+            user_id=item.get("user_id"),
+            memory_type=item.get("memory_type"),
+        )
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        ids.append(doc_id)
+        docs.append(doc)
+    if not docs:
+        return []
+    return memory_service.add_many(docs, ids=ids)
 
 @tool
-def get_operation_experience(query: str, system_filter: str = None, n_results: int = 3, scope: str = None, project_id: str = None, user_id: str = None, memory_type: str = None, tags: list = None):
+def add_operation_experience(system_name: str, content: str, tags: list = None, url: str = None, scope: str = None, project_id: str = None, user_id: str = None, memory_type: str = None):
     """
-    语义检索操作经验。
+    记录系统操作经验到向量知识库 (RAG)。
     
     Args:
-        query: 问题描述或关键词 (如 "Playwright 报错")
-        system_filter: (可选) 限定系统名称
-        n_results: 返回数量
+        system_name: 系统名称
+        content: 经验内容
+        tags: 标签列表
+        url: 相关链接
     """
     store = _init_components()
     if not store: return "Error: RAG dependencies missing."
     
+    doc_id, doc = _build_experience_document(system_name, content, tags, url, scope, project_id, user_id, memory_type)
+    memory_service.add_many([doc], ids=[doc_id])
+    return "已存入向量知识库。"
+
+def _build_where(system_filter=None, scope=None, project_id=None, user_id=None, memory_type=None, tags=None):
+    """
+    把过滤参数翻译为 Chroma where 条件；每个标签对应一个布尔元数据键。
+    """
     filter_dict = {}
     if system_filter:
         filter_dict["system"] = system_filter
@@ -150,27 +227,20 @@ def get_operation_experience(query: str, system_filter: str = None, n_results: i
         filter_dict["user_id"] = user_id
     if memory_type:
         filter_dict["memory_type"] = memory_type
-    where = None
-    if filter_dict:
-        clauses = []
-        for k, v in filter_dict.items():
-            if v is None or v == "":
-                continue
-            clauses.append({k: {"$eq": v}})
-        if clauses:
-            where = {"$and": clauses} if len(clauses) > 1 else clauses[0]
-    results = store.similarity_search(query, k=n_results, filter=where)
-    
-    if not results: return "知识库中未找到相关经验。"
-    
-    tag_filters = tags if isinstance(tags, list) else []
+    clauses = []
+    for k, v in filter_dict.items():
+        if v is None or v == "":
+            continue
+        clauses.append({k: {"$eq": v}})
+    for key in _tag_metadata(_normalize_tag_list(tags)):
+        clauses.append({key: {"$eq": True}})
+    if not clauses:
+        return None
+    return {"$and": clauses} if len(clauses) > 1 else clauses[0]
+
+def _format_results(results):
     formatted = []
-    for doc in results:
-        if tag_filters:
-            doc_tags = doc.metadata.get("tags_list") or []
-            doc_tags_str = doc.metadata.get("tags") or ""
-            if not all(tag in doc_tags or tag in doc_tags_str for tag in tag_filters):
-                continue
+    for doc, _ in results:
         formatted.append({
             "content": doc.metadata.get("original_content"),
             "system": doc.metadata.get("system"),
@@ -180,9 +250,52 @@ def get_operation_experience(query: str, system_filter: str = None, n_results: i
             "user_id": doc.metadata.get("user_id"),
             "memory_type": doc.metadata.get("memory_type")
         })
-    return json.dumps(formatted, ensure_ascii=False, indent=2)
+    return formatted
 
 @tool
-def compress_operation_experience():
-    """[Deprecated] RAG模式下无需手动压缩。"""
-    return "Feature deprecated: Using Vector DB now."
+def get_operation_experience(query: str, system_filter: str = None, n_results: int = 3, scope: str = None, project_id: str = None, user_id: str = None, memory_type: str = None, tags: list = None, mode: str = "vector"):
+    """
+    语义检索操作经验。
+    
+    Args:
+        query: 问题描述或关键词 (如 "Playwright 报错")
+        system_filter: (可选) 限定系统名称
+        n_results: 返回数量
+        tags: (可选) 标签列表，仅返回同时包含全部标签的经验
+        mode: 检索模式。"vector" 语义检索；"hybrid" 关键词 (BM25) + 语义融合，适合窗口标题、选择器、路径、报错原文等精确词
+    """
+    store = _init_components()
+    if not store: return "Error: RAG dependencies missing."
+    
+    where = _build_where(system_filter, scope, project_id, user_id, memory_type, tags)
+    if (mode or "vector").strip().lower() == "hybrid":
+        results = memory_service.search_hybrid(query, k=n_results, where=where)
+    else:
+        results = memory_service.search_many([query], k=n_results, where=where)[0]
+    
+    if not results: return "知识库中未找到相关经验。"
+    
+    memory_service.record_access([doc.id for doc, _ in results])
+    return json.dumps(_format_results(results), ensure_ascii=False, indent=2)
+
+@tool
+def compress_operation_experience(dry_run: bool = True):
+    """
+    压缩操作经验库：合并语义近似重复的经验（保留来源记录），淘汰长期未被检索的低价值经验，并重建检索索引。
+    人设、行为习惯、代码风格与任务模板永不淘汰。
+
+    Args:
+        dry_run: 默认 True，只返回将被合并/淘汰的条目报告；设为 False 时在后台执行压缩
+    """
+    from app.memory.compaction import compaction_job, run_compaction
+    if _init_components() is None:
+        return "RAG dependencies missing."
+    try:
+        if dry_run:
+            report = run_compaction(dry_run=True)
+            return json.dumps(report, ensure_ascii=False, indent=2)
+        if not compaction_job.start(dry_run=False):
+            return "压缩任务正在运行中，请稍后查看结果。"
+        return "压缩任务已在后台启动，完成后报告写入 app/data/compaction_report.json。"
+    except Exception as e:
+        return f"Error compressing experiences: {e}"
@@ -1,11 +1,9 @@
 from langchain_core.tools import tool
-import os
 import json
-from datetime import datetime
+from app.context import get_session_id
+from app.task_store import task_store
 
-def _get_task_plan_path():
-    # Use a fixed file for current task state
-    return os.path.join(os.path.dirname(__file__), "current_task_plan.json")
+_RESULT_PREVIEW_CHARS = 500
 
 @tool
 def create_task_plan(steps: list):
@@ -13,16 +11,15 @@ def create_task_plan(steps: list):
     创建或重置当前任务计划。将复杂任务拆解为多个步骤并保存。
     
     Args:
-        steps: 步骤列表，每个步骤是一个字符串描述
+        steps: 步骤列表。每个步骤是字符串描述，或 {"desc": 描述, "depends_on": [前置步骤ID], "resource": "desktop|browser|file|network"}；
+               步骤ID按顺序从 1 开始。相互独立的步骤不写依赖，可由 run_plan_steps 并行执行。
     """
-    plan = {
-        "created_at": datetime.now().isoformat(),
-        "status": "in_progress",
-        "steps": [{"id": i+1, "desc": step, "status": "pending"} for i, step in enumerate(steps)]
-    }
-    path = _get_task_plan_path()
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(plan, f, ensure_ascii=False, indent=2)
+    try:
+        task_store.create_plan(get_session_id(), steps)
+    except ValueError as e:
+        return f"计划格式错误: {e}"
+    except Exception as e:
+        return f"创建计划失败: {e}"
     return f"任务计划已创建，共 {len(steps)} 个步骤。请调用 read_task_plan 获取第一步。"
 
 @tool
@@ -30,28 +27,24 @@ def read_task_plan():
     """
     读取当前任务计划与进度。返回待处理的步骤。
     """
-    path = _get_task_plan_path()
-    if not os.path.exists(path):
-        return "当前没有正在进行的任务计划。"
-    
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            plan = json.load(f)
+        state = task_store.next_step(get_session_id())
     except Exception as e:
         return f"读取计划失败: {e}"
-        
-    total = len(plan["steps"])
-    pending = [s for s in plan["steps"] if s["status"] == "pending"]
-    completed = [s for s in plan["steps"] if s["status"] == "completed"]
-    
-    if not pending:
-        return f"所有任务步骤已完成 ({len(completed)}/{total})。请检查结果或输出最终结论。"
-        
-    next_step = pending[0]
+    if state is None:
+        return "当前没有正在进行的任务计划。"
+
+    total, completed = state["total"], state["completed"]
+    if state["step"] is None and completed < total:
+        return (f"暂无可执行的步骤 ({completed}/{total})：执行中 {state['running']} 个，失败 {state['failed']} 个，"
+                f"等待依赖 {state['blocked']} 个。失败的步骤请处理后调用 mark_task_completed。")
+    if state["step"] is None:
+        return f"所有任务步骤已完成 ({completed}/{total})。请检查结果或输出最终结论。"
+
     return json.dumps({
-        "progress": f"{len(completed)}/{total}",
-        "current_step": next_step,
-        "remaining_count": len(pending)
+        "progress": f"{completed}/{total}",
+        "current_step": state["step"],
+        "remaining_count": total - completed
     }, ensure_ascii=False, indent=2)
 
 @tool
@@ -63,47 +56,62 @@ def mark_task_completed(step_id: int, result_summary: str = ""):
         step_id: 步骤ID
         result_summary: 执行结果简述
     """
-    path = _get_task_plan_path()
-    if not os.path.exists(path):
-        return "找不到任务计划文件。"
-        
-    with open(path, "r", encoding="utf-8") as f:
-        plan = json.load(f)
-        
-    found = False
-    for step in plan["steps"]:
-        if step["id"] == step_id:
-            step["status"] = "completed"
-            step["result"] = result_summary
-            step["completed_at"] = datetime.now().isoformat()
-            found = True
-            break
-            
-    if not found:
+    try:
+        outcome = task_store.complete_step(get_session_id(), step_id, result_summary)
+    except Exception as e:
+        return f"更新计划失败: {e}"
+    if outcome is None:
+        return "当前没有正在进行的任务计划。"
+    if not outcome["found"]:
         return f"未找到 ID 为 {step_id} 的步骤。"
         
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(plan, f, ensure_ascii=False, indent=2)
-        
     return f"步骤 {step_id} 已标记完成。请调用 read_task_plan 获取下一步。"
 
 @tool
-def append_task_step(step_desc: str):
+def append_task_step(step_desc: str, depends_on: list = None, resource: str = ""):
     """
     追加新的任务步骤到计划末尾（用于动态调整计划）。
+
+    Args:
+        step_desc: 步骤描述
+        depends_on: 前置步骤ID列表（可选）
+        resource: 资源类别 desktop/browser/file/network（可选）
     """
-    path = _get_task_plan_path()
-    if not os.path.exists(path):
+    try:
+        new_id = task_store.append_step(get_session_id(), step_desc, depends_on or (), resource or None)
+    except Exception as e:
+        return f"追加步骤失败: {e}"
+    if new_id is None:
         return "请先调用 create_task_plan 初始化计划。"
         
-    with open(path, "r", encoding="utf-8") as f:
-        plan = json.load(f)
-        
-    new_id = max([s["id"] for s in plan["steps"]]) + 1 if plan["steps"] else 1
-    new_step = {"id": new_id, "desc": step_desc, "status": "pending"}
-    plan["steps"].append(new_step)
-    
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(plan, f, ensure_ascii=False, indent=2)
-        
-    return f"已追加步骤 {new_id}: {step_desc}"
\ No newline at end of file
+    return f"已追加步骤 {new_id}: {step_desc}"
+
+
+@tool
+def run_plan_steps(max_parallel: int = 0):
+    """
+    并行执行当前计划中所有依赖已满足的步骤：每个步骤交给独立的子 Agent，完成一个就调度新就绪的步骤，直到没有可执行的步骤。
+
+    Args:
+        max_parallel: 同时执行的步骤数上限，0 表示使用 PLAN_PARALLELISM（默认 3）
+    """
+    from app.scheduler import plan_scheduler
+
+    session_id = get_session_id()
+    try:
+        report = plan_scheduler.run(session_id, max_parallel or None)
+        state = task_store.next_step(session_id)
+    except Exception as e:
+        return f"执行计划失败: {e}"
+    if state is None:
+        return "当前没有正在进行的任务计划。"
+    for item in report["completed"]:
+        if len(item["result"]) > _RESULT_PREVIEW_CHARS:
+            item["result"] = item["result"][:_RESULT_PREVIEW_CHARS] + "..."
+    return json.dumps({
+        "progress": f"{state['completed']}/{state['total']}",
+        "completed": report["completed"],
+        "failed": report["failed"],
+        "next_step": state["step"],
+        "elapsed_s": report["elapsed_s"],
+    }, ensure_ascii=False, indent=2)
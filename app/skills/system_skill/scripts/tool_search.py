@@ -0,0 +1,19 @@
+from langchain_core.tools import tool
+from app.context import get_session_id
+from app.skills.tool_index import tool_index
+
+@tool
+def search_tools(query: str, k: int = 5):
+    """
+    按功能描述检索可用工具。每轮只绑定了与任务最相关的一部分工具，找不到合适工具时先调用本工具，
+    返回的工具从下一步起即可直接调用；仍没有合适工具时再考虑生成新技能。
+
+    Args:
+        query: 需要的功能描述，例如 "读取 Excel 表格"
+        k: 返回的工具数量
+    """
+    names = tool_index.search(query, max(1, min(int(k or 5), 20)))
+    if not names:
+        return "未找到相关工具。"
+    tool_index.pin(get_session_id(), names)
+    return tool_index.describe(names)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from app.replay import is_error_result
+
+def cache_spec(tool: Optional[BaseTool]) -> Optional[Dict[str, List[str]]]:
+    """
+    工具声明的缓存策略（来自 skill.md 的 ## Cache 或 tool.metadata["cache"]）：
+    {"paths": [参数名]} 表示纯函数、结果只依赖参数与这些路径参数指向的文件；参数名后缀 "/*" 表示还依赖目录的直接子项，
+    "/**" 表示依赖整棵目录树；
+    {"invalidates": [参数名]} 表示会写入这些路径，执行后使相关缓存失效。未声明时返回 None。
+    """
+    metadata = getattr(tool, "metadata", None)
+    if isinstance(metadata, dict) and isinstance(metadata.get("cache"), dict):
+        return metadata["cache"]
+    return None
+
+def _norm_path(path: Any) -> Optional[str]:
+    if not isinstance(path, str) or not path.strip():
+        return None
+    return os.path.normcase(os.path.abspath(os.path.expanduser(path.strip())))
+
+# 目录树状态最多统计的条目数，超出时不缓存（遍历本身已接近工具的开销）
+_MAX_TREE_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_TREE_ENTRIES") or 20000)
+
+def _parse_dep(dep: str) -> Tuple[str, Optional[int]]:
+    # "arg" 只看路径本身，"arg/*" 含直接子项，"arg/**" 含整棵树；返回 (参数名, 深度)
+    if dep.endswith("/**"):
+        return dep[:-3], None
+    if dep.endswith("/*"):
+        return dep[:-2], 1
+    return dep, 0
+
+def _path_state(path: str, depth: Optional[int] = 0) -> Optional[tuple]:
+    """
+    路径的状态：文件或 depth=0 时为自身的 (mtime_ns, size)；目录按 depth 遍历，
+    对所有子项的 (相对路径, mtime_ns, size) 取摘要。目录过大时返回 None。
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    if depth == 0 or not os.path.isdir(path):
+        return path, st.st_mtime_ns, st.st_size
+    h = hashlib.sha1()
+    count = 0
+    for root, dirs, files in os.walk(path):
+        names = sorted(dirs + files)
+        rel = os.path.relpath(root, path)
+        level = 0 if rel == os.curdir else rel.count(os.sep) + 1
+        if depth is not None and level + 1 >= depth:
+            dirs[:] = []
+        dirs.sort()
+        for name in names:
+            full = os.path.join(root, name)
+            try:
+                entry = os.stat(full)
+            except OSError:
+                continue
+            h.update(f"{os.path.relpath(full, path)}\0{entry.st_mtime_ns}\0{entry.st_size}\n".encode("utf-8", "surrogateescape"))
+            count += 1
+            if count > _MAX_TREE_ENTRIES:
+                return None
+    return path, st.st_mtime_ns, h.hexdigest()
+
+def _related(a: str, b: str) -> bool:
+    # 同一路径，或一方是另一方的上级目录
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+class ToolResultCache:
+    """
+    纯工具（skill.md 的 ## Cache 声明了依赖路径）的结果缓存。
+
+    键为工具名 + 规范化参数 + 依赖路径当前的状态（文件的 mtime_ns/size；声明了 /* 或 /** 的目录为其子项或整棵树的
+    mtime_ns/size 摘要）：文件被任何方式修改后键随之变化，旧条目自然失效；依赖的路径参数缺省（工具回退到当前目录）
+    或目录树超过 TOOL_CACHE_MAX_TREE_ENTRIES 个条目时不缓存。
+    声明了 invalidates 的写入工具执行后，再按路径（含上下级目录）主动清除相关条目，覆盖同一时刻写入等情况。
+    容量按条目数（TOOL_CACHE_SIZE，默认 256，0 表示关闭）与结果总字符数（TOOL_CACHE_MAX_CHARS）做 LRU 淘汰；错误结果不缓存。
+    """
+    def __init__(self, max_entries: Optional[int] = None, max_chars: Optional[int] = None):
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("TOOL_CACHE_SIZE") or 256)
+        self.max_chars = int(max_chars or os.getenv("TOOL_CACHE_MAX_CHARS") or 2_000_000)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Tuple[Any, Tuple[str, ...], int]]" = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key_for(self, tool: BaseTool, args: Any) -> Optional[tuple]:
+        """
+        可缓存的工具返回缓存键，否则返回 None。
+        """
+        spec = cache_spec(tool)
+        if not self.enabled or spec is None or "paths" not in spec:
+            return None
+        if not isinstance(args, dict):
+            args = {"input": args}
+        try:
+            canonical = json.dumps(args, ensure_ascii=False, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        states = []
+        for dep in spec["paths"]:
+            name, depth = _parse_dep(dep)
+            path = _norm_path(args.get(name))
+            if path is None:
+                # 工具会回退到默认路径（如当前目录），键中没有其状态，无法判断是否过期
+                return None
+            state = _path_state(path, depth)
+            if state is None:
+                return None
+            states.append(state)
+        return tool.name, canonical, tuple(states)
+
+    def get(self, key: tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key: tuple, result: Any):
+        if is_error_result(result):
+            return
+        size = len(result) if isinstance(result, str) else len(str(result))
+        if size > self.max_chars:
+            return
+        paths = tuple(state[0] for state in key[2])
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._chars -= old[2]
+            self._entries[key] = (result, paths, size)
+            self._chars += size
+            while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._chars -= evicted
+
+    def invalidate_paths(self, paths: List[Any]) -> int:
+        touched = [p for p in (_norm_path(path) for path in paths) if p]
+        if not touched:
+            return 0
+        with self._lock:
+            stale = [key for key, (_, deps, _) in self._entries.items()
+                     if any(_related(dep, t) for dep in deps for t in touched)]
+            for key in stale:
+                self._chars -= self._entries.pop(key)[2]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def after_call(self, tool: BaseTool, args: Any):
+        """
+        写入工具执行后（无论成功与否）清除其写入路径相关的缓存。
+        """
+        spec = cache_spec(tool)
+        if not spec or not spec.get("invalidates"):
+            return
+        if not isinstance(args, dict):
+            args = {"input": args}
+        self.invalidate_paths([args.get(name) for name in spec["invalidates"]])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "chars": self._chars,
+                "max_entries": self.max_entries,
+                "max_chars": self.max_chars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+# Global instance
+tool_result_cache = ToolResultCache()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Sequence, Set
+
+from langchain_core.tools import BaseTool
+
+# 始终绑定的核心工具：任务计划、经验库、技能生成与工具检索本身
+CORE_TOOLS = {
+    "get_current_time",
+    "get_operation_experience",
+    "add_operation_experience",
+    "create_task_plan",
+    "read_task_plan",
+    "mark_task_completed",
+    "append_task_step",
+    "run_plan_steps",
+    "inspect_environment",
+    "scaffold_skill",
+    "write_tool_code",
+    "reload_skills",
+    "search_tools",
+}
+
+def get_retrieval_config():
+    """
+    Returns: (top_k, 核心工具名集合)。TOOL_RETRIEVAL_TOP_K=0 表示关闭检索、绑定全部工具；
+    TOOL_RETRIEVAL_CORE 以逗号分隔追加核心工具。
+    """
+    top_k = int(os.getenv("TOOL_RETRIEVAL_TOP_K") or 12)
+    extra = [name.strip() for name in (os.getenv("TOOL_RETRIEVAL_CORE") or "").split(",") if name.strip()]
+    return top_k, CORE_TOOLS | set(extra)
+
+def _tool_text(tool: BaseTool) -> str:
+    """
+    检索用文本：名称（下划线拆成词）、描述与参数名。
+    """
+    try:
+        args = list((tool.args or {}).keys())
+    except Exception:
+        args = []
+    return f"{tool.name} {tool.name.replace('_', ' ')}\n{tool.description or ''}\n{' '.join(args)}"
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class ToolIndex:
+    """
+    工具目录的检索索引，由 load_skills 在每次加载后更新。
+
+    向量复用经验库的嵌入模型（memory_service.embed_many），按工具文本哈希缓存，技能重载只嵌入新增或变化的工具；
+    排序融合向量相似度与词项匹配（Reciprocal Rank Fusion），嵌入模型不可用时只用词项匹配。
+    search_tools 找到的工具按会话固定（pin），在该会话的后续步骤中一并绑定。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, BaseTool] = {}
+        self._texts: Dict[str, str] = {}
+        self._vectors: Dict[str, List[float]] = {}
+        self._pins: Dict[str, Set[str]] = {}
+        self.version = 0
+
+    def update(self, tools: Sequence[BaseTool]):
+        """
+        记录当前工具列表（不做嵌入，嵌入在首次检索时批量计算）。
+        """
+        with self._lock:
+            self._tools = {t.name: t for t in tools}
+            self._texts = {t.name: _tool_text(t) for t in tools}
+            live = {_fingerprint(text) for text in self._texts.values()}
+            self._vectors = {fp: v for fp, v in self._vectors.items() if fp in live}
+            self.version += 1
+
+    @property
+    def tools(self) -> List[BaseTool]:
+        with self._lock:
+            return list(self._tools.values())
+
+    def _ensure_vectors(self, names: Sequence[str]) -> bool:
+        from app.memory import memory_service
+
+        with self._lock:
+            missing = {}
+            for name in names:
+                text = self._texts.get(name)
+                if text is not None and _fingerprint(text) not in self._vectors:
+                    missing[_fingerprint(text)] = text
+        if missing:
+            try:
+                vectors = memory_service.embed_many(list(missing.values()))
+            except Exception:
+                return False
+            with self._lock:
+                self._vectors.update(zip(missing.keys(), vectors))
+        return True
+
+    def _vector_ranking(self, query: str, names: Sequence[str]) -> List[str]:
+        import numpy as np
+        from app.memory import memory_service
+
+        if not names or not self._ensure_vectors(names):
+            return []
+        try:
+            query_vector = np.asarray(memory_service.embed_many([query])[0], dtype=np.float32)
+        except Exception:
+            return []
+        with self._lock:
+            rows = [(name, self._vectors.get(_fingerprint(self._texts[name]))) for name in names if name in self._texts]
+        rows = [(name, vector) for name, vector in rows if vector is not None]
+        if not rows:
+            return []
+        matrix = np.asarray([vector for _, vector in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        scores = matrix @ query_vector / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)
+        return [rows[i][0] for i in order]
+
+    def _lexical_ranking(self, query: str, names: Sequence[str]) -> List[str]:
+        from app.memory.lexical import tokenize
+
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return []
+        with self._lock:
+            term_sets = {name: set(tokenize(self._texts.get(name, ""))) for name in names}
+        # 按 idf 加权命中的词项：多数工具都有的词（如"文件"）贡献小，描述长短不影响得分
+        total = len(term_sets)
+        df = {term: sum(1 for terms in term_sets.values() if term in terms) for term in query_terms}
+        scored = []
+        for name, terms in term_sets.items():
+            score = sum(math.log(1 + total / df[term]) for term in query_terms & terms)
+            if score:
+                scored.append((score, name))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [name for _, name in scored]
+
+    def search(self, query: str, k: int, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        返回与 query 最相关的 k 个工具名（不含 exclude）。
+        """
+        from app.memory.lexical import reciprocal_rank_fusion
+
+        excluded = set(exclude)
+        with self._lock:
+            names = sorted(name for name in self._tools if name not in excluded)
+        if k <= 0 or not names or not (query or "").strip():
+            return []
+        rankings = [r for r in (self._vector_ranking(query, names), self._lexical_ranking(query, names)) if r]
+        if not rankings:
+            return []
+        return [name for name, _ in reciprocal_rank_fusion(rankings)][:k]
+
+    def describe(self, names: Sequence[str]) -> str:
+        with self._lock:
+            items = [{"name": name, "description": (self._tools[name].description or "").split("\n")[0].strip()} for name in names if name in self._tools]
+        return json.dumps(items, ensure_ascii=False)
+
+    # --- 按会话固定的工具 ---
+
+    def pin(self, session_id: str, names: Iterable[str]):
+        with self._lock:
+            self._pins.setdefault(session_id, set()).update(n for n in names if n in self._tools)
+
+    def pinned(self, session_id: str) -> Set[str]:
+        with self._lock:
+            return set(self._pins.get(session_id) or ())
+
+    def clear_pins(self, session_id: str):
+        with self._lock:
+            self._pins.pop(session_id, None)
+
+# Global instance
+tool_index = ToolIndex()
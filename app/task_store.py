@@ -0,0 +1,383 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "data", "task_plans.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    status TEXT NOT NULL,
+    next_step_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS plans_session_status ON plans(session, status, id);
+CREATE TABLE IF NOT EXISTS steps (
+    plan_id INTEGER NOT NULL REFERENCES plans(id),
+    step_id INTEGER NOT NULL,
+    desc TEXT NOT NULL,
+    status TEXT NOT NULL,
+    depends_on TEXT NOT NULL DEFAULT '[]',
+    resource TEXT,
+    result TEXT,
+    started_at REAL,
+    completed_at REAL,
+    PRIMARY KEY (plan_id, step_id)
+);
+CREATE INDEX IF NOT EXISTS steps_pending ON steps(plan_id, status, step_id);
+"""
+
+# 步骤的资源类别：desktop 步骤整步独占桌面，同一时刻只调度一个；browser 类工具仍由工具级资源锁串行化，file/network 可并行
+STEP_RESOURCES = ("desktop", "browser", "file", "network")
+EXCLUSIVE_STEP_RESOURCE = "desktop"
+
+def _normalize_steps(steps: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    步骤可以是字符串，或 {"desc", "depends_on": [步骤ID], "resource"} 字典（ID 从 1 开始按顺序编号）。
+    依赖不存在或成环、资源类别未知时抛出 ValueError。
+    """
+    normalized = []
+    for i, step in enumerate(steps):
+        if isinstance(step, str):
+            step = {"desc": step}
+        elif not isinstance(step, dict) or not step.get("desc"):
+            raise ValueError(f"步骤 {i + 1} 缺少 desc")
+        depends_on = sorted({int(d) for d in step.get("depends_on") or []})
+        resource = (step.get("resource") or "").strip().lower() or None
+        if resource is not None and resource not in STEP_RESOURCES:
+            raise ValueError(f"步骤 {i + 1} 的 resource 必须是 {'/'.join(STEP_RESOURCES)} 之一")
+        normalized.append({"desc": str(step["desc"]), "depends_on": depends_on, "resource": resource})
+    _check_dependencies({i + 1: s["depends_on"] for i, s in enumerate(normalized)})
+    return normalized
+
+def _check_dependencies(graph: Dict[int, List[int]]):
+    for step_id, deps in graph.items():
+        for dep in deps:
+            if dep not in graph:
+                raise ValueError(f"步骤 {step_id} 依赖的步骤 {dep} 不存在")
+    # Kahn 拓扑排序：排不完说明有环
+    indegree = {step_id: len(deps) for step_id, deps in graph.items()}
+    dependents: Dict[int, List[int]] = {}
+    for step_id, deps in graph.items():
+        for dep in deps:
+            dependents.setdefault(dep, []).append(step_id)
+    ready = [step_id for step_id, n in indegree.items() if n == 0]
+    visited = 0
+    while ready:
+        step_id = ready.pop()
+        visited += 1
+        for child in dependents.get(step_id, ()):
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    if visited != len(graph):
+        raise ValueError("步骤依赖存在环")
+
+def _step_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    step = {"id": row["step_id"], "desc": row["desc"], "status": row["status"]}
+    depends_on = json.loads(row["depends_on"] or "[]")
+    if depends_on:
+        step["depends_on"] = depends_on
+    if row["resource"]:
+        step["resource"] = row["resource"]
+    return step
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts)) if ts else None
+
+class TaskStore:
+    """
+    按会话保存任务计划的 SQLite 存储（WAL 模式）。
+
+    每个会话的当前计划是其最近创建的计划；创建新计划时旧计划标记为 superseded 而不删除，
+    全部步骤完成后计划标记为 completed（追加步骤会重新打开），历史计划保留供 history/get_plan 查询。
+    步骤状态转换、追加步骤（按 plans.next_step_id 分配编号）均在单个事务内完成。
+
+    步骤可声明依赖（depends_on）与资源类别（resource），构成 DAG：依赖全部 completed 的 pending 步骤为就绪步骤，
+    由 read_task_plan 逐个取用，或由 app/scheduler.py 认领（running）后并行交给子 Agent 执行，结果写回 completed/failed。
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("TASK_STORE_PATH") or _DEFAULT_PATH
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            # 早期版本创建的 steps 表没有依赖与资源列
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(steps)")}
+            with conn:
+                if "depends_on" not in columns:
+                    conn.execute("ALTER TABLE steps ADD COLUMN depends_on TEXT NOT NULL DEFAULT '[]'")
+                if "resource" not in columns:
+                    conn.execute("ALTER TABLE steps ADD COLUMN resource TEXT")
+                # 上次进程退出时仍在执行的步骤已没有子 Agent 在运行，放回 pending 以便重新调度
+                conn.execute("UPDATE steps SET status = 'pending' WHERE status = 'running'")
+            self._conn = conn
+        return self._conn
+
+    def _current_plan_id(self, conn: sqlite3.Connection, session: str) -> Optional[int]:
+        # 会话最近创建的计划即当前计划（已完成的计划仍可读取进度或追加步骤）
+        row = conn.execute(
+            "SELECT id FROM plans WHERE session = ? AND status != 'superseded' ORDER BY id DESC LIMIT 1",
+            (session,),
+        ).fetchone()
+        return row["id"] if row else None
+
+    def _progress(self, conn: sqlite3.Connection, plan_id: int) -> Dict[str, int]:
+        row = conn.execute(
+            "SELECT COUNT(*) AS total, COALESCE(SUM(status = 'completed'), 0) AS completed FROM steps WHERE plan_id = ?",
+            (plan_id,),
+        ).fetchone()
+        return {"total": row["total"], "completed": row["completed"]}
+
+    def _ready_rows(self, conn: sqlite3.Connection, plan_id: int) -> List[sqlite3.Row]:
+        pending = conn.execute(
+            "SELECT * FROM steps WHERE plan_id = ? AND status = 'pending' ORDER BY step_id", (plan_id,)
+        ).fetchall()
+        if not pending:
+            return []
+        completed = {r[0] for r in conn.execute(
+            "SELECT step_id FROM steps WHERE plan_id = ? AND status = 'completed'", (plan_id,)
+        )}
+        return [row for row in pending if set(json.loads(row["depends_on"] or "[]")) <= completed]
+
+    # --- 计划与步骤 ---
+
+    def create_plan(self, session: str, steps: Sequence[Any]) -> int:
+        """
+        为会话创建新计划（原计划标记为 superseded），返回计划 ID。步骤格式见 _normalize_steps。
+        """
+        steps = _normalize_steps(steps)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "UPDATE plans SET status = 'superseded', finished_at = COALESCE(finished_at, ?) "
+                    "WHERE session = ? AND status != 'superseded'",
+                    (now, session),
+                )
+                plan_id = conn.execute(
+                    "INSERT INTO plans(session, status, next_step_id, created_at) VALUES (?, 'in_progress', ?, ?)",
+                    (session, len(steps) + 1, now),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO steps(plan_id, step_id, desc, status, depends_on, resource) VALUES (?, ?, ?, 'pending', ?, ?)",
+                    [(plan_id, i + 1, s["desc"], json.dumps(s["depends_on"]), s["resource"]) for i, s in enumerate(steps)],
+                )
+        return plan_id
+
+    def next_step(self, session: str) -> Optional[Dict[str, Any]]:
+        """
+        返回会话当前计划的进度与第一个就绪步骤（首次读取时记录 started_at）；没有计划时返回 None。
+        没有就绪步骤时 step 为 None，running/failed/blocked 给出正在执行、失败与等待依赖的步骤数。
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                plan_id = self._current_plan_id(conn, session)
+                if plan_id is None:
+                    return None
+                ready = self._ready_rows(conn, plan_id)
+                row = ready[0] if ready else None
+                if row is not None and row["started_at"] is None:
+                    conn.execute(
+                        "UPDATE steps SET started_at = ? WHERE plan_id = ? AND step_id = ?",
+                        (time.time(), plan_id, row["step_id"]),
+                    )
+                progress = self._progress(conn, plan_id)
+                counts = dict(conn.execute(
+                    "SELECT status, COUNT(*) FROM steps WHERE plan_id = ? GROUP BY status", (plan_id,)
+                ).fetchall())
+        step = _step_dict(row) if row else None
+        return {
+            "plan_id": plan_id,
+            "step": step,
+            "running": counts.get("running", 0),
+            "failed": counts.get("failed", 0),
+            "blocked": counts.get("pending", 0) - len(ready),
+            **progress,
+        }
+
+    def claim_ready(self, session: str, limit: int, busy_resources: Sequence[str] = ()) -> List[Dict[str, Any]]:
+        """
+        认领至多 limit 个就绪步骤（pending -> running），跳过资源类别在 busy_resources 中的步骤；
+        同一批中 desktop 步骤至多一个。返回步骤（含 depends_on 步骤的结果，供子 Agent 参考）。
+        """
+        now = time.time()
+        busy = set(busy_resources)
+        claimed = []
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                plan_id = self._current_plan_id(conn, session)
+                if plan_id is None:
+                    return []
+                for row in self._ready_rows(conn, plan_id):
+                    if len(claimed) >= limit:
+                        break
+                    resource = row["resource"]
+                    if resource in busy:
+                        continue
+                    if resource == EXCLUSIVE_STEP_RESOURCE:
+                        busy.add(resource)
+                    conn.execute(
+                        "UPDATE steps SET status = 'running', started_at = COALESCE(started_at, ?) "
+                        "WHERE plan_id = ? AND step_id = ?",
+                        (now, plan_id, row["step_id"]),
+                    )
+                    step = _step_dict(row)
+                    step["status"] = "running"
+                    claimed.append(step)
+                for step in claimed:
+                    deps = step.get("depends_on") or []
+                    if deps:
+                        placeholders = ",".join("?" for _ in deps)
+                        step["dependency_results"] = {
+                            r["step_id"]: r["result"] or "" for r in conn.execute(
+                                f"SELECT step_id, result FROM steps WHERE plan_id = ? AND step_id IN ({placeholders})",
+                                [plan_id] + deps,
+                            )
+                        }
+                    step["plan_id"] = plan_id
+        return claimed
+
+    def fail_step(self, session: str, plan_id: int, step_id: int, error: str):
+        """
+        记录子 Agent 执行失败的步骤；依赖它的步骤保持 pending（blocked），可由主 Agent 处理后 mark_task_completed。
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "UPDATE steps SET status = 'failed', result = ?, completed_at = ? "
+                    "WHERE plan_id = ? AND step_id = ? AND status = 'running'",
+                    (error, time.time(), plan_id, step_id),
+                )
+
+    def complete_step(self, session: str, step_id: int, result: str = "", plan_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        标记步骤完成（plan_id 为空时作用于会话当前计划）；最后一个步骤完成时计划随之标记为 completed。
+        Returns: 没有计划时为 None；否则 {"found": bool, "plan_id", "plan_completed"}。
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if plan_id is None:
+                    plan_id = self._current_plan_id(conn, session)
+                if plan_id is None:
+                    return None
+                found = conn.execute(
+                    "UPDATE steps SET status = 'completed', result = ?, completed_at = COALESCE(completed_at, ?), "
+                    "started_at = COALESCE(started_at, ?) WHERE plan_id = ? AND step_id = ?",
+                    (result, now, now, plan_id, step_id),
+                ).rowcount > 0
+                remaining = conn.execute(
+                    "SELECT 1 FROM steps WHERE plan_id = ? AND status != 'completed' LIMIT 1", (plan_id,)
+                ).fetchone()
+                plan_completed = found and remaining is None
+                if plan_completed:
+                    conn.execute(
+                        "UPDATE plans SET status = 'completed', finished_at = COALESCE(finished_at, ?) "
+                        "WHERE id = ? AND status = 'in_progress'",
+                        (now, plan_id),
+                    )
+        return {"found": found, "plan_id": plan_id, "plan_completed": plan_completed}
+
+    def append_step(self, session: str, desc: str, depends_on: Sequence[int] = (), resource: Optional[str] = None) -> Optional[int]:
+        """
+        在会话当前计划末尾追加步骤（已完成的计划重新进入 in_progress），返回新步骤 ID；没有计划时返回 None。
+        依赖的步骤不存在或资源类别未知时抛出 ValueError。
+        """
+        step = _normalize_steps([{"desc": desc, "resource": resource}])[0]
+        depends_on = sorted({int(d) for d in depends_on or ()})
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                plan_id = self._current_plan_id(conn, session)
+                if plan_id is None:
+                    return None
+                step_id = conn.execute("SELECT next_step_id FROM plans WHERE id = ?", (plan_id,)).fetchone()[0]
+                existing = {r[0] for r in conn.execute("SELECT step_id FROM steps WHERE plan_id = ?", (plan_id,))}
+                missing = [d for d in depends_on if d not in existing]
+                if missing:
+                    raise ValueError(f"依赖的步骤 {missing} 不存在")
+                conn.execute(
+                    "UPDATE plans SET next_step_id = ?, status = 'in_progress', finished_at = NULL WHERE id = ?",
+                    (step_id + 1, plan_id),
+                )
+                conn.execute(
+                    "INSERT INTO steps(plan_id, step_id, desc, status, depends_on, resource) VALUES (?, ?, ?, 'pending', ?, ?)",
+                    (plan_id, step_id, step["desc"], json.dumps(depends_on), step["resource"]),
+                )
+        return step_id
+
+    # --- 历史查询 ---
+
+    def get_plan(self, plan_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            plan = conn.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if plan is None:
+                return None
+            steps = conn.execute(
+                "SELECT * FROM steps WHERE plan_id = ? ORDER BY step_id", (plan_id,)
+            ).fetchall()
+        return {
+            "id": plan["id"],
+            "session": plan["session"],
+            "status": plan["status"],
+            "created_at": _iso(plan["created_at"]),
+            "finished_at": _iso(plan["finished_at"]),
+            "steps": [{
+                "id": s["step_id"],
+                "desc": s["desc"],
+                "status": s["status"],
+                "depends_on": json.loads(s["depends_on"] or "[]"),
+                "resource": s["resource"],
+                "result": s["result"],
+                "started_at": _iso(s["started_at"]),
+                "completed_at": _iso(s["completed_at"]),
+                "duration_s": round(s["completed_at"] - s["started_at"], 3) if s["completed_at"] and s["started_at"] else None,
+            } for s in steps],
+        }
+
+    def history(self, session: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        最近的计划摘要（可按会话过滤），包含步骤数、完成数与耗时。
+        """
+        where, params = ("WHERE p.session = ?", [session]) if session else ("", [])
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT p.id, p.session, p.status, p.created_at, p.finished_at, "
+                "COUNT(s.step_id) AS total, COALESCE(SUM(s.status = 'completed'), 0) AS completed "
+                f"FROM plans p LEFT JOIN steps s ON s.plan_id = p.id {where} "
+                "GROUP BY p.id ORDER BY p.id DESC LIMIT ?",
+                params + [int(limit)],
+            ).fetchall()
+        return [{
+            "id": r["id"],
+            "session": r["session"],
+            "status": r["status"],
+            "steps": r["total"],
+            "completed": r["completed"],
+            "created_at": _iso(r["created_at"]),
+            "finished_at": _iso(r["finished_at"]),
+            "duration_s": round(r["finished_at"] - r["created_at"], 3) if r["finished_at"] else None,
+        } for r in rows]
+
+# Global instance
+task_store = TaskStore()
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "data", "tool_traces.jsonl")
+
+# 参数序列化后超过该长度只保存摘要，这样的调用不能蒸馏为宏
+MAX_ARGS_CHARS = 20000
+_RESULT_PREVIEW_CHARS = 200
+# 录制时 success 为 true 的 JSON 结果，回放时出现 "success": false 即判定失败
+_SUCCESS_FALSE_RE = r'"success"\s*:\s*false'
+
+# 蒸馏宏时跳过的工具：计划、经验库、工具检索与技能生成只服务于模型的决策过程
+MACRO_SKIPPED_TOOLS = {
+    "create_task_plan",
+    "read_task_plan",
+    "mark_task_completed",
+    "append_task_step",
+    "run_plan_steps",
+    "search_tools",
+    "get_operation_experience",
+    "add_operation_experience",
+    "compress_operation_experience",
+    "inspect_environment",
+    "scaffold_skill",
+    "write_tool_code",
+    "reload_skills",
+}
+
+def digest(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def _is_json(text: str) -> bool:
+    stripped = text.lstrip()
+    if not stripped or stripped[0] not in "[{":
+        return False
+    try:
+        json.loads(text)
+        return True
+    except Exception:
+        return False
+
+def new_task_id() -> str:
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+class TraceLog:
+    """
+    工具调用轨迹的追加式日志（JSONL，默认 app/data/tool_traces.jsonl，可用 TOOL_TRACE_PATH 指定）。
+
+    每行一条记录：kind=call 为一次工具调用（参数、结果摘要 sha1/长度/预览、耗时与成败），
+    kind=task 为一轮任务的结束记录（输入、最终状态、耗时与 LLM 调用次数）。
+    只追加不改写，既是宏蒸馏的来源，也可作为回归用例集。TOOL_TRACE_ENABLED=0 关闭记录。
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("TOOL_TRACE_PATH") or _DEFAULT_PATH
+        self.enabled = (os.getenv("TOOL_TRACE_ENABLED") or "1").strip().lower() not in ("0", "false", "no")
+        self._lock = threading.Lock()
+
+    def append(self, record: Dict[str, Any]):
+        if not self.enabled:
+            return
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def record_call(self, task: str, session: str, seq: int, tool: str, args: Any, result: Any,
+                    latency_ms: float, error: Optional[str] = None):
+        args_text = json.dumps(args, ensure_ascii=False, default=str)
+        record = {
+            "kind": "call",
+            "task": task,
+            "session": session,
+            "seq": seq,
+            "ts": round(time.time(), 3),
+            "tool": tool,
+            "latency_ms": round(latency_ms, 1),
+            "ok": error is None,
+        }
+        if len(args_text) > MAX_ARGS_CHARS:
+            record["args_digest"] = digest(args_text)
+            record["args_truncated"] = True
+        else:
+            record["args"] = args
+        if error is not None:
+            record["error"] = error[:_RESULT_PREVIEW_CHARS]
+        else:
+            if isinstance(result, (dict, list)):
+                text = json.dumps(result, ensure_ascii=False, default=str)
+            else:
+                text = result if isinstance(result, str) else str(getattr(result, "content", result))
+            is_json = _is_json(text)
+            record["result"] = {
+                "sha1": digest(text),
+                "len": len(text),
+                "json": is_json,
+                "preview": text[:_RESULT_PREVIEW_CHARS],
+            }
+            # 以 {"success": ...} 报告成败的工具，记录成功标记供宏生成结构化判定
+            if is_json:
+                parsed = result if isinstance(result, dict) else json.loads(text)
+                if isinstance(parsed, dict) and isinstance(parsed.get("success"), bool):
+                    record["result"]["success"] = parsed["success"]
+        self.append(record)
+
+    def record_task(self, task: str, session: str, user_input: str, state: Optional[str],
+                    duration_s: float, llm_calls: int = 0):
+        self.append({
+            "kind": "task",
+            "task": task,
+            "session": session,
+            "ts": round(time.time(), 3),
+            "input": user_input,
+            "state": state,
+            "duration_s": round(duration_s, 3),
+            "llm_calls": llm_calls,
+        })
+
+    def _read(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with self._lock, open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except Exception:
+                    continue
+        return records
+
+    def tasks(self, session: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        最近结束的任务（新的在前），附带工具调用次数。
+        """
+        records = self._read()
+        counts: Dict[str, int] = {}
+        for r in records:
+            if r.get("kind") == "call":
+                counts[r["task"]] = counts.get(r["task"], 0) + 1
+        tasks = [dict(r, calls=counts.get(r["task"], 0)) for r in records
+                 if r.get("kind") == "task" and (session is None or r.get("session") == session)]
+        return tasks[::-1][:limit]
+
+    def load(self, task: str) -> Optional[Dict[str, Any]]:
+        """
+        一个任务的结束记录与按 seq 排序的工具调用；任务不存在时返回 None。
+        """
+        summary, calls = None, []
+        for r in self._read():
+            if r.get("task") != task:
+                continue
+            if r.get("kind") == "task":
+                summary = r
+            elif r.get("kind") == "call":
+                calls.append(r)
+        if summary is None:
+            return None
+        return {"task": summary, "calls": sorted(calls, key=lambda c: c["seq"])}
+
+# --- 宏蒸馏 ---
+
+class MacroError(Exception):
+    """
+    任务轨迹不能蒸馏为宏（任务未完成、没有可回放的工具调用或参数被截断）。
+    """
+
+def _input_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, list):
+        return "list"
+    if isinstance(value, dict):
+        return "dict"
+    return "str"
+
+def _escape(value: Any) -> Any:
+    # 录制的字面值中的花括号在回放时不能被当作变量引用
+    if isinstance(value, str):
+        return value.replace("{", "{{").replace("}", "}}")
+    if isinstance(value, list):
+        return [_escape(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _escape(v) for k, v in value.items()}
+    return value
+
+def distill_macro(trace: Dict[str, Any], name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    把一个以 DONE 结束的任务轨迹蒸馏为带 script 的 task_template（见 app/replay.py），不调用模型。
+
+    - 只保留成功的业务工具调用（跳过 MACRO_SKIPPED_TOOLS 与失败后被重试的调用），去掉相邻的重复调用；
+    - 参数值逐字出现在用户输入中的字符串参数提升为 inputs（默认值为录制时的值）；
+    - 参数值与之前某次调用的完整结果相同（按 sha1 比较）时改写为对该结果的引用；
+    - 结果为 JSON 的步骤记录 expect {"json": true}，录制时 success 为 true 的再加上对 "success": false 的 not_regex；
+      其余使用默认的错误判定。
+    """
+    task = trace["task"]
+    if (task.get("state") or "").upper() != "DONE":
+        raise MacroError(f"任务 {task['task']} 未以 DONE 结束")
+    user_input = task.get("input") or ""
+
+    calls = []
+    for call in trace["calls"]:
+        if not call.get("ok") or call["tool"] in MACRO_SKIPPED_TOOLS:
+            continue
+        if call.get("args_truncated"):
+            raise MacroError(f"工具 {call['tool']} 的参数过大未完整记录，无法生成宏")
+        if calls and calls[-1]["tool"] == call["tool"] and calls[-1].get("args") == call.get("args"):
+            continue
+        calls.append(call)
+    if not calls:
+        raise MacroError(f"任务 {task['task']} 没有可回放的工具调用")
+
+    inputs: List[Dict[str, Any]] = []
+    input_by_value: Dict[str, str] = {}
+    result_vars: Dict[str, str] = {}
+    script = []
+
+    def input_name(arg: str) -> str:
+        used = {i["name"] for i in inputs}
+        candidate, n = arg, 2
+        while candidate in used:
+            candidate, n = f"{arg}_{n}", n + 1
+        return candidate
+
+    def parameterize(arg: str, value: Any) -> Any:
+        if isinstance(value, str) and digest(value) in result_vars:
+            return "{" + result_vars[digest(value)] + "}"
+        if isinstance(value, str) and len(value) >= 2 and value in user_input and "{" not in value:
+            if value not in input_by_value:
+                name = input_by_value[value] = input_name(arg)
+                inputs.append({"name": name, "type": _input_type(value), "default": value})
+            return "{" + input_by_value[value] + "}"
+        return _escape(value)
+
+    for i, call in enumerate(calls):
+        args = call.get("args") or {}
+        if not isinstance(args, dict):
+            args = {"input": args}
+        step = {"tool": call["tool"], "args": {k: parameterize(k, v) for k, v in args.items()}}
+        result = call.get("result") or {}
+        if result.get("json"):
+            step["expect"] = {"json": True}
+            if result.get("success") is True:
+                step["expect"]["not_regex"] = _SUCCESS_FALSE_RE
+        if result.get("sha1"):
+            var = f"step{i + 1}"
+            step["save_as"] = var
+            result_vars.setdefault(result["sha1"], var)
+        script.append(step)
+
+    # 没有被引用的结果无需保存
+    referenced = json.dumps([s["args"] for s in script], ensure_ascii=False)
+    for step in script:
+        if step.get("save_as") and not re.search(r"\{" + step["save_as"] + r"[.}]", referenced):
+            del step["save_as"]
+
+    return {
+        "name": name or f"宏: {user_input[:40]}",
+        "trigger_keywords": [],
+        "steps": [f"调用 {s['tool']}" for s in script],
+        "inputs": inputs,
+        "outputs": [],
+        "constraints": [],
+        "tags": ["macro"],
+        "script": script,
+        "source_task": task["task"],
+        "recorded_duration_s": task.get("duration_s"),
+        "recorded_llm_calls": task.get("llm_calls"),
+    }
+
+# Global instance
+trace_log = TraceLog()
@@ -2,21 +2,46 @@ import os
 import platform
 import ctypes
 import sys
-import re
 import threading
+import logging
 import json
-from web.backend.main import start as start_web_server
-from web.backend.shared import shared
+from app.profiling import profiler
+
+PROFILE_STARTUP_FLAG = "--profile-startup"
+if PROFILE_STARTUP_FLAG in sys.argv:
+    profiler.enable()
+
+with profiler.phase("import web.backend"):
+    from web.backend.main import start as start_web_server
+    from web.backend.shared import shared
 
 os.environ.setdefault("HF_ENDPOINT", "https://hf-mirror.com")
 os.environ.setdefault("HUGGINGFACE_HUB_ENDPOINT", "https://hf-mirror.com")
 
-from app.agent import create_agent_executor, create_llm
-from app.skills.system_skill.scripts.experience_tools import add_operation_experience, get_operation_experience
+with profiler.phase("import app.agent"):
+    from app.agent import create_agent_executor, create_llm, invoke_tool, refresh_agent_executor
+    from app.replay import (
+        ReplayError, compile_script, extract_inputs, format_fallback_input, format_replay_output,
+        resolve_inputs, run_script,
+    )
+    from app.history import HistoryManager
+    from app.cognition import cognition_pipeline
+    from app.callbacks import EventBusCallbackHandler, TokenUsageCallbackHandler, ToolTraceCallbackHandler
+    from app.traces import MacroError, distill_macro, new_task_id, trace_log
+    from app.events import EventLogHandler, event_bus, say
+    from app.context import DEFAULT_SESSION_ID
+    from app.runtime import session_manager
+with profiler.phase("import experience_tools"):
+    from app.memory import memory_service
+    from app.memory.compaction import compaction_job
+    from app.skills.system_skill.scripts.experience_tools import get_operation_experience
+
+logger = logging.getLogger(__name__)
 
 RELOAD_SIGNAL = "__RELOAD_SKILLS__"
 SET_MODEL_PREFIX = "__SET_MODEL__:"
-ANSI_ESCAPE_RE = re.compile(r"\x1b\[[0-9;]*[ -/]*[@-~]")
+SUMMARY_COMMANDS = ("/summaries", "/accept", "/reject")
+TRACE_COMMANDS = ("/traces", "/macro")
 
 def parse_state(output: str):
     lines = [line.strip() for line in output.splitlines() if line.strip()]
@@ -37,111 +62,10 @@ def strip_reload_signal(output: str):
     changed = len(kept) != len(lines)
     return "\n".join(kept).strip(), changed
 
-def _format_history_for_summary(messages):
-    lines = []
-    for role, content in messages:
-        if role == "assistant":
-            content, _ = strip_reload_signal(content)
-        lines.append(f"{role}: {content}")
-    return "\n\n".join(lines).strip()
-
 def _extract_project_id():
     base_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.basename(base_dir)
 
-def _normalize_tags(tags):
-    if not tags:
-        return []
-    cleaned = []
-    for tag in tags:
-        if not tag:
-            continue
-        item = str(tag).strip()
-        if item:
-            cleaned.append(item)
-    return list(dict.fromkeys(cleaned))
-
-def _build_cognition_summary(chat_history, llm, project_id, user_id):
-    transcript = _format_history_for_summary(chat_history[-40:])
-    system_text = "你是个人认知总结器。基于对话内容抽取稳定偏好与可复用经验，输出严格 JSON。字段: summary_type, project, user_id, items{behavior_preferences, code_style_preferences, task_experiences}, task_templates, sources, proposed_tags。若对话包含明确完成的可复用流程，必须在 task_experiences 提供 1-3 条，描述流程与关键决策，不包含一次性数据。若可抽象为模板，task_templates 输出 1-2 个对象，字段: name, trigger_keywords, steps, inputs, outputs, constraints, tags。没有内容的数组输出空数组。只输出 JSON，不要额外文本。"
-    user_text = f"项目: {project_id}\n用户: {user_id}\n对话:\n{transcript}\n\n请输出 JSON："
-    from langchain_core.messages import SystemMessage, HumanMessage
-    resp = llm.invoke([SystemMessage(content=system_text), HumanMessage(content=user_text)])
-    content = getattr(resp, "content", "") or str(resp)
-    return content.strip()
-
-def _save_cognition_summary(summary, project_id, user_id):
-    items = summary.get("items") or {}
-    task_templates = summary.get("task_templates") or []
-    proposed_tags = _normalize_tags(summary.get("proposed_tags") or [])
-    base_tags = proposed_tags + [f"project:{project_id}"]
-    saved = []
-
-    def save_items(values, scope, memory_type, topic_tag):
-        if not values:
-            return
-        for value in values:
-            content = str(value).strip()
-            if not content:
-                continue
-            tags = _normalize_tags(base_tags + [f"scope:{scope}", topic_tag])
-            result = add_operation_experience.invoke({
-                "system_name": "personal_cognition",
-                "content": content,
-                "tags": tags,
-                "scope": scope,
-                "project_id": project_id,
-                "user_id": user_id,
-                "memory_type": memory_type
-            })
-            saved.append(result)
-
-    save_items(items.get("behavior_preferences"), "user", "behavior", "topic:behavior")
-    save_items(items.get("code_style_preferences"), "user", "code_style", "topic:code_style")
-    save_items(items.get("task_experiences"), "project", "task", "topic:task")
-    _save_task_templates(task_templates, project_id, user_id, base_tags, saved)
-
-    return saved
-
-def _save_task_templates(task_templates, project_id, user_id, base_tags, saved):
-    if not task_templates:
-        return
-    for template in task_templates:
-        if not isinstance(template, dict):
-            continue
-        name = str(template.get("name") or "").strip()
-        if not name:
-            continue
-        tags = _normalize_tags(base_tags + ["scope:project", "topic:task_template"])
-        if isinstance(template.get("tags"), list):
-            tags = _normalize_tags(tags + template.get("tags"))
-        content = json.dumps(template, ensure_ascii=False)
-        result = add_operation_experience.invoke({
-            "system_name": "task_template",
-            "content": content,
-            "tags": tags,
-            "scope": "project",
-            "project_id": project_id,
-            "user_id": user_id,
-            "memory_type": "task_template"
-        })
-        saved.append(result)
-
-def _should_prompt_save(summary_text):
-    try:
-        data = json.loads(summary_text)
-    except Exception:
-        return False, None
-    items = data.get("items") or {}
-    behavior = items.get("behavior_preferences") or []
-    code_style = items.get("code_style_preferences") or []
-    tasks = items.get("task_experiences") or []
-    templates = data.get("task_templates") or []
-    proposed_tags = data.get("proposed_tags") or []
-    has_items = any([behavior, code_style, tasks, templates])
-    has_tags = len(_normalize_tags(proposed_tags)) > 0
-    return has_items or has_tags, data
-
 def _parse_template_results(raw_text):
     try:
         data = json.loads(raw_text)
@@ -183,6 +107,8 @@ def _format_template_for_prompt(template):
     if constraints:
         parts.append("约束:")
         parts.extend([f"- {c}" for c in constraints])
+    if template.get("script"):
+        parts.append(f"脚本: {len(template['script'])} 步（可直接执行，无需模型逐步规划）")
     return "\n".join(parts)
 
 def _get_task_experiences(user_input, project_id, user_id):
@@ -209,7 +135,10 @@ def _format_experiences_for_prompt(experiences):
     parts.extend([f"- {e}" for e in experiences])
     return "\n".join(parts)
 
-def _maybe_apply_template(user_input, project_id, user_id):
+def _maybe_apply_template(user_input, project_id, user_id, session):
+    """
+    检索并确认任务模板。Returns: (本轮输入, 用户确认使用的模板或 None)。
+    """
     raw = get_operation_experience.invoke({
         "query": user_input,
         "n_results": 3,
@@ -221,58 +150,115 @@ def _maybe_apply_template(user_input, project_id, user_id):
     results = _parse_template_results(raw) if isinstance(raw, str) else []
     template = _select_template(results)
     if not template:
-        return user_input
+        return user_input, None
     preview = _format_template_for_prompt(template)
-    print("Agent: 检索到可用模板\n")
-    print(preview + "\n")
+    say("Agent: 检索到可用模板\n")
+    say(preview + "\n")
     print("User: 是否使用该模板执行？(yes/no) ", end="", flush=True)
-    confirm_input = shared.get_input().strip().lower()
+    event_bus.message("是否使用该模板执行？(yes/no)", role="system")
+    confirm_input = session.get_input().strip().lower()
     if confirm_input in ["y", "yes", "是", "使用", "好", "ok"]:
         experiences = _get_task_experiences(user_input, project_id, user_id)
         exp_text = _format_experiences_for_prompt(experiences)
         exp_block = f"\n\n{exp_text}" if exp_text else ""
-        return f"请按以下模板执行任务，并结合用户需求与相关经验补充细节：\n{preview}{exp_block}\n\n用户需求：{user_input}"
-    return user_input
-
-def _is_summary_message(msg):
-    if not msg:
-        return False
-    role, content = msg
-    if role != "system":
-        return False
-    return isinstance(content, str) and content.startswith("对话摘要（用于延续上下文）：")
-
-def maybe_summarize_history(chat_history, llm, max_turns=20):
-    non_summary = chat_history[:]
-    rolling_summary = None
-    if non_summary and _is_summary_message(non_summary[0]):
-        rolling_summary = non_summary[0][1].split("：", 1)[1].strip()
-        non_summary = non_summary[1:]
-
-    chunk_size = max_turns * 2
-    if len(non_summary) <= chunk_size:
-        return chat_history
-
-    chunk = non_summary[:chunk_size]
-    rest = non_summary[chunk_size:]
-
-    from langchain_core.messages import SystemMessage, HumanMessage
-
-    system_text = "你是对话摘要器。把对话压缩为可用于继续对话的摘要，保留关键信息、约束、已完成事项、未完成事项、关键决定、关键参数/路径/变量名,并给出最后一轮对话执行到哪一步了。只输出摘要正文。"
-    transcript = _format_history_for_summary(chunk)
-    user_text = ""
-    if rolling_summary:
-        user_text += f"已有摘要：\n{rolling_summary}\n\n"
-    user_text += f"需要压缩的新增对话（按顺序）：\n{transcript}\n\n请输出更新后的摘要："
-
-    resp = llm.invoke([SystemMessage(content=system_text), HumanMessage(content=user_text)])
-    new_summary = getattr(resp, "content", "") or str(resp)
-    new_summary = new_summary.strip()
-
-    summary_msg = ("system", f"对话摘要（用于延续上下文）：\n{new_summary}")
-    if rest:
-        return [summary_msg] + rest
-    return [summary_msg]
+        return f"请按以下模板执行任务，并结合用户需求与相关经验补充细节：\n{preview}{exp_block}\n\n用户需求：{user_input}", template
+    return user_input, None
+
+def _maybe_replay_template(template, user_input, session, callbacks):
+    """
+    模板带 script 时直接按脚本调用工具，不经过模型逐步规划。
+    Returns: (是否已完成本轮, 交给模型继续执行的输入或 None)。
+    """
+    try:
+        script = compile_script(template)
+        if script is None:
+            return False, None
+        inputs = resolve_inputs(script["inputs"], extract_inputs(session.executor.llm, script["inputs"], user_input))
+    except ReplayError as e:
+        say(f"Agent: 模板脚本无法直接执行（{e}），改由模型执行\n")
+        return False, None
+    say(f"Agent: 按模板脚本直接执行 {len(script['steps'])} 个步骤\n")
+    tools = {tool.name: tool for tool in session.executor.tools}
+    report = run_script(script, tools, inputs, lambda tool, args: invoke_tool(tool, args, callbacks))
+    event_bus.metric(
+        "template_replay", report["elapsed_s"], ok=report["ok"], steps=len(report["steps"]),
+        recorded_s=template.get("recorded_duration_s"),
+    )
+    if report["ok"]:
+        output = format_replay_output(template, report)
+        say(f"Agent: {output}\n")
+        event_bus.state("DONE", step=0)
+        session.history.extend([("user", user_input), ("assistant", f"{output}\nSTATE: DONE")])
+        return True, None
+    say(f"Agent: 模板脚本第 {report['failed_at'] + 1} 步未通过校验（{report['reason']}），交由模型继续\n")
+    return False, format_fallback_input(_format_template_for_prompt(template), user_input, report)
+
+def handle_summary_command(command: str):
+    """
+    控制台处理待确认的认知总结：/summaries 列出，/accept [id ...|all] 保存，/reject [id ...|all] 放弃。
+    """
+    parts = command.split()
+    name, args = parts[0].lower(), parts[1:]
+    if name == "/summaries":
+        pending = cognition_pipeline.list_pending()
+        if not pending:
+            running = "（后台仍有总结在生成）" if cognition_pipeline.in_flight else ""
+            say(f">>> 系统: 没有待确认的总结{running}\n", role="system")
+            return
+        for item in pending:
+            say(f"#{item['id']} [{item['created_at']}] 项目 {item['project_id']}\n{item.get('raw') or ''}\n", role="system")
+        return
+    ids = None if not args or args == ["all"] else args
+    if name == "/accept":
+        result = cognition_pipeline.accept(ids)["accepted"]
+        saved = [r for r in result if "error" not in r]
+        failed = [r for r in result if "error" in r]
+        say(f">>> 系统: 已保存 {len(saved)} 条总结到经验库" + (f"，{len(failed)} 条失败: {failed[0]['error']}" if failed else "") + "\n", role="system")
+    else:
+        rejected = cognition_pipeline.reject(ids)["rejected"]
+        say(f">>> 系统: 已放弃 {len(rejected)} 条总结\n", role="system")
+
+def handle_trace_command(command: str, session, project_id, user_id):
+    """
+    工具调用轨迹：/traces 列出本会话最近的任务，/macro [task_id] [名称] 把 DONE 任务蒸馏为可直接回放的模板并保存。
+    """
+    parts = command.split()
+    name, args = parts[0].lower(), parts[1:]
+    if name == "/traces":
+        tasks = trace_log.tasks(session.id)
+        if not tasks:
+            say(">>> 系统: 还没有记录到任务轨迹\n", role="system")
+            return
+        for task in tasks:
+            say(f"{task['task']} [{task.get('state') or '-'}] {task['calls']} 次工具调用，{task['llm_calls']} 次模型调用，"
+                f"{task['duration_s']}s  {task['input'][:60]}\n", role="system")
+        return
+    task_id = args[0] if args and not args[0].startswith("/") and trace_log.load(args[0]) else None
+    macro_name = " ".join(args[1:] if task_id else args) or None
+    if task_id is None:
+        done = [t for t in trace_log.tasks(session.id, limit=50) if (t.get("state") or "").upper() == "DONE"]
+        if not done:
+            say(">>> 系统: 没有可蒸馏的 DONE 任务\n", role="system")
+            return
+        task_id = done[0]["task"]
+    try:
+        template = distill_macro(trace_log.load(task_id), macro_name)
+    except MacroError as e:
+        say(f">>> 系统: 无法生成宏: {e}\n", role="system")
+        return
+    from app.cognition import normalize_tags
+    from app.skills.system_skill.scripts.experience_tools import bulk_add_operation_experiences
+    bulk_add_operation_experiences([{
+        "system_name": "task_template",
+        "content": json.dumps(template, ensure_ascii=False),
+        "tags": normalize_tags([f"project:{project_id}", "scope:project", "topic:task_template", "macro"]),
+        "scope": "project",
+        "project_id": project_id,
+        "user_id": user_id,
+        "memory_type": "task_template",
+    }])
+    say(f">>> 系统: 已从任务 {task_id} 生成宏「{template['name']}」（{len(template['script'])} 步，"
+        f"{len(template['inputs'])} 个参数），相似需求将提示直接回放\n", role="system")
 
 def enable_dpi_awareness():
     if platform.system() != "Windows":
@@ -285,195 +271,199 @@ def enable_dpi_awareness():
         except Exception:
             pass
 
-class DualOutput:
-    def __init__(self, original_stdout):
-        self.original_stdout = original_stdout
-        self.blocked_tokens = [
-        ]
-        
-    def _sanitize_for_web(self, message):
-        cleaned = ANSI_ESCAPE_RE.sub("", message)
-        stripped = cleaned.strip()
-        if stripped == "User:":
-            return ""
-        lowered = cleaned.lower()
-        if any(token in lowered for token in self.blocked_tokens):
-            return ""
-        return cleaned
-
-    def write(self, message):
-        self.original_stdout.write(message)
-        # Broadcast to web, non-blocking
-        # Only broadcast non-empty messages to avoid noise
-        if message: 
-             sanitized = self._sanitize_for_web(message)
-             if sanitized.strip():
-                 shared.broadcast_threadsafe(sanitized)
-            
-    def flush(self):
-        self.original_stdout.flush()
-
-    def isatty(self):
-        return getattr(self.original_stdout, 'isatty', lambda: False)()
-    
-    def __getattr__(self, name):
-        return getattr(self.original_stdout, name)
-
 def console_reader():
     """Reads from stdin and puts into shared input queue"""
     while True:
         try:
             # Note: input() blocks. 
-            text = input()
+            text = input("User: ")
             shared.put_input(text)
         except EOFError:
             break
         except Exception as e:
-            print(f"Console input error: {e}")
+            logger.error(f"Console input error: {e}")
             break
 
+def run_turn(session, user_input, summary_llm, stream_handler):
+    """
+    在会话的工作线程中处理一条输入：模板确认、多步自动执行、技能热加载与认知总结。
+    """
+    if user_input.startswith(SUMMARY_COMMANDS):
+        handle_summary_command(user_input)
+        return
+    project_id = _extract_project_id()
+    user_id = os.getenv("LOCAL_USER_ID", "local_user")
+    if user_input.startswith(TRACE_COMMANDS):
+        handle_trace_command(user_input, session, project_id, user_id)
+        return
+    # 记录本轮的工具调用轨迹；以 DONE 结束的任务可用 /macro 蒸馏为可直接回放的模板
+    trace_handler = ToolTraceCallbackHandler(new_task_id(), session.id)
+    state = None
+    try:
+        state = _run_task(session, user_input, summary_llm, [stream_handler, trace_handler], project_id, user_id)
+    finally:
+        trace_handler.finish(user_input, state)
+
+def _run_task(session, user_input, summary_llm, callbacks, project_id, user_id):
+    """
+    run_turn 的主体。Returns: 最后一步的状态（DONE / CONTINUE / None）。
+    """
+    agent_executor, history = session.executor, session.history
+    max_auto_steps = 30
+    '''
+    最大自动执行步数，防止无限循环。
+    '''
+    auto_input, template = _maybe_apply_template(user_input, project_id, user_id, session)
+    if template is not None:
+        # 带 script 的模板先直接回放，只有某一步未通过校验时才交给模型从该步继续
+        replayed, fallback_input = _maybe_replay_template(template, user_input, session, callbacks)
+        if replayed:
+            return "DONE"
+        auto_input = fallback_input or auto_input
+    # 本轮各次 LLM 调用的 prompt token 中命中提供方前缀缓存的比例
+    usage_handler = TokenUsageCallbackHandler()
+    # 工具较多时只绑定核心工具与本轮检索出的相关工具（TOOL_RETRIEVAL_TOP_K）
+    agent_executor.bind_tools_for(auto_input)
+    state = None
+    for step in range(max_auto_steps):
+        history.maybe_compact()
+        response = agent_executor.invoke({
+            "input": auto_input,
+            "chat_history": history.messages()
+        }, config={"callbacks": callbacks + [usage_handler]})
+
+        output = response.get("output", "")
+        output, reload_requested = strip_reload_signal(output)
+        state, cleaned_output = parse_state(output)
+        say(f"Agent: {cleaned_output}\n")
+        event_bus.state(state, step=step)
+        history.extend([
+            ("user", auto_input),
+            ("assistant", output)
+        ])
+        event_bus.metric("history_tokens", history.total_tokens)
+        event_bus.metric("prompt_cache", usage_handler.usage.snapshot())
+        if reload_requested:
+            try:
+                refresh_agent_executor(agent_executor)
+                # 其他会话在下一轮开始时同步新的工具列表
+                session_manager.skills_reloaded(session)
+                say("Agent: 已重载技能\n")
+                # 主动发起一轮对话，告知 Agent 技能已重载，让其决定下一步
+                auto_input = "系统消息：技能热加载已完成。请确认新技能是否可用继续执行上一步未完成的任务。"
+                continue # 跳过后续的状态检查，直接进入下一轮循环（使用新的 auto_input）
+            except Exception as e:
+                say(f"Agent: 技能重载失败: {e}\n")
+
+        if state == "DONE":
+            # 认知总结在后台生成并进入待确认队列，不阻塞下一条指令
+            cognition_pipeline.submit(
+                history.messages(), summary_llm, project_id, user_id,
+                clean=lambda text: strip_reload_signal(text)[0],
+            )
+            break
+        if state != "CONTINUE":
+            break
+        auto_input = "继续执行，基于当前屏幕状态完成任务。"
+        if step == max_auto_steps - 1:
+            say("Agent: 已达到自动执行步数上限。\n")
+            break
+    return state
+
+def setup_logging():
+    """
+    stdout 保持原样；面向用户的输出经 say() 同时写控制台与事件总线，
+    诊断信息（技能加载、经验库、摘要等）走 logging：INFO 及以上输出到控制台并转为日志事件推送到 Web「日志」页。
+    """
+    handler = EventLogHandler(event_bus)
+    root = logging.getLogger()
+    root.setLevel(handler.level)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    root.addHandler(console)
+    root.addHandler(handler)
+    # 每个 HTTP 请求一条的 INFO 日志只在排查时需要
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
 def main():
+    setup_logging()
     enable_dpi_awareness()
     
     # Start Web Server in a daemon thread
-    web_thread = threading.Thread(target=start_web_server, daemon=True)
-    web_thread.start()
-    
-    # Redirect stdout to capture agent output
-    sys.stdout = DualOutput(sys.stdout)
+    with profiler.phase("web_server_thread"):
+        web_thread = threading.Thread(target=start_web_server, daemon=True)
+        web_thread.start()
+        if profiler.enabled:
+            # 仅在性能分析模式下等待服务就绪，以便统计真实启动耗时
+            shared.web_ready.wait(timeout=15)
     
+    # 后台预热嵌入模型与经验库，避免首次检索阻塞用户回合
+    memory_service.warm_up()
+    # 可选：按 MEMORY_COMPACTION_INTERVAL_HOURS 周期性压缩经验库（默认关闭）
+    compaction_job.schedule(float(os.getenv("MEMORY_COMPACTION_INTERVAL_HOURS") or 0))
+
     # Start Console Reader
     input_thread = threading.Thread(target=console_reader, daemon=True)
     input_thread.start()
 
-    print("正在初始化 Agent...")
+    say("正在初始化 Agent...", role="system")
     try:
-        agent_executor = create_agent_executor()
-        summary_llm = create_llm()
+        with profiler.phase("create_summary_llm"):
+            summary_llm = create_llm()
+        # token / 工具事件发布到事件总线，批量实时推送到 Web 控制台，不必等整轮 invoke 返回
+        stream_handler = EventBusCallbackHandler(event_bus)
+        # 每个会话独立的 executor 与历史；历史按 token 预算（HISTORY_TOKEN_BUDGET）管理，超出时在后台摘要最旧的一段
+        session_manager.start(
+            lambda session, text: run_turn(session, text, summary_llm, stream_handler),
+            history_factory=lambda: HistoryManager(summary_llm, clean_assistant=lambda text: strip_reload_signal(text)[0]),
+            executor_factory=create_agent_executor,
+        )
+        with profiler.phase("create_agent_executor"):
+            session_manager.prepare(session_manager.get(DEFAULT_SESSION_ID))
     except Exception as e:
-        print(f"初始化失败: {e}")
+        say(f"初始化失败: {e}", role="system")
         return
 
-    print("\n✅ Agent 已就绪！")
-    print("输入 'exit' 或 'quit' 退出。")
-    print("也可以通过 Web 控制台发送指令。\n")
+    if profiler.enabled:
+        profiler.finish()
+        report_path = profiler.write_report()
+        logger.info(f"启动性能报告已写入: {report_path}（Web: /api/metrics/startup）")
 
-    chat_history = []
-    max_auto_steps = 30
-    '''
-    最大自动执行步数，防止无限循环。
-    '''
+    say("\n✅ Agent 已就绪！\n输入 'exit' 或 'quit' 退出。\n也可以通过 Web 控制台发送指令。\n", role="system")
 
+    # 主线程只负责分发输入：各会话的对话在工作线程池中并发执行（AGENT_MAX_CONCURRENCY）
     while True:
         try:
-            # Print prompt (optional, visual cue)
-            print("User: ", end="", flush=True)
-            
             # Wait for input from either Console or Web
-            user_input = shared.get_input()
+            session_id, user_input = shared.get_input()
             user_input = user_input.strip()
             
             if user_input.startswith(SET_MODEL_PREFIX):
                 provider = user_input[len(SET_MODEL_PREFIX):].strip().lower()
-                previous_provider = os.getenv("LLM_PROVIDER", "deepseek")
-                os.environ["LLM_PROVIDER"] = provider
                 try:
-                    agent_executor = create_agent_executor()
-                    chat_history = []
-                    print(f">>> 系统: 已切换模型为 {provider}\n")
+                    session_manager.set_model(provider)
+                    say(f">>> 系统: 已切换模型为 {provider}\n", role="system")
                 except Exception as e:
-                    os.environ["LLM_PROVIDER"] = previous_provider
-                    try:
-                        agent_executor = create_agent_executor()
-                    except Exception:
-                        pass
-                    print(f">>> 系统: 切换模型失败: {e}\n")
+                    say(f">>> 系统: 切换模型失败: {e}\n", role="system")
                 continue
 
-            if user_input.lower() in ["exit", "quit"]:
+            if user_input.lower() in ["exit", "quit"] and session_id == DEFAULT_SESSION_ID:
                 print("Bye!")
+                session_manager.shutdown()
                 break
-            
+
             if not user_input:
                 continue
 
-            project_id = _extract_project_id()
-            user_id = os.getenv("LOCAL_USER_ID", "local_user")
-            auto_input = _maybe_apply_template(user_input, project_id, user_id)
-            for step in range(max_auto_steps):
-                chat_history = maybe_summarize_history(chat_history, summary_llm, max_turns=20)
-                response = agent_executor.invoke({
-                    "input": auto_input,
-                    "chat_history": chat_history
-                })
-
-                output = response.get("output", "")
-                output, reload_requested = strip_reload_signal(output)
-                state, cleaned_output = parse_state(output)
-                print(f"Agent: {cleaned_output}\n")
-                chat_history.extend([
-                    ("user", auto_input),
-                    ("assistant", output)
-                ])
-                if reload_requested:
-                    try:
-                        agent_executor = create_agent_executor()
-                        summary_llm = create_llm()
-                        print("Agent: 已重载技能\n")
-                        # 主动发起一轮对话，告知 Agent 技能已重载，让其决定下一步
-                        auto_input = "系统消息：技能热加载已完成。请确认新技能是否可用继续执行上一步未完成的任务。"
-                        continue # 跳过后续的状态检查，直接进入下一轮循环（使用新的 auto_input）
-                    except Exception as e:
-                        print(f"Agent: 技能重载失败: {e}\n")
-
-                if state == "DONE":
-                    project_id = _extract_project_id()
-                    user_id = os.getenv("LOCAL_USER_ID", "local_user")
-                    try:
-                        summary_text = _build_cognition_summary(chat_history, summary_llm, project_id, user_id)
-                        should_prompt, summary_json = _should_prompt_save(summary_text)
-                        if should_prompt:
-                            print("Agent: 已生成个人认知总结（待确认）\n")
-                            print(summary_text + "\n")
-                            print("User: 是否保存以上总结？(yes/no) ", end="", flush=True)
-                            confirm_input = shared.get_input().strip().lower()
-                            if confirm_input in ["y", "yes", "是", "保存", "好", "ok"]:
-                                try:
-                                    if summary_json is None:
-                                        summary_json = json.loads(summary_text)
-                                    saved = _save_cognition_summary(summary_json, project_id, user_id)
-                                    if saved:
-                                        print("Agent: 已保存到经验库。\n")
-                                    else:
-                                        print("Agent: 未提取到可保存的条目。\n")
-                                except Exception:
-                                    result = add_operation_experience(
-                                        system_name="personal_cognition",
-                                        content=summary_text,
-                                        tags=[f"scope:project", f"project:{project_id}", "topic:summary"],
-                                        scope="project",
-                                        project_id=project_id,
-                                        user_id=user_id,
-                                        memory_type="task"
-                                    )
-                                    print(f"Agent: 已保存摘要。{result}\n")
-                            else:
-                                print("Agent: 已放弃保存。\n")
-                    except Exception as e:
-                        print(f"Agent: 生成总结失败: {e}\n")
-                    break
-                if state != "CONTINUE":
-                    break
-                auto_input = "继续执行，基于当前屏幕状态完成任务。"
-                if step == max_auto_steps - 1:
-                    print("Agent: 已达到自动执行步数上限。\n")
-                    break
+            session_manager.submit(session_id, user_input)
 
         except KeyboardInterrupt:
             print("\nBye!")
+            session_manager.shutdown()
             break
         except Exception as e:
-            print(f"❌ 发生错误: {e}")
+            say(f"❌ 发生错误: {e}", role="system")
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,12 @@
+import logging
 import os
 import sys
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from web.backend.routers import config, logs, chat
+from web.backend.routers import config, logs, chat, metrics, memory, cognition
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="LangChain Agent Web Console")
 
@@ -20,6 +23,9 @@ app.add_middleware(
 app.include_router(config.router, prefix="/api/config", tags=["config"])
 app.include_router(logs.router, prefix="/api/logs", tags=["logs"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
+app.include_router(memory.router, prefix="/api/memory", tags=["memory"])
+app.include_router(cognition.router, prefix="/api/cognition", tags=["cognition"])
 
 # Static files (Frontend)
 # Ensure the directory exists before mounting
@@ -38,7 +44,7 @@ def start():
         
     port = int(os.getenv("WEB_PORT", 5010))
     host = os.getenv("WEB_HOST", "0.0.0.0")
-    print(f"Starting Web Console at http://{host}:{port}")
+    logger.info(f"Starting Web Console at http://{host}:{port}")
     
     # Use Config and Server to control signal handlers
     config = uvicorn.Config(app, host=host, port=port, access_log=False, log_level="warning")
@@ -1,48 +1,32 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
 from pydantic import BaseModel
 from ..shared import shared
+from ..streaming import EventStreamManager
+from app.context import normalize_session_id
+from app.events import event_bus
+from app.runtime import session_manager
+from app.task_store import task_store
 import asyncio
 import os
 from dotenv import dotenv_values, set_key
-from typing import List
+from typing import Optional
 
 router = APIRouter()
 
 class ChatMessage(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
 class ModelSelect(BaseModel):
     provider: str
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                self.disconnect(connection)
-
-manager = ConnectionManager()
-
-# Hook up shared broadcast
-async def broadcast_wrapper(message: str):
-    await manager.broadcast(message)
-
-shared.broadcast_func = broadcast_wrapper
+# 每个连接独立的有界发送队列，支持 ?since=<seq> 断点续传
+manager = EventStreamManager()
 
 @router.on_event("startup")
 async def startup_event():
+    event_bus.subscribe(manager.send_events)
+    event_bus.start()
     shared.set_loop(asyncio.get_running_loop())
 
 @router.post("/send")
@@ -51,9 +35,27 @@ async def send_message(chat: ChatMessage):
     if not chat.message:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
-    shared.put_input(chat.message)
+    shared.put_input(chat.message, chat.session_id)
     # Echo back to chat history (optional, or handle in frontend)
-    return {"status": "sent"}
+    return {"status": "sent", "session_id": normalize_session_id(chat.session_id)}
+
+@router.get("/sessions")
+async def list_sessions():
+    """Agent sessions, their queue depth and the worker-pool limit"""
+    return session_manager.stats()
+
+@router.get("/plans")
+async def list_plans(session: Optional[str] = None, limit: int = 20):
+    """Recent task plans (optionally for one session) with step counts and durations"""
+    return await asyncio.to_thread(task_store.history, normalize_session_id(session) if session else None, limit)
+
+@router.get("/plans/{plan_id}")
+async def get_plan(plan_id: int):
+    """One task plan with per-step results and timing"""
+    plan = await asyncio.to_thread(task_store.get_plan, plan_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return plan
 
 def _get_env_path():
     base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -95,9 +97,17 @@ async def set_model(selection: ModelSelect):
     shared.put_input(f"__SET_MODEL__:{provider}")
     return {"status": "switching", "provider": provider}
 
+@router.post("/models/evict")
+async def evict_models(provider: Optional[str] = None):
+    """Drop cached LLM clients (resident local models, pooled HTTP client); sessions rebuild on their next turn"""
+    evicted = await asyncio.to_thread(session_manager.evict_llms, provider)
+    return {"status": "evicted", "count": evicted}
+
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None, session: Optional[str] = None):
+    # 指定 session 时只推送该会话的事件，经此连接发送的输入也进入该会话
+    session_id = normalize_session_id(session) if session else None
+    conn = await manager.connect(websocket, since, session_id)
     try:
         while True:
             # We don't necessarily expect input from WS, but keep it open
@@ -105,6 +115,8 @@ async def websocket_endpoint(websocket: WebSocket):
             # Let's support WS input too for convenience.
             data = await websocket.receive_text()
             if data:
-                shared.put_input(data)
+                shared.put_input(data, session_id)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(conn)
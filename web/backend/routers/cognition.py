@@ -0,0 +1,26 @@
+from typing import List, Optional
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from app.cognition import cognition_pipeline
+
+router = APIRouter()
+
+class SummarySelection(BaseModel):
+    # None 表示全部待确认条目
+    ids: Optional[List[str]] = None
+
+@router.get("/pending")
+async def list_pending_summaries():
+    """Cognition summaries waiting for confirmation"""
+    return {"pending": cognition_pipeline.list_pending(), "in_flight": cognition_pipeline.in_flight}
+
+@router.post("/accept")
+async def accept_summaries(req: SummarySelection):
+    """Save the selected (or all) pending summaries to the experience store"""
+    return await run_in_threadpool(cognition_pipeline.accept, req.ids)
+
+@router.post("/reject")
+async def reject_summaries(req: SummarySelection):
+    """Discard the selected (or all) pending summaries"""
+    return cognition_pipeline.reject(req.ids)
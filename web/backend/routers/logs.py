@@ -1,37 +1,25 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-import asyncio
-from typing import List
+from typing import Optional
+from app.events import event_bus
+from ..streaming import EventStreamManager
 
 router = APIRouter()
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# 每个连接独立的有界发送队列，支持 ?since=<seq> 断点续传
+manager = EventStreamManager()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
+@router.on_event("startup")
+async def startup_event():
+    event_bus.subscribe(manager.send_events)
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None):
+    conn = await manager.connect(websocket, since)
     try:
         while True:
             # Keep connection alive, maybe receive commands
-            data = await websocket.receive_text()
-            # Echo or process commands (optional)
+            await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-
-# Helper function to push logs from other parts of the app
-async def push_log(message: str):
-    await manager.broadcast(message)
+        pass
+    finally:
+        manager.disconnect(conn)
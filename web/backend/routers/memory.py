@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from app.memory.compaction import compaction_job
+
+router = APIRouter()
+
+class CompactionRequest(BaseModel):
+    dry_run: bool = True
+
+@router.get("/compaction")
+async def get_compaction_status():
+    """Status of the experience-store compaction job and its last report"""
+    return compaction_job.snapshot()
+
+@router.post("/compaction")
+async def start_compaction(req: CompactionRequest):
+    """Start a background compaction run (dry_run only writes the report)"""
+    if not compaction_job.start(dry_run=req.dry_run):
+        raise HTTPException(status_code=409, detail="Compaction already running")
+    return {"status": "started", "dry_run": req.dry_run}
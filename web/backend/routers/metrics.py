@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException
+from app.profiling import profiler, load_startup_report
+from app.memory import memory_service
+from app.events import event_bus
+from app.agent import llm_cache_stats
+from app.skills.tool_cache import tool_result_cache
+from app.callbacks import token_usage_totals
+from app.prompts import PROMPT_VERSION
+from . import chat, logs
+
+router = APIRouter()
+
+@router.get("")
+async def get_metrics():
+    """Runtime counters shown on the console's metrics tab"""
+    return {
+        "memory_cache": memory_service.cache_stats(),
+        "embedding": memory_service.embedding_info(),
+        "event_bus": event_bus.stats(),
+        "websocket": {"chat": chat.manager.stats(), "logs": logs.manager.stats()},
+        "llm_cache": llm_cache_stats(),
+        "tool_cache": tool_result_cache.stats(),
+        "token_usage": dict(token_usage_totals.snapshot(), prompt_version=PROMPT_VERSION),
+    }
+
+@router.get("/memory")
+async def get_memory_metrics():
+    """Experience-store query cache hit/miss counters"""
+    return memory_service.cache_stats()
+
+@router.get("/startup")
+async def get_startup_profile():
+    """Startup phase timings recorded by `python main.py --profile-startup`"""
+    if profiler.enabled:
+        return profiler.report()
+    report = load_startup_report()
+    if report is None:
+        raise HTTPException(status_code=404, detail="No startup profile. Run main.py with --profile-startup")
+    return report
@@ -1,30 +1,31 @@
 import queue
 import asyncio
-from typing import Callable, Optional
+import threading
+from typing import Optional
+from app.context import normalize_session_id
+from app.events import event_bus
 
 class SharedState:
     def __init__(self):
         self.input_queue = queue.Queue()
-        self.broadcast_func: Optional[Callable[[str], None]] = None
         self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.web_ready = threading.Event()
 
-    def put_input(self, text: str):
-        self.input_queue.put(text)
+    def put_input(self, text: str, session_id: Optional[str] = None):
+        """Queue user input for the agent runtime; session_id=None routes to the default (console) session"""
+        self.input_queue.put((normalize_session_id(session_id), text))
     
     def get_input(self, block=True, timeout=None):
+        """Returns (session_id, text)"""
         return self.input_queue.get(block=block, timeout=timeout)
 
     def set_loop(self, loop):
         self.loop = loop
+        self.web_ready.set()
 
     def broadcast_threadsafe(self, message: str):
-        """Call this from non-async threads (like main agent loop)"""
-        if self.loop and self.broadcast_func:
-            try:
-                if self.loop.is_running():
-                    asyncio.run_coroutine_threadsafe(self.broadcast_func(message), self.loop)
-            except Exception as e:
-                print(f"Broadcast error: {e}")
+        """Call this from non-async threads (like main agent loop); batched by the event bus"""
+        event_bus.message(message)
 
 # Global instance
 shared = SharedState()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from app.events import event_bus
+
+class _Connection:
+    """
+    单个 WebSocket 的有界发送队列：队满时丢弃最旧的一批，写协程独立发送，慢连接不影响其他连接。
+    """
+    def __init__(self, websocket: WebSocket, max_queue: int, session: Optional[str] = None):
+        self.websocket = websocket
+        self.session = session
+        self.queue: Deque[List[Dict[str, Any]]] = deque()
+        self.max_queue = max_queue
+        self.wakeup = asyncio.Event()
+        self.last_seq = 0
+        self.dropped = 0
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        # 未指定会话的连接接收全部事件；否则只接收本会话与不属于任何会话的事件
+        return self.session is None or event.get("session") in (None, self.session)
+
+    def offer(self, events: List[Dict[str, Any]]):
+        if self.closed:
+            return
+        if len(self.queue) >= self.max_queue:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(events)
+        self.wakeup.set()
+
+class EventStreamManager:
+    """
+    事件总线到 WebSocket 的扇出：每个连接一个有界队列与写协程，支持按 seq 断点续传。
+
+    客户端连接时可带 ?since=<seq>：先回放回放缓冲中 seq 更大的事件，再接收实时事件；
+    不带 since 时回放全部缓冲，让后连上的客户端也能看到最近的历史。
+    指定 session 的连接只收到该会话的事件（以及不属于任何会话的系统事件）。
+    """
+    def __init__(self, max_queue: Optional[int] = None, send_timeout: Optional[float] = None):
+        self.max_queue = int(max_queue or os.getenv("EVENT_CLIENT_QUEUE") or 256)
+        self.send_timeout = float(send_timeout or os.getenv("EVENT_SEND_TIMEOUT") or 10)
+        self.connections: List[_Connection] = []
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return [conn.websocket for conn in self.connections]
+
+    async def connect(self, websocket: WebSocket, since: Optional[int] = None, session: Optional[str] = None) -> _Connection:
+        await websocket.accept()
+        conn = _Connection(websocket, self.max_queue, session)
+        # 先登记再取回放：回放期间到达的实时批次先在队列中等待，重叠部分由 last_seq 过滤
+        self.connections.append(conn)
+        events, gap = event_bus.replay(since)
+        if since is not None:
+            conn.last_seq = since
+        # 回放发送完成后再启动写协程，保证同一连接上的帧按序发送
+        try:
+            await self._send(conn, events, replay=True, gap=gap, force=True)
+        except Exception:
+            # 回放发送失败（超时或连接已断开）时注销连接，否则它没有写协程却一直留在扇出列表中
+            self.disconnect(conn)
+            raise
+        conn.task = asyncio.create_task(self._writer(conn))
+        return conn
+
+    def disconnect(self, conn: _Connection):
+        conn.closed = True
+        conn.wakeup.set()
+        if conn in self.connections:
+            self.connections.remove(conn)
+
+    async def _send(self, conn: _Connection, events: List[Dict[str, Any]], replay: bool = False, gap: bool = False, force: bool = False):
+        fresh = [e for e in events if e.get("seq", 0) > conn.last_seq and conn.accepts(e)]
+        if not fresh and not force:
+            return
+        frame = {"kind": "events", "events": fresh, "last_seq": event_bus.last_seq}
+        if replay:
+            frame["replay"] = True
+        if gap or conn.dropped:
+            frame["gap"] = True
+            conn.dropped = 0
+        await asyncio.wait_for(conn.websocket.send_text(json.dumps(frame, ensure_ascii=False)), self.send_timeout)
+        if fresh:
+            conn.last_seq = fresh[-1]["seq"]
+
+    async def _writer(self, conn: _Connection):
+        try:
+            while not conn.closed:
+                await conn.wakeup.wait()
+                conn.wakeup.clear()
+                while conn.queue and not conn.closed:
+                    await self._send(conn, conn.queue.popleft())
+        except Exception:
+            # 发送超时或连接已断开
+            self.disconnect(conn)
+            try:
+                await conn.websocket.close()
+            except Exception:
+                pass
+
+    async def send_events(self, events: List[Dict[str, Any]]):
+        """Event-bus sink: enqueue only, so fan-out never waits on a slow socket"""
+        for conn in list(self.connections):
+            conn.offer(events)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "sessions": sorted({conn.session for conn in self.connections if conn.session}),
+            "queued_batches": [len(conn.queue) for conn in self.connections],
+            "max_queue": self.max_queue,
+        }